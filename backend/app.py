@@ -1,14 +1,26 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-import pandas as pd
-import os
 from datetime import datetime
 import json
-from openpyxl import Workbook, load_workbook
+import bisect
+import os
+from storage import create_storage
+from tables import HOTEL_HEADERS, HOTEL_TABLE, ROOM_HEADERS, ROOM_TABLE, WISHLIST_TABLE, ensure_tables
+from read_cache import ReadCache
+from json_provider import FastJSONProvider, RawJSON
+from metrics import metrics_bp
+from profiler import profiler_bp
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)  # orjson when installed, NaN -> null
 CORS(app)  # Enable CORS for all routes
 
+# Opt-in per-request profiles (PROFILE_ENABLED), listed at /admin/profiles
+app.register_blueprint(profiler_bp)
+
+# Per-route latency histograms, served at /metrics
+app.register_blueprint(metrics_bp)
+
 # Register Telr webhook blueprint
 try:
     from telr_webhook import telr_webhook_bp
@@ -25,181 +37,85 @@ try:
 except ImportError:
     print("⚠️ Telr API module not found - payment API will not work")
 
-# Hotel configuration
-HOTEL_EXCEL_FILE_PATH = 'hotels.xlsx'
-HOTEL_SHEET_NAME = 'Hotels'
-HOTEL_HEADERS = ['Hotel Code', 'Name', 'Rating', 'Address', 'City ID', 'Country Code', 
-                 'Latitude', 'Longitude', 'Facilities', 'Images', 'Created At']
-
-# Room configuration
-ROOM_EXCEL_FILE_PATH = 'hotel_rooms.xlsx'
-ROOM_SHEET_NAME = 'Rooms'
-ROOM_HEADERS = ['Room ID', 'Hotel Code', 'Booking Code', 'Room Name', 'Base Price', 
-                'Total Fare', 'Currency', 'Is Refundable', 'Day Rates', 'Extras', 'Created At']
-
-# Wishlist configuration
-WISHLIST_EXCEL_FILE_PATH = 'wishlist.xlsx'
-WISHLIST_SHEET_NAME = 'Wishlist'
-WISHLIST_HEADERS = ['Wishlist ID', 'Customer ID', 'Hotel Code', 'Hotel Name', 'Hotel Rating', 
-                    'Address', 'City', 'Country', 'Price', 'Currency', 'Image URL', 'Search Params', 'Created At']
-
-def create_hotel_excel_file_if_not_exists():
-    """Create hotel Excel file with headers if it doesn't exist"""
-    if not os.path.exists(HOTEL_EXCEL_FILE_PATH):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = HOTEL_SHEET_NAME
-        
-        # Add headers
-        for col, header in enumerate(HOTEL_HEADERS, 1):
-            ws.cell(row=1, column=col, value=header)
-        
-        # Save the workbook
-        wb.save(HOTEL_EXCEL_FILE_PATH)
-        print(f"Created new hotel Excel file: {HOTEL_EXCEL_FILE_PATH}")
+# Storage backend (STORAGE_BACKEND=excel|sqlite)
+storage = create_storage()
+
+def render_records_response(records):
+    """Serialize a list response body exactly as jsonify would"""
+    return app.json.dumpb({
+        "success": True,
+        "data": records,
+        "count": len(records)
+    }) + b"\n"
+
+# Per-worker cache of parsed hotels/rooms and their serialized responses
+read_cache = ReadCache(storage, render_records_response)
+
+# Required fields for hotel and room submissions (single and bulk)
+HOTEL_REQUIRED_FIELDS = ['hotel_code', 'name', 'rating', 'address']
+ROOM_REQUIRED_FIELDS = ['room_id', 'hotel_code', 'booking_code', 'room_name']
+
+def build_hotel_row(data, timestamp=None):
+    """Convert a hotel submission into a row in HOTEL_HEADERS order"""
+    return [
+        data.get('hotel_code', ''),
+        data.get('name', ''),
+        data.get('rating', 0),
+        data.get('address', ''),
+        data.get('city_id', ''),
+        data.get('country_code', ''),
+        data.get('map_lat', 0),
+        data.get('map_lon', 0),
+        json.dumps(data.get('facilities', {})),
+        json.dumps(data.get('images', [])),
+        timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ]
+
+def build_room_row(data, timestamp=None):
+    """Convert a room submission into a row in ROOM_HEADERS order"""
+    return [
+        data.get('room_id', ''),
+        data.get('hotel_code', ''),
+        data.get('booking_code', ''),
+        data.get('room_name', ''),
+        data.get('base_price', 0),
+        data.get('total_fare', 0),
+        data.get('currency', ''),
+        data.get('is_refundable', False),
+        json.dumps(data.get('day_rates', {})),
+        json.dumps(data.get('extras', {})),
+        timestamp or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    ]
 
 def save_hotel_to_excel(data):
-    """Save hotel data to Excel file using openpyxl"""
+    """Save hotel data to the configured storage backend"""
     try:
-        # Create file if it doesn't exist
-        create_hotel_excel_file_if_not_exists()
-        
-        # Load existing workbook
-        wb = load_workbook(HOTEL_EXCEL_FILE_PATH)
-        ws = wb[HOTEL_SHEET_NAME]
-        
-        # Find the next empty row
-        next_row = ws.max_row + 1
-        
-        # Prepare data for the new row
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        row_data = [
-            data.get('hotel_code', ''),
-            data.get('name', ''),
-            data.get('rating', 0),
-            data.get('address', ''),
-            data.get('city_id', ''),
-            data.get('country_code', ''),
-            data.get('map_lat', 0),
-            data.get('map_lon', 0),
-            json.dumps(data.get('facilities', {})),
-            json.dumps(data.get('images', [])),
-            timestamp
-        ]
-        
-        # Add data to the worksheet
-        for col, value in enumerate(row_data, 1):
-            ws.cell(row=next_row, column=col, value=value)
-        
-        # Save the workbook
-        wb.save(HOTEL_EXCEL_FILE_PATH)
-        print(f"Hotel data saved to Excel: {HOTEL_EXCEL_FILE_PATH}")
+        storage.append_row(HOTEL_TABLE, build_hotel_row(data))
+        print(f"Hotel data saved: {storage.describe(HOTEL_TABLE)}")
         return True
         
     except Exception as e:
-        print(f"Error saving hotel data to Excel: {str(e)}")
+        print(f"Error saving hotel data: {str(e)}")
         return False
 
-def create_room_excel_file_if_not_exists():
-    """Create room Excel file with headers if it doesn't exist"""
-    if not os.path.exists(ROOM_EXCEL_FILE_PATH):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = ROOM_SHEET_NAME
-        
-        # Add headers
-        for col, header in enumerate(ROOM_HEADERS, 1):
-            ws.cell(row=1, column=col, value=header)
-        
-        # Save the workbook
-        wb.save(ROOM_EXCEL_FILE_PATH)
-        print(f"Created new room Excel file: {ROOM_EXCEL_FILE_PATH}")
-
 def save_room_to_excel(data):
-    """Save room data to Excel file using openpyxl"""
+    """Save room data to the configured storage backend"""
     try:
-        # Create file if it doesn't exist
-        create_room_excel_file_if_not_exists()
-        
-        # Load existing workbook
-        wb = load_workbook(ROOM_EXCEL_FILE_PATH)
-        ws = wb[ROOM_SHEET_NAME]
-        
-        # Find the next empty row
-        next_row = ws.max_row + 1
-        
-        # Prepare data for the new row
-        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        row_data = [
-            data.get('room_id', ''),
-            data.get('hotel_code', ''),
-            data.get('booking_code', ''),
-            data.get('room_name', ''),
-            data.get('base_price', 0),
-            data.get('total_fare', 0),
-            data.get('currency', ''),
-            data.get('is_refundable', False),
-            json.dumps(data.get('day_rates', {})),
-            json.dumps(data.get('extras', {})),
-            timestamp
-        ]
-        
-        # Add data to the worksheet
-        for col, value in enumerate(row_data, 1):
-            ws.cell(row=next_row, column=col, value=value)
-        
-        # Save the workbook
-        wb.save(ROOM_EXCEL_FILE_PATH)
-        print(f"Room data saved to Excel: {ROOM_EXCEL_FILE_PATH}")
+        storage.append_row(ROOM_TABLE, build_room_row(data))
+        print(f"Room data saved: {storage.describe(ROOM_TABLE)}")
         return True
         
     except Exception as e:
-        print(f"Error saving room data to Excel: {str(e)}")
+        print(f"Error saving room data: {str(e)}")
         return False
 
-def create_wishlist_excel_file_if_not_exists():
-    """Create wishlist Excel file with headers if it doesn't exist"""
-    if not os.path.exists(WISHLIST_EXCEL_FILE_PATH):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = WISHLIST_SHEET_NAME
-        
-        # Add headers
-        for col, header in enumerate(WISHLIST_HEADERS, 1):
-            ws.cell(row=1, column=col, value=header)
-        
-        # Save the workbook
-        wb.save(WISHLIST_EXCEL_FILE_PATH)
-        print(f"Created new wishlist Excel file: {WISHLIST_EXCEL_FILE_PATH}")
-
 def save_wishlist_to_excel(data):
-    """Save wishlist item to Excel file using openpyxl"""
+    """Save wishlist item to the configured storage backend"""
     try:
-        # Create file if it doesn't exist
-        create_wishlist_excel_file_if_not_exists()
-        
-        # Load existing workbook
-        wb = load_workbook(WISHLIST_EXCEL_FILE_PATH)
-        ws = wb[WISHLIST_SHEET_NAME]
-        
-        # Check if hotel already exists in wishlist for this customer
-        for row in range(2, ws.max_row + 1):
-            customer_id = ws.cell(row=row, column=2).value
-            hotel_code = ws.cell(row=row, column=3).value
-            if str(customer_id) == str(data.get('customer_id')) and str(hotel_code) == str(data.get('hotel_code')):
-                print(f"Hotel {hotel_code} already in wishlist for customer {customer_id}")
-                return True
-        
-        # Find the next empty row
-        next_row = ws.max_row + 1
-        
-        # Generate wishlist ID
-        wishlist_id = f"WL{next_row - 1:05d}"
-        
-        # Prepare data for the new row
+        # Prepare data for the new row (Wishlist ID is generated by storage)
         timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         row_data = [
-            wishlist_id,
+            None,
             data.get('customer_id', ''),
             data.get('hotel_code', ''),
             data.get('hotel_name', ''),
@@ -214,36 +130,163 @@ def save_wishlist_to_excel(data):
             timestamp
         ]
         
-        # Add data to the worksheet
-        for col, value in enumerate(row_data, 1):
-            ws.cell(row=next_row, column=col, value=value)
+        # Skip the insert if the hotel is already in this customer's wishlist
+        if not storage.insert_unique(WISHLIST_TABLE, row_data, WISHLIST_TABLE.key_columns):
+            print(f"Hotel {data.get('hotel_code')} already in wishlist for customer {data.get('customer_id')}")
+            return True
         
-        # Save the workbook
-        wb.save(WISHLIST_EXCEL_FILE_PATH)
-        print(f"Wishlist item saved to Excel: {WISHLIST_EXCEL_FILE_PATH}")
+        print(f"Wishlist item saved: {storage.describe(WISHLIST_TABLE)}")
         return True
         
     except Exception as e:
-        print(f"Error saving wishlist item to Excel: {str(e)}")
+        print(f"Error saving wishlist item: {str(e)}")
         return False
 
 def get_wishlist_by_customer(customer_id):
     """Get all wishlist items for a customer"""
     try:
-        if not os.path.exists(WISHLIST_EXCEL_FILE_PATH):
-            return []
-        
-        df = pd.read_excel(WISHLIST_EXCEL_FILE_PATH, sheet_name=WISHLIST_SHEET_NAME)
-        
-        # Filter by customer_id
-        customer_wishlist = df[df['Customer ID'].astype(str) == str(customer_id)]
-        
-        return customer_wishlist.to_dict('records')
+        return storage.find_records(WISHLIST_TABLE, {'Customer ID': customer_id})
         
     except Exception as e:
         print(f"Error retrieving wishlist: {str(e)}")
         return []
 
+# Query parameters supported by GET /hotels and GET /rooms
+# (param -> column for exact matches, param -> (column, bound) for ranges)
+HOTEL_FILTERS = {'city_id': 'City ID', 'country_code': 'Country Code', 'hotel_code': 'Hotel Code'}
+HOTEL_RANGE_FILTERS = {'min_rating': ('Rating', 'min')}
+ROOM_FILTERS = {'hotel_code': 'Hotel Code'}
+ROOM_RANGE_FILTERS = {'min_price': ('Total Fare', 'min'), 'max_price': ('Total Fare', 'max')}
+PAGING_PARAMS = ('limit', 'cursor', 'fields')
+MAX_PAGE_SIZE = 1000
+
+def query_catalog(table, filters, range_filters):
+    """
+    Answer a list request from the read cache
+    
+    Supports exact-match and range filters, fields=<comma separated
+    columns> projection and limit/cursor pagination. The cursor is the
+    position of the last returned row, so pages stay stable while new
+    rows are appended. Without any of these parameters the cached,
+    pre-serialized full response is returned as-is.
+    """
+    entry = read_cache.get(table)
+    args = request.args
+    if not any(param in args for param in (*filters, *range_filters, *PAGING_PARAMS)):
+        return jsonify(RawJSON(entry.body)), 200
+    
+    try:
+        equals = {column: args[param] for param, column in filters.items() if param in args}
+        
+        ranges = {}
+        for param, (column, bound) in range_filters.items():
+            if param in args:
+                low, high = ranges.get(column, (None, None))
+                value = float(args[param])
+                ranges[column] = (value, high) if bound == 'min' else (low, value)
+        
+        limit = int(args.get('limit', MAX_PAGE_SIZE if 'cursor' in args else 0))
+        if limit < 0:
+            raise ValueError("limit must not be negative")
+        limit = min(limit, MAX_PAGE_SIZE) if limit else None
+        cursor = int(args['cursor']) if args.get('cursor') else None
+        
+        fields = None
+        if args.get('fields'):
+            fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields if field not in table.headers]
+            if unknown:
+                raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid query parameters: {str(e)}"
+        }), 400
+    
+    positions = entry.select(equals, ranges)
+    total = len(positions)
+    if cursor is not None:
+        positions = positions[bisect.bisect_right(positions, cursor):]
+    
+    next_cursor = None
+    if limit is not None and len(positions) > limit:
+        positions = positions[:limit]
+        next_cursor = str(positions[-1])
+    
+    records = entry.records
+    if fields:
+        data = [{field: records[pos].get(field) for field in fields} for pos in positions]
+    else:
+        data = [records[pos] for pos in positions]
+    
+    return jsonify({
+        "success": True,
+        "data": data,
+        "count": len(data),
+        "total": total,
+        "next_cursor": next_cursor
+    }), 200
+
+def warm_caches():
+    """
+    Load hotels and rooms, their serialized responses and filter indexes
+    into the read cache
+
+    Called in the Gunicorn master when GUNICORN_PRELOAD is on, so workers
+    start with a warm cache instead of each building their own. Bodies and
+    index arrays stay shared copy-on-write; records are copied as read.
+    """
+    for table, filters, range_filters in ((HOTEL_TABLE, HOTEL_FILTERS, HOTEL_RANGE_FILTERS),
+                                          (ROOM_TABLE, ROOM_FILTERS, ROOM_RANGE_FILTERS)):
+        entry = read_cache.get(table)
+        for column in filters.values():
+            entry.index(column)
+        for column, _ in range_filters.values():
+            entry.sorted_index(column)
+        if table is HOTEL_TABLE:
+            entry.geo_index('Latitude', 'Longitude')
+        if table is ROOM_TABLE:
+            room_summary(entry)
+        print(f"🔥 Warmed {table.name} cache: {len(entry.records)} records, {len(entry.body)} bytes")
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def stream_catalog(table, fmt):
+    """
+    Stream every row of table as JSON or NDJSON
+    
+    Records come from storage.iter_records, with the same values as the
+    non-streamed response, and are sent in ~64KB chunks, so neither the
+    full record list nor the full body is held in memory. Rows are
+    serialized with dumpb_raw, skipping the per-call serialization metric.
+    """
+    def generate():
+        buffer = []
+        size = 0
+        count = 0
+        if fmt == 'json':
+            buffer.append(b'{"success":true,"data":[')
+        for record in storage.iter_records(table):
+            line = app.json.dumpb_raw(record)
+            if fmt == 'json':
+                line = line if count == 0 else b',' + line
+            else:
+                line += b'\n'
+            buffer.append(line)
+            size += len(line)
+            count += 1
+            if size >= STREAM_CHUNK_SIZE:
+                yield b''.join(buffer)
+                buffer = []
+                size = 0
+        if fmt == 'json':
+            buffer.append(f'],"count":{count}}}\n'.encode())
+        if buffer:
+            yield b''.join(buffer)
+    
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else app.json.mimetype
+    return app.response_class(generate(), mimetype=mimetype)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -266,8 +309,7 @@ def add_hotel():
             }), 400
         
         # Validate required fields
-        required_fields = ['hotel_code', 'name', 'rating', 'address']
-        missing_fields = [field for field in required_fields if not data.get(field)]
+        missing_fields = [field for field in HOTEL_REQUIRED_FIELDS if not data.get(field)]
         
         if missing_fields:
             return jsonify({
@@ -308,8 +350,7 @@ def add_room():
             }), 400
         
         # Validate required fields
-        required_fields = ['room_id', 'hotel_code', 'booking_code', 'room_name']
-        missing_fields = [field for field in required_fields if not data.get(field)]
+        missing_fields = [field for field in ROOM_REQUIRED_FIELDS if not data.get(field)]
         
         if missing_fields:
             return jsonify({
@@ -336,56 +377,261 @@ def add_room():
             "message": f"Server error while adding room"
         }), 500
 
+MAX_BULK_ITEMS = 50000
+
+def parse_bulk_items():
+    """
+    Read the items of a bulk request
+    
+    Accepts a JSON array or NDJSON (one object per line). Returns
+    (items, errors) where errors holds per-item parse failures.
+    """
+    body = request.get_data(as_text=True).strip()
+    if not body:
+        return [], []
+    
+    if body.startswith('['):
+        items = json.loads(body)
+        return list(enumerate(items)), []
+    
+    items = []
+    errors = []
+    for index, line in enumerate(line for line in body.splitlines() if line.strip()):
+        try:
+            items.append((index, json.loads(line)))
+        except ValueError as e:
+            errors.append({"index": index, "message": f"Invalid JSON: {str(e)}"})
+    return items, errors
+
+def bulk_ingest(table, required_fields, build_row, label):
+    """Validate every item of a bulk request and store the valid ones in one write"""
+    try:
+        items, errors = parse_bulk_items()
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "message": f"Invalid JSON: {str(e)}"
+        }), 400
+    
+    if not items and not errors:
+        return jsonify({
+            "success": False,
+            "message": "No data provided"
+        }), 400
+    
+    if len(items) + len(errors) > MAX_BULK_ITEMS:
+        return jsonify({
+            "success": False,
+            "message": f"Too many items (max {MAX_BULK_ITEMS} per request)"
+        }), 413
+    
+    # All rows in a batch share one timestamp
+    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    rows = []
+    for index, data in items:
+        if not isinstance(data, dict):
+            errors.append({"index": index, "message": "Item must be a JSON object"})
+            continue
+        missing_fields = [field for field in required_fields if not data.get(field)]
+        if missing_fields:
+            errors.append({"index": index, "message": f"Missing required fields: {', '.join(missing_fields)}"})
+            continue
+        rows.append(build_row(data, timestamp))
+    
+    errors.sort(key=lambda error: error["index"])
+    
+    if rows:
+        try:
+            storage.append_rows(table, rows)
+            print(f"Bulk saved {len(rows)} {label}: {storage.describe(table)}")
+        except Exception as e:
+            print(f"Error bulk saving {label}: {str(e)}")
+            return jsonify({
+                "success": False,
+                "message": f"Failed to save {label}",
+                "inserted": 0,
+                "failed": len(errors),
+                "errors": errors
+            }), 500
+    
+    return jsonify({
+        "success": not errors,
+        "message": f"{len(rows)} {label} added, {len(errors)} rejected",
+        "inserted": len(rows),
+        "failed": len(errors),
+        "errors": errors
+    }), 200 if rows or not errors else 400
+
+@app.route('/hotel/add-hotels', methods=['POST'])
+def add_hotels_bulk():
+    """Store many hotels (JSON array or NDJSON) in a single write"""
+    try:
+        return bulk_ingest(HOTEL_TABLE, HOTEL_REQUIRED_FIELDS, build_hotel_row, 'hotels')
+    except Exception as e:
+        print(f"Error in add_hotels_bulk endpoint: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Server error while adding hotels"
+        }), 500
+
+@app.route('/hotelRoom/add-bulk', methods=['POST'])
+def add_rooms_bulk():
+    """Store many rooms (JSON array or NDJSON) in a single write"""
+    try:
+        return bulk_ingest(ROOM_TABLE, ROOM_REQUIRED_FIELDS, build_room_row, 'rooms')
+    except Exception as e:
+        print(f"Error in add_rooms_bulk endpoint: {str(e)}")
+        return jsonify({
+            "success": False,
+            "message": "Server error while adding rooms"
+        }), 500
+
 @app.route('/hotels', methods=['GET'])
 def get_hotels():
-    """Get all hotels"""
+    """Get hotels, optionally filtered, projected and paginated"""
     try:
-        if not os.path.exists(HOTEL_EXCEL_FILE_PATH):
+        if not storage.table_exists(HOTEL_TABLE):
             return jsonify({
                 "success": True,
                 "data": [],
                 "message": "No hotels found"
             }), 200
         
-        df = pd.read_excel(HOTEL_EXCEL_FILE_PATH, sheet_name=HOTEL_SHEET_NAME)
-        hotels = df.to_dict('records')
+        stream = request.args.get('stream')
+        if stream:
+            if stream not in ('json', 'ndjson'):
+                return jsonify({
+                    "success": False,
+                    "message": "stream must be 'json' or 'ndjson'"
+                }), 400
+            return stream_catalog(HOTEL_TABLE, stream)
+        
+        return query_catalog(HOTEL_TABLE, HOTEL_FILTERS, HOTEL_RANGE_FILTERS)
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"Error retrieving hotels: {str(e)}"
+        }), 500
+
+NEARBY_DEFAULT_RADIUS_KM = 10
+NEARBY_MAX_RADIUS_KM = 20000
+NEARBY_DEFAULT_LIMIT = 50
+
+@app.route('/hotels/nearby', methods=['GET'])
+def get_nearby_hotels():
+    """Get hotels within radius km of (lat, lon), nearest first"""
+    try:
+        args = request.args
+        try:
+            lat = float(args['lat'])
+            lon = float(args['lon'])
+            radius = float(args.get('radius', NEARBY_DEFAULT_RADIUS_KM))
+            limit = int(args.get('limit', NEARBY_DEFAULT_LIMIT))
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                raise ValueError("lat must be within [-90, 90] and lon within [-180, 180]")
+            if not 0 < radius <= NEARBY_MAX_RADIUS_KM:
+                raise ValueError(f"radius must be between 0 and {NEARBY_MAX_RADIUS_KM} km")
+            if not 0 < limit <= MAX_PAGE_SIZE:
+                raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+        except KeyError as e:
+            return jsonify({
+                "success": False,
+                "message": f"Missing required query parameter: {e.args[0]}"
+            }), 400
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "message": f"Invalid query parameters: {str(e)}"
+            }), 400
+        
+        if not storage.table_exists(HOTEL_TABLE):
+            return jsonify({
+                "success": True,
+                "data": [],
+                "count": 0
+            }), 200
+        
+        entry = read_cache.get(HOTEL_TABLE)
+        matches = entry.geo_index('Latitude', 'Longitude').nearby(lat, lon, radius, limit)
+        data = [dict(entry.records[pos], distance_km=round(distance, 3)) for pos, distance in matches]
         
         return jsonify({
             "success": True,
-            "data": hotels,
-            "count": len(hotels)
+            "data": data,
+            "count": len(data)
         }), 200
         
     except Exception as e:
         return jsonify({
             "success": False,
-            "message": f"Error retrieving hotels: {str(e)}"
+            "message": f"Error retrieving nearby hotels: {str(e)}"
         }), 500
 
 @app.route('/rooms', methods=['GET'])
 def get_rooms():
-    """Get all rooms"""
+    """Get rooms, optionally filtered, projected and paginated"""
     try:
-        if not os.path.exists(ROOM_EXCEL_FILE_PATH):
+        if not storage.table_exists(ROOM_TABLE):
             return jsonify({
                 "success": True,
                 "data": [],
                 "message": "No rooms found"
             }), 200
         
-        df = pd.read_excel(ROOM_EXCEL_FILE_PATH, sheet_name=ROOM_SHEET_NAME)
-        rooms = df.to_dict('records')
+        stream = request.args.get('stream')
+        if stream:
+            if stream not in ('json', 'ndjson'):
+                return jsonify({
+                    "success": False,
+                    "message": "stream must be 'json' or 'ndjson'"
+                }), 400
+            return stream_catalog(ROOM_TABLE, stream)
+        
+        return query_catalog(ROOM_TABLE, ROOM_FILTERS, ROOM_RANGE_FILTERS)
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"Error retrieving rooms: {str(e)}"
+        }), 500
+
+def room_summary(entry):
+    """RoomSummary for a rooms cache entry, extended from the previous version"""
+    from room_summary import RoomSummary  # pandas; imported on first use
+    return entry.derived('room_summary', lambda records, previous: (
+        previous.extended(records) if previous else RoomSummary.build(records)
+    ))
+
+@app.route('/rooms/summary', methods=['GET'])
+def get_rooms_summary():
+    """Get per-hotel room price summaries (min/max/median fare, refundable rooms)"""
+    try:
+        if not storage.table_exists(ROOM_TABLE):
+            return jsonify({
+                "success": True,
+                "data": [],
+                "count": 0
+            }), 200
+        
+        hotel_codes = None
+        if request.args.get('hotel_code'):
+            hotel_codes = [code.strip() for code in request.args['hotel_code'].split(',') if code.strip()]
+        currency = request.args.get('currency') or None
+        
+        summary = room_summary(read_cache.get(ROOM_TABLE))
+        data = summary.for_hotels(hotel_codes, currency)
         
         return jsonify({
             "success": True,
-            "data": rooms,
-            "count": len(rooms)
+            "data": data,
+            "count": len(data)
         }), 200
         
     except Exception as e:
         return jsonify({
             "success": False,
-            "message": f"Error retrieving rooms: {str(e)}"
+            "message": f"Error retrieving room summary: {str(e)}"
         }), 500
 
 @app.route('/wishlist/add', methods=['POST'])
@@ -471,28 +717,19 @@ def remove_from_wishlist():
                 "message": f"Missing required fields: {', '.join(missing_fields)}"
             }), 400
         
-        # Remove from Excel
-        if not os.path.exists(WISHLIST_EXCEL_FILE_PATH):
+        # Remove from storage
+        if not storage.table_exists(WISHLIST_TABLE):
             return jsonify({
                 "success": False,
                 "message": "Wishlist file not found"
             }), 404
         
-        wb = load_workbook(WISHLIST_EXCEL_FILE_PATH)
-        ws = wb[WISHLIST_SHEET_NAME]
-        
-        # Find and delete the row
-        row_deleted = False
-        for row in range(2, ws.max_row + 1):
-            customer_id = ws.cell(row=row, column=2).value
-            hotel_code = ws.cell(row=row, column=3).value
-            if str(customer_id) == str(data.get('customer_id')) and str(hotel_code) == str(data.get('hotel_code')):
-                ws.delete_rows(row, 1)
-                row_deleted = True
-                break
+        row_deleted = storage.delete_first(WISHLIST_TABLE, {
+            'Customer ID': data.get('customer_id'),
+            'Hotel Code': data.get('hotel_code')
+        })
         
         if row_deleted:
-            wb.save(WISHLIST_EXCEL_FILE_PATH)
             print(f"Removed hotel {data.get('hotel_code')} from wishlist for customer {data.get('customer_id')}")
             return jsonify({
                 "success": True,
@@ -513,25 +750,35 @@ def remove_from_wishlist():
 
 def init_app():
     """Initialize application - called on startup (for Gunicorn)"""
-    create_hotel_excel_file_if_not_exists()
-    create_room_excel_file_if_not_exists()
-    create_wishlist_excel_file_if_not_exists()
+    # The Gunicorn master creates the files once before forking (on_starting)
+    if os.getenv('APP_TABLES_READY') != 'true':
+        ensure_tables(storage)
     
     print("✅ Hotel Booking Backend Server Initialized")
-    print(f"📁 Hotel Excel: {os.path.abspath(HOTEL_EXCEL_FILE_PATH)}")
-    print(f"📁 Room Excel: {os.path.abspath(ROOM_EXCEL_FILE_PATH)}")
-    print(f"📁 Wishlist Excel: {os.path.abspath(WISHLIST_EXCEL_FILE_PATH)}")
+    print(f"💾 Storage backend: {type(storage).__name__}")
+    print(f"📁 Hotels: {storage.describe(HOTEL_TABLE)}")
+    print(f"📁 Rooms: {storage.describe(ROOM_TABLE)}")
+    print(f"📁 Wishlist: {storage.describe(WISHLIST_TABLE)}")
     print("\n🌐 Available API Endpoints:")
     print("  POST /hotel/add-hotel")
     print("  POST /hotelRoom/add")
+    print("  POST /hotel/add-hotels")
+    print("  POST /hotelRoom/add-bulk")
     print("  GET /hotels")
+    print("  GET /hotels/nearby")
     print("  GET /rooms")
+    print("  GET /rooms/summary")
     print("  POST /wishlist/add")
     print("  POST /wishlist/remove")
     print("  GET /wishlist/<customer_id>")
     print("  GET /health")
+    print("  GET /metrics")
+    print("  GET /admin/profiles")
+    print("  GET /admin/profiles/<profile_id>")
     print("  POST /api/telr/create-order")
     print("  POST /api/telr/check-status")
+    print("  GET /api/telr/payment/<cart_id>")
+    print("  GET /api/telr/circuit")
     print("  POST /api/telr/webhook")
 
 # Initialize on import (Gunicorn will call this)
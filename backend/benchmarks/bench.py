@@ -0,0 +1,507 @@
+"""
+Benchmark suite for the Flask backend
+
+Builds synthetic hotels, rooms and wishlist datasets, then drives every
+route, first through the Flask test client (in-process cost only) and
+then through a real multi-worker Gunicorn. A local stub (telr_stub.py)
+stands in for the Telr gateway. Reports throughput and p50/p99 latency
+per route.
+
+Every run uses a fresh copy of the generated data in a temporary
+directory, so the repository's .xlsx files are never touched. Data is
+generated from a fixed seed, so runs are comparable.
+
+Usage (from backend/):
+    python benchmarks/bench.py                              # 1k and 10k rows, both modes
+    python benchmarks/bench.py --sizes 1000,10000,100000 --mode gunicorn --workers 4
+    python benchmarks/bench.py --only hotels,rooms --duration 2
+    python benchmarks/bench.py --output before.json
+    python benchmarks/bench.py --baseline before.json       # exit 1 on regressions
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from telr_stub import start_stub  # noqa: E402
+
+DEFAULT_SIZES = '1000,10000'
+SEED = 20240101
+
+# (latitude, longitude, city id, country code) hotels are scattered around
+CITIES = [
+    (25.2048, 55.2708, 'DXB', 'AE'),
+    (24.4539, 54.3773, 'AUH', 'AE'),
+    (51.5072, -0.1276, 'LON', 'GB'),
+    (48.8566, 2.3522, 'PAR', 'FR'),
+    (40.7128, -74.0060, 'NYC', 'US'),
+]
+
+
+def hotel_code(i):
+    return f'H{i:06d}'
+
+
+def customer_id(i):
+    return f'CUST{i:05d}'
+
+
+class Dataset:
+    """Shape of a generated dataset of size rows per table"""
+
+    def __init__(self, size):
+        self.size = size
+        self.room_hotels = max(1, size // 5)   # hotels that have rooms (~5 rooms each)
+        self.customers = max(1, size // 10)    # ~10 wishlist items per customer
+
+
+# --- Data generation (runs in a child process inside the data directory) ---
+
+def generate(size, seed=SEED):
+    """Write size hotels, rooms, wishlist items and payments with the app's own row builders"""
+    import app
+    from payment_ledger import ledger
+
+    rng = random.Random(seed)
+    dataset = Dataset(size)
+    hotels = []
+    for i in range(size):
+        lat, lon, city, country = rng.choice(CITIES)
+        hotels.append(app.build_hotel_row({
+            'hotel_code': hotel_code(i),
+            'name': f'Hotel {i}',
+            'rating': rng.randint(1, 5),
+            'address': f'{i} Bench Street',
+            'city_id': city,
+            'country_code': country,
+            'map_lat': round(lat + rng.uniform(-0.3, 0.3), 6),
+            'map_lon': round(lon + rng.uniform(-0.3, 0.3), 6),
+            'facilities': {'wifi': True, 'pool': rng.random() < 0.5},
+            'images': [f'https://img.example.com/{i}.jpg'],
+        }, timestamp='2024-01-01 00:00:00'))
+
+    rooms = []
+    for i in range(size):
+        base_price = rng.randint(50, 900)
+        rooms.append(app.build_room_row({
+            'room_id': f'R{i:06d}',
+            'hotel_code': hotel_code(rng.randrange(dataset.room_hotels)),
+            'booking_code': f'BK{i:06d}',
+            'room_name': rng.choice(['Standard', 'Deluxe', 'Suite', 'Family']),
+            'base_price': base_price,
+            'total_fare': round(base_price * rng.uniform(1.05, 1.3), 2),
+            'currency': rng.choice(['AED', 'AED', 'USD']),
+            'is_refundable': rng.random() < 0.4,
+            'day_rates': {'2024-01-01': base_price},
+            'extras': {'breakfast': rng.random() < 0.5},
+        }, timestamp='2024-01-01 00:00:00'))
+
+    wishlist = []
+    for i in range(size):
+        wishlist.append([
+            app.WISHLIST_TABLE.id_format.format(i + 1), customer_id(i % dataset.customers), hotel_code(i),
+            f'Hotel {i}', 4, f'{i} Bench Street', 'DXB', 'AE', 500, 'AED', '', '{}', '2024-01-01 00:00:00'
+        ])
+
+    app.storage.append_rows(app.HOTEL_TABLE, hotels)
+    app.storage.append_rows(app.ROOM_TABLE, rooms)
+    app.storage.append_rows(app.WISHLIST_TABLE, wishlist)
+
+    for i in range(dataset.customers):
+        ledger.record_order(f'BENCH{i}', f'STUBBENCH{i}', '100.00', 'AED')
+
+
+# --- Scenarios ---
+
+class Scenario:
+    """One route under test; path(i) and body(i) vary per request number i"""
+
+    def __init__(self, name, method, path, body=None, group='read'):
+        self.name = name
+        self.method = method
+        self.path = path if callable(path) else (lambda i, path=path: path)
+        self.body = body
+        self.group = group
+
+
+def scenarios(dataset, run_id):
+    """Every route, reads before writes so writes don't skew the read numbers"""
+    d = dataset
+    return [
+        Scenario('health', 'GET', '/health'),
+        Scenario('hotels_full', 'GET', '/hotels'),
+        Scenario('hotels_filtered', 'GET', '/hotels?city_id=DXB&min_rating=4&limit=50'),
+        Scenario('hotels_projected', 'GET', '/hotels?fields=Hotel%20Code,Name,Rating&limit=500'),
+        Scenario('hotels_stream', 'GET', '/hotels?stream=ndjson'),
+        Scenario('hotels_nearby', 'GET', '/hotels/nearby?lat=25.2048&lon=55.2708&radius=5&limit=20'),
+        Scenario('rooms_full', 'GET', '/rooms'),
+        Scenario('rooms_by_hotel', 'GET', lambda i: f'/rooms?hotel_code={hotel_code(i % d.room_hotels)}'),
+        Scenario('rooms_summary', 'GET', lambda i: '/rooms/summary?hotel_code=' + ','.join(
+            hotel_code((i * 10 + k) % d.room_hotels) for k in range(10))),
+        Scenario('wishlist_get', 'GET', lambda i: f'/wishlist/{customer_id(i % d.customers)}'),
+        Scenario('telr_circuit', 'GET', '/api/telr/circuit'),
+        Scenario('metrics', 'GET', '/metrics'),
+
+        Scenario('telr_create_order', 'POST', '/api/telr/create-order', lambda i: {
+            'cartId': f'{run_id}C{i}', 'amount': '100.00', 'currency': 'AED', 'description': 'Benchmark',
+            'customer': {'ref': 'bench', 'email': 'bench@example.com'},
+            'returnUrls': {'authorised': 'https://example.com/ok'}
+        }, group='payment'),
+        Scenario('telr_check_status', 'POST', '/api/telr/check-status',
+                 lambda i: {'orderRef': f'STUB{run_id}K{i}'}, group='payment'),
+        Scenario('telr_payment', 'GET', lambda i: f'/api/telr/payment/BENCH{i % d.customers}', group='payment'),
+        Scenario('telr_webhook', 'POST', '/api/telr/webhook', lambda i: {'order': {
+            'ref': f'STUB{run_id}W{i}', 'cartid': f'{run_id}W{i}', 'amount': '100.00', 'currency': 'AED',
+            'status': {'code': 3, 'text': 'Paid'}, 'transaction': {'ref': f'T{run_id}W{i}'}
+        }}, group='payment'),
+
+        Scenario('hotel_add', 'POST', '/hotel/add-hotel', lambda i: {
+            'hotel_code': f'{run_id}N{i}', 'name': 'New', 'rating': 3, 'address': 'x'
+        }, group='write'),
+        Scenario('room_add', 'POST', '/hotelRoom/add', lambda i: {
+            'room_id': f'{run_id}R{i}', 'hotel_code': hotel_code(0), 'booking_code': 'b', 'room_name': 'r',
+            'total_fare': 100, 'currency': 'AED'
+        }, group='write'),
+        Scenario('hotels_bulk_100', 'POST', '/hotel/add-hotels', lambda i: [
+            {'hotel_code': f'{run_id}B{i}-{k}', 'name': 'Bulk', 'rating': 3, 'address': 'x'} for k in range(100)
+        ], group='write'),
+        Scenario('rooms_bulk_100', 'POST', '/hotelRoom/add-bulk', lambda i: [
+            {'room_id': f'{run_id}RB{i}-{k}', 'hotel_code': hotel_code(k), 'booking_code': 'b', 'room_name': 'r'}
+            for k in range(100)
+        ], group='write'),
+        Scenario('wishlist_add', 'POST', '/wishlist/add', lambda i: {
+            'customer_id': customer_id(i % d.customers), 'hotel_code': f'{run_id}X{i}'
+        }, group='write'),
+        Scenario('wishlist_remove', 'POST', '/wishlist/remove', lambda i: {
+            'customer_id': customer_id(i % d.customers), 'hotel_code': hotel_code(i % d.size)
+        }, group='write'),
+    ]
+
+
+def select(all_scenarios, only):
+    if not only:
+        return all_scenarios
+    wanted = set(only.split(','))
+    return [s for s in all_scenarios if s.name in wanted or s.group in wanted
+            or any(s.name.startswith(prefix + '_') for prefix in wanted)]
+
+
+# --- Measurement ---
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def run_scenario(make_sender, scenario, duration, max_requests, concurrency, warmup=0):
+    """
+    Send requests for scenario from concurrency threads until duration
+    seconds or max_requests requests, whichever comes first
+
+    Each thread first sends warmup unmeasured requests, so every worker
+    has loaded its caches before timing starts.
+    """
+    counter = itertools.count()
+    latencies = []
+    statuses = Counter()
+    lock = threading.Lock()
+    warm = threading.Barrier(concurrency + 1)
+    deadline = None
+
+    def loop():
+        send = make_sender()
+        for i in range(-warmup, 0):
+            try:
+                send(scenario.method, scenario.path(i), scenario.body(i) if scenario.body else None)
+            except Exception:
+                pass
+        warm.wait()
+        warm.wait()  # released once the deadline is set
+        while True:
+            i = next(counter)
+            if i >= max_requests or (i > 0 and time.perf_counter() > deadline):
+                return
+            body = scenario.body(i) if scenario.body else None
+            started = time.perf_counter()
+            try:
+                status = send(scenario.method, scenario.path(i), body)
+            except Exception as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(loop) for _ in range(concurrency)]
+        warm.wait()
+        started = time.perf_counter()
+        deadline = started + duration
+        warm.wait()
+        for future in futures:
+            future.result()
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not (isinstance(status, int) and status < 400))
+    return {
+        'scenario': scenario.name,
+        'group': scenario.group,
+        'requests': len(latencies),
+        'errors': errors,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'rps': round(len(latencies) / wall, 2) if wall else None,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3) if latencies else None,
+        'max_ms': round(latencies[-1] * 1000, 3) if latencies else None,
+    }
+
+
+def client_sender_factory():
+    """Senders using the Flask test client (import app in the data directory first)"""
+    import app
+
+    def make_sender():
+        client = app.app.test_client()
+
+        def send(method, path, body):
+            return client.open(path, method=method, json=body).status_code
+        return send
+    return make_sender
+
+
+def http_sender_factory(base_url):
+    import requests
+
+    def make_sender():
+        session = requests.Session()
+
+        def send(method, path, body):
+            return session.request(method, base_url + path, json=body, timeout=120).status_code
+        return send
+    return make_sender
+
+
+def run_all(make_sender, dataset, args, run_id, concurrency):
+    results = []
+    for scenario in select(scenarios(dataset, run_id), args.only):
+        result = run_scenario(make_sender, scenario, args.duration, args.max_requests, concurrency, args.warmup)
+        print(f"   {scenario.name:<20} {result['requests']:>6} req  {result['rps']:>9} req/s  "
+              f"p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms"
+              f"{'  errors ' + str(result['errors']) if result['errors'] else ''}", flush=True)
+        results.append(result)
+    return results
+
+
+# --- Orchestration ---
+
+def child_env(args, telr_url):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': BACKEND_DIR + os.pathsep + BENCH_DIR + os.pathsep + env.get('PYTHONPATH', ''),
+        'STORAGE_BACKEND': args.backend,
+        'TELR_API_URL': telr_url,
+        'TELR_USE_TEST_MODE': 'true',
+        'TELR_TEST_STORE_ID': 'bench',
+        'TELR_TEST_AUTH_KEY': 'bench',
+    })
+    return env
+
+
+def run_child(command, cwd, env):
+    """Run this script as a child in cwd, with the app's prints going to a log file"""
+    with open(os.path.join(cwd, 'bench.log'), 'a') as log:
+        subprocess.run([sys.executable, os.path.abspath(__file__)] + command,
+                       cwd=cwd, env=env, stdout=log, stderr=subprocess.STDOUT, check=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(data_dir, dataset, args, env, run_id):
+    import requests
+
+    port = free_port()
+    env = dict(env, GUNICORN_BIND=f'127.0.0.1:{port}', GUNICORN_WORKERS=str(args.workers),
+               GUNICORN_WORKER_PROFILE=args.profile)
+    with open(os.path.join(data_dir, 'gunicorn.log'), 'w') as log:
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', os.path.join(BACKEND_DIR, 'gunicorn.conf.py'), 'app:app'],
+            cwd=data_dir, env=env, stdout=log, stderr=subprocess.STDOUT
+        )
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.time() + 120
+        while True:
+            try:
+                if requests.get(base_url + '/health', timeout=1).status_code == 200:
+                    break
+            except requests.exceptions.RequestException:
+                pass
+            if server.poll() is not None or time.time() > deadline:
+                raise RuntimeError(f"Gunicorn did not start, see {data_dir}/gunicorn.log")
+            time.sleep(0.2)
+        return run_all(http_sender_factory(base_url), dataset, args, run_id, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def compare(results, baseline, tolerance):
+    """Lines describing results that regressed by more than tolerance against baseline"""
+    def key(result):
+        return (result['mode'], result['size'], result['scenario'])
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results:
+        before = previous.get(key(result))
+        if not before or not before.get('p99_ms') or not result.get('p99_ms'):
+            continue
+        if result['p99_ms'] > before['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{key(result)}: p99 {before['p99_ms']} -> {result['p99_ms']} ms")
+        if before.get('rps') and result['rps'] < before['rps'] * (1 - tolerance):
+            regressions.append(f"{key(result)}: throughput {before['rps']} -> {result['rps']} req/s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the hotel booking backend')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='comma separated rows per table')
+    parser.add_argument('--mode', choices=('client', 'gunicorn', 'both'), default='both')
+    parser.add_argument('--backend', choices=('excel', 'sqlite'), default=os.getenv('STORAGE_BACKEND', 'excel'))
+    parser.add_argument('--only', help='comma separated scenario names, prefixes or groups (read, payment, write)')
+    parser.add_argument('--duration', type=float, default=3, help='seconds per scenario')
+    parser.add_argument('--max-requests', type=int, default=2000, help='maximum requests per scenario')
+    parser.add_argument('--warmup', type=int, default=2, help='unmeasured requests per client thread first')
+    parser.add_argument('--concurrency', type=int, default=8, help='client threads in gunicorn mode')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--profile', default='gthread', help='GUNICORN_WORKER_PROFILE for gunicorn mode')
+    parser.add_argument('--telr-delay', type=float, default=0.0, help='seconds the Telr stub waits per call')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against a previous --output file')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression ratio (default 0.2)')
+    parser.add_argument('--keep', action='store_true', help='keep the generated data directories')
+    args = parser.parse_args()
+
+    stub, telr_url = start_stub(delay=args.telr_delay)
+    env = child_env(args, telr_url)
+    modes = ('client', 'gunicorn') if args.mode == 'both' else (args.mode,)
+    root = tempfile.mkdtemp(prefix='hotelrbs-bench-')
+    run_id = f'Z{int(time.time())}'
+    results = []
+
+    try:
+        for size in (int(s) for s in args.sizes.split(',')):
+            dataset = Dataset(size)
+            source = os.path.join(root, f'data-{size}')
+            os.makedirs(source)
+            print(f"📦 Generating {size} hotels, rooms and wishlist items ({args.backend})", flush=True)
+            started = time.perf_counter()
+            run_child(['_generate', '--size', str(size)], source, env)
+            print(f"   done in {time.perf_counter() - started:.1f}s", flush=True)
+
+            for mode in modes:
+                data_dir = os.path.join(root, f'{mode}-{size}')
+                shutil.copytree(source, data_dir)
+                if mode == 'client':
+                    print(f"🧪 Flask test client, {size} rows", flush=True)
+                    result_file = os.path.join(data_dir, 'results.json')
+                    run_child(['_client', '--size', str(size), '--result-file', result_file, '--run-id', run_id,
+                               '--duration', str(args.duration), '--max-requests', str(args.max_requests),
+                               '--warmup', str(args.warmup)]
+                              + (['--only', args.only] if args.only else []), data_dir, env)
+                    with open(result_file) as f:
+                        mode_results = json.load(f)
+                    for result in mode_results:
+                        print(f"   {result['scenario']:<20} {result['requests']:>6} req  {result['rps']:>9} req/s  "
+                              f"p50 {result['p50_ms']:>9} ms  p99 {result['p99_ms']:>9} ms"
+                              f"{'  errors ' + str(result['errors']) if result['errors'] else ''}")
+                else:
+                    print(f"🚀 Gunicorn ({args.workers} {args.profile} workers, {args.concurrency} clients), "
+                          f"{size} rows", flush=True)
+                    mode_results = run_gunicorn(data_dir, dataset, args, env, run_id)
+                for result in mode_results:
+                    result.update(mode=mode, size=size)
+                results.extend(mode_results)
+    finally:
+        stub.shutdown()
+        if args.keep:
+            print(f"📁 Data kept in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    report = {
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'backend': args.backend,
+        'workers': args.workers,
+        'profile': args.profile,
+        'concurrency': args.concurrency,
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+            for line in regressions:
+                print(f"   {line}")
+            return 1
+        print(f"✅ No regressions beyond {args.tolerance:.0%}")
+    return 0
+
+
+def child_main(argv):
+    """Entry point for the _generate and _client child processes"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument('command', choices=('_generate', '_client'))
+    parser.add_argument('--size', type=int, required=True)
+    parser.add_argument('--result-file')
+    parser.add_argument('--run-id', default='Z')
+    parser.add_argument('--only')
+    parser.add_argument('--duration', type=float, default=3)
+    parser.add_argument('--max-requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=2)
+    args = parser.parse_args(argv)
+
+    if args.command == '_generate':
+        generate(args.size)
+        return 0
+
+    # In-process cost only: one client thread
+    results = run_all(client_sender_factory(), Dataset(args.size), args, args.run_id, concurrency=1)
+    with open(args.result_file, 'w') as f:
+        json.dump(results, f)
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1].startswith('_'):
+        raise SystemExit(child_main(sys.argv[1:]))
+    raise SystemExit(main())
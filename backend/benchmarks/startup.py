@@ -0,0 +1,173 @@
+"""
+Worker startup benchmark
+
+Measures what a Gunicorn worker pays before it can serve requests, each
+in fresh processes, repeated and reported as median/min/max:
+
+- cold: a new interpreter imports app, then serves /health and /hotels
+- eager: the same, with pandas and openpyxl imported up front, as every
+  worker did before they were imported lazily
+- recycled: a parent imports GUNICORN_PREIMPORT and forks, like the
+  Gunicorn master, and the child imports app. This is what a worker
+  recycled after max_requests pays
+
+Runs in a temporary copy of the backend's .xlsx files, so nothing in
+backend/ is modified.
+
+Usage (from backend/):
+    python benchmarks/startup.py
+    python benchmarks/startup.py --repeat 10 --backend sqlite
+    python benchmarks/startup.py --importtime 15     # slowest modules in `import app`
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+DEFAULT_PREIMPORT = 'flask,pandas,openpyxl'
+HEAVY_MODULES = ('pandas', 'openpyxl', 'numpy', 'requests')
+
+
+def measure_worker(eager=False):
+    """Import app and serve two requests; returns timings in ms"""
+    started = time.perf_counter()
+    if eager:
+        import pandas  # noqa: F401
+        import openpyxl  # noqa: F401
+    import app
+    imported = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    client = app.app.test_client()
+    client.get('/health')
+    health = time.perf_counter()
+    client.get('/hotels')
+    hotels = time.perf_counter()
+    return {
+        'import_ms': (imported - started) * 1000,
+        'health_ms': (health - imported) * 1000,
+        'hotels_ms': (hotels - health) * 1000,
+        'ready_ms': (hotels - started) * 1000,
+        'loaded_after_import': loaded,
+    }
+
+
+def child_main(mode, preimport):
+    """Run one measurement and print it as JSON on the last line"""
+    if mode == 'recycled':
+        for name in preimport:
+            __import__(name)
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            result = measure_worker()
+            os.write(write_fd, json.dumps(result).encode())
+            os._exit(0)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            result = json.loads(pipe.read())
+        os.waitpid(pid, 0)
+    else:
+        result = measure_worker(eager=mode == 'eager')
+    sys.stdout.write('\n' + json.dumps(result) + '\n')
+
+
+def data_copy():
+    """Temporary directory holding a copy of the backend's .xlsx files"""
+    data_dir = tempfile.mkdtemp(prefix='hotelrbs-startup-')
+    for path in glob.glob(os.path.join(BACKEND_DIR, '*.xlsx')):
+        shutil.copy(path, data_dir)
+    return data_dir
+
+
+def run(mode, args, env):
+    data_dir = data_copy()
+    try:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '_child', mode, '--preimport', args.preimport],
+            cwd=data_dir, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def show_importtime(env, limit):
+    data_dir = data_copy()
+    try:
+        stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'],
+                                cwd=data_dir, env=env, capture_output=True, text=True).stderr
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    rows = []
+    for line in stderr.splitlines():
+        if line.startswith('import time:'):
+            own, cumulative, name = line[len('import time:'):].split('|')
+            if own.strip().isdigit():  # skip the header line
+                rows.append((int(cumulative), name.strip()))
+    print("\n🐢 Slowest imports under `import app` (cumulative ms):")
+    for cumulative, name in sorted(rows, reverse=True)[:limit]:
+        print(f"   {cumulative / 1000:>8.1f}  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure worker startup cost')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--backend', choices=('excel', 'sqlite'), default=os.getenv('STORAGE_BACKEND', 'excel'))
+    parser.add_argument('--preimport', default=os.getenv('GUNICORN_PREIMPORT', DEFAULT_PREIMPORT),
+                        help='modules the simulated master imports before forking')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='also list the N slowest modules imported by `import app`')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR + os.pathsep + os.environ.get('PYTHONPATH', ''),
+               STORAGE_BACKEND=args.backend)
+    modes = {
+        'cold': 'new interpreter',
+        'eager': 'new interpreter, pandas + openpyxl imported up front',
+        'recycled': f'forked after preimporting {args.preimport or "nothing"}',
+    }
+    report = {}
+    print(f"⏱️  Worker startup, {args.repeat} runs each ({args.backend})")
+    print(f"   {'mode':<10} {'import app':>11} {'/health':>9} {'/hotels':>9} {'ready':>9}   (median ms)")
+    for mode, description in modes.items():
+        runs = [run(mode, args, env) for _ in range(args.repeat)]
+        summary = {key: {'median': round(statistics.median(r[key] for r in runs), 1),
+                         'min': round(min(r[key] for r in runs), 1),
+                         'max': round(max(r[key] for r in runs), 1)}
+                   for key in ('import_ms', 'health_ms', 'hotels_ms', 'ready_ms')}
+        summary['description'] = description
+        summary['loaded_after_import'] = runs[0]['loaded_after_import']
+        report[mode] = summary
+        print(f"   {mode:<10} {summary['import_ms']['median']:>11} {summary['health_ms']['median']:>9} "
+              f"{summary['hotels_ms']['median']:>9} {summary['ready_ms']['median']:>9}   {description}")
+    print(f"   loaded by `import app` alone: {', '.join(report['cold']['loaded_after_import']) or 'none'}")
+
+    if args.importtime:
+        show_importtime(env, args.importtime)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '_child':
+        child_args = argparse.ArgumentParser()
+        child_args.add_argument('mode')
+        child_args.add_argument('--preimport', default='')
+        parsed = child_args.parse_args(sys.argv[2:])
+        child_main(parsed.mode, [name for name in parsed.preimport.split(',') if name])
+        raise SystemExit(0)
+    raise SystemExit(main())
@@ -0,0 +1,80 @@
+"""
+Local stand-in for the Telr gateway, for benchmarks
+
+Answers 'create' and 'check' requests on /gateway/order.json with
+well-formed Telr responses after an optional fixed delay, so payment
+routes can be benchmarked without network access or credentials.
+
+    python benchmarks/telr_stub.py --port 8099 --delay 0.05
+    TELR_API_URL=http://127.0.0.1:8099/gateway/order.json gunicorn ...
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TelrStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+    disable_nagle_algorithm = True  # headers and body are separate writes
+    delay = 0.0
+    status_code = 3  # order status returned by 'check' (3 = paid)
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        if self.delay:
+            time.sleep(self.delay)
+
+        order = body.get('order') or {}
+        if body.get('method') == 'create':
+            cart_id = order.get('cartid')
+            response = {'method': 'create', 'order': {
+                'ref': f'STUB{cart_id}',
+                'url': f'https://secure.telr.com/gateway/process.html?o=STUB{cart_id}'
+            }}
+        else:
+            ref = order.get('ref')
+            response = {'method': 'check', 'order': {
+                'ref': ref,
+                'cartid': ref[4:] if ref and ref.startswith('STUB') else ref,
+                'amount': '100.00',
+                'currency': 'AED',
+                'status': {'code': self.status_code, 'text': 'Paid'},
+                'transaction': {'ref': f'T{ref}'}
+            }}
+
+        out = json.dumps(response).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+
+def start_stub(host='127.0.0.1', port=0, delay=0.0):
+    """Start the stub in a background thread; returns (server, order.json URL)"""
+    handler = type('Handler', (TelrStubHandler,), {'delay': delay})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}/gateway/order.json'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local Telr gateway stub')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--delay', type=float, default=0.0, help='seconds to wait before each response')
+    args = parser.parse_args()
+    server, url = start_stub(args.host, args.port, args.delay)
+    print(f"🧪 Telr stub listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,141 @@
+"""
+Grid index for hotel proximity search
+
+Hotels are bucketed into GEO_CELL_DEGREES x GEO_CELL_DEGREES cells by
+their Latitude/Longitude. A radius query only visits the cells that
+overlap the search circle's bounding box, then computes exact haversine
+distances for those candidates in one vectorized numpy pass.
+
+Coordinates live in flat array('d') buffers that numpy reads without
+copying. When storage shows hotels were only appended since the last
+build (see read_cache.CacheEntry.derived), extended() builds the index for
+the grown table from the previous one by indexing just the new rows.
+Rows without usable coordinates (blank, non-numeric or the 0/0 default
+written when a hotel is saved without a location) are left out.
+"""
+
+import math
+import os
+from array import array
+
+import numpy as np
+
+GEO_CELL_DEGREES = float(os.getenv('GEO_CELL_DEGREES', '0.1'))  # ~11 km north-south
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _coordinate(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+class GeoIndex:
+    """Cell grid over (latitude, longitude) of a list of records"""
+
+    def __init__(self, lat_column, lon_column, cell_degrees=GEO_CELL_DEGREES):
+        self.lat_column = lat_column
+        self.lon_column = lon_column
+        self.cell_degrees = cell_degrees
+        self.size = 0          # number of records indexed (with or without coordinates)
+        self.lats = array('d')
+        self.lons = array('d')
+        self.positions = array('q')
+        self.cells = {}        # (lat cell, lon cell) -> array of offsets into lats/lons
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_degrees), self._lon_cell(math.floor(lon / self.cell_degrees)))
+
+    def _lon_cell(self, cell):
+        """Wrap a longitude cell number around the antimeridian"""
+        first = math.floor(-180.0 / self.cell_degrees)
+        count = round(360.0 / self.cell_degrees)
+        return (cell - first) % count + first
+
+    def _add(self, records, start, copied):
+        for position in range(start, len(records)):
+            record = records[position]
+            lat = _coordinate(record.get(self.lat_column))
+            lon = _coordinate(record.get(self.lon_column))
+            if lat is None or lon is None or (lat == 0 and lon == 0):
+                continue
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                continue
+            key = self._cell(lat, lon)
+            cell = self.cells.get(key)
+            if key not in copied:
+                # Cells shared with the previous index are copied before
+                # the first append, so readers of that index are unaffected
+                cell = self.cells[key] = array('q', cell or ())
+                copied.add(key)
+            cell.append(len(self.lats))
+            self.lats.append(lat)
+            self.lons.append(lon)
+            self.positions.append(position)
+        self.size = len(records)
+
+    @classmethod
+    def build(cls, records, lat_column, lon_column):
+        index = cls(lat_column, lon_column)
+        index._add(records, 0, set())
+        return index
+
+    def extended(self, records):
+        """
+        Index for records, which must be this index's records with rows appended
+
+        Returns a new GeoIndex; this one is left untouched.
+        """
+        if len(records) < self.size:
+            return GeoIndex.build(records, self.lat_column, self.lon_column)
+        index = GeoIndex(self.lat_column, self.lon_column, self.cell_degrees)
+        index.lats = array('d', self.lats)
+        index.lons = array('d', self.lons)
+        index.positions = array('q', self.positions)
+        index.cells = dict(self.cells)
+        index._add(records, self.size, set())
+        return index
+
+    def _candidates(self, lat, lon, radius_km):
+        """Offsets of points in cells overlapping the circle's bounding box"""
+        lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+        cos_lat = math.cos(math.radians(min(89.9, abs(lat) + lat_delta)))
+        lon_delta = 180.0 if lat_delta >= 90 else min(180.0, lat_delta / cos_lat)
+
+        lat_cells = range(math.floor(max(-90.0, lat - lat_delta) / self.cell_degrees),
+                          math.floor(min(90.0, lat + lat_delta) / self.cell_degrees) + 1)
+        lon_cells = {self._lon_cell(cell) for cell in
+                     range(math.floor((lon - lon_delta) / self.cell_degrees),
+                           math.floor((lon + lon_delta) / self.cell_degrees) + 1)}
+
+        if len(lat_cells) * len(lon_cells) > len(self.cells):
+            # Huge radius: cheaper to test every point
+            return np.arange(len(self.lats))
+        found = [self.cells[(i, j)] for i in lat_cells for j in lon_cells if (i, j) in self.cells]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.frombuffer(cell, dtype=np.int64) for cell in found])
+
+    def nearby(self, lat, lon, radius_km, limit=None):
+        """[(record position, distance in km)] within radius_km, nearest first"""
+        if not self.lats:
+            return []
+        offsets = self._candidates(lat, lon, radius_km)
+        if not len(offsets):
+            return []
+
+        lats = np.radians(np.frombuffer(self.lats, dtype=np.float64)[offsets])
+        lons = np.radians(np.frombuffer(self.lons, dtype=np.float64)[offsets])
+        lat0, lon0 = math.radians(lat), math.radians(lon)
+        a = (np.sin((lats - lat0) / 2) ** 2
+             + math.cos(lat0) * np.cos(lats) * np.sin((lons - lon0) / 2) ** 2)
+        distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        inside = np.nonzero(distances <= radius_km)[0]
+        if limit is not None and len(inside) > limit:
+            inside = inside[np.argpartition(distances[inside], limit - 1)[:limit]]
+        inside = inside[np.argsort(distances[inside], kind='stable')]
+        positions = np.frombuffer(self.positions, dtype=np.int64)[offsets[inside]]
+        return list(zip(positions.tolist(), distances[inside].tolist()))
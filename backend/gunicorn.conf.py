@@ -1,22 +1,89 @@
 """
 Gunicorn configuration for production deployment
 """
+import gc
+import importlib
+import importlib.util
 import multiprocessing
 import os
+import sys
+import time
 
 # Server socket
-bind = "0.0.0.0:5001"
+bind = os.getenv('GUNICORN_BIND', "0.0.0.0:5001")
 backlog = 2048
 
+# Worker profile (GUNICORN_WORKER_PROFILE=sync|gthread|gevent)
+# - sync:    one request per worker; a slow Telr call pins the worker
+# - gthread: GUNICORN_THREADS threads per worker, so outbound payment I/O
+#            runs concurrently without taking every worker slot
+# - gevent:  cooperative greenlets (needs `pip install gevent`); best for
+#            many concurrent slow upstream calls
+worker_profile = os.getenv('GUNICORN_WORKER_PROFILE', 'sync').lower()
+if worker_profile == 'gevent' and importlib.util.find_spec('gevent') is None:
+    print("⚠️  gevent is not installed - falling back to the gthread worker profile")
+    worker_profile = 'gthread'
+
 # Worker processes
-workers = multiprocessing.cpu_count() * 2 + 1  # Recommended formula
-worker_class = "sync"  # Use 'gevent' or 'eventlet' for async if needed
-worker_connections = 1000
+if worker_profile == 'sync':
+    workers = multiprocessing.cpu_count() * 2 + 1  # Recommended formula
+    worker_class = "sync"
+elif worker_profile == 'gthread':
+    workers = multiprocessing.cpu_count() + 1
+    worker_class = "gthread"
+    threads = int(os.getenv('GUNICORN_THREADS', '8'))
+elif worker_profile == 'gevent':
+    workers = multiprocessing.cpu_count() + 1
+    worker_class = "gevent"
+else:
+    raise ValueError(f"Unknown GUNICORN_WORKER_PROFILE '{worker_profile}' (expected sync, gthread or gevent)")
+workers = int(os.getenv('GUNICORN_WORKERS', workers))
+worker_connections = 1000  # Max concurrent greenlets per gevent worker
 max_requests = 1000  # Restart workers after this many requests (prevents memory leaks)
 max_requests_jitter = 50  # Add randomness to max_requests
 timeout = 30  # Worker timeout in seconds
 keepalive = 2  # Keep-alive connections
 
+# Tell the app how many requests a worker serves at once and how long it
+# may take, so the Telr bulkhead and call deadline fit the worker
+# (telr_circuit.py, telr_api.py). Workers inherit the environment.
+os.environ['GUNICORN_WORKER_CONCURRENCY'] = str(
+    threads if worker_class == 'gthread' else worker_connections if worker_class == 'gevent' else 1
+)
+os.environ['GUNICORN_TIMEOUT'] = str(timeout)
+
+# Preload (GUNICORN_PRELOAD=true): import the app once in the master and
+# warm the hotel/room cache there before forking, so recycled workers
+# (max_requests) start warm. The serialized responses and index arrays
+# stay shared copy-on-write; the record dicts are copied page by page as
+# workers read them (reference counts). Code changes then need a full
+# restart rather than a SIGHUP reload.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+# Pre-fork startup: the master creates missing storage files once, and
+# imports the heavy libraries the app itself only imports on first use
+# (GUNICORN_PREIMPORT, comma separated). Workers - including the ones
+# recycled every max_requests - fork with them already loaded instead of
+# each spending ~0.5s importing pandas and openpyxl. Upgrading one of
+# these libraries needs a full restart; app code still reloads on SIGHUP.
+preimport = [name.strip() for name in os.getenv('GUNICORN_PREIMPORT', 'flask,pandas,openpyxl').split(',')
+             if name.strip()]
+
+# The HTTP client stack must be imported after a gevent worker has run
+# monkey.patch_all(): urllib3 loaded in the master keeps the unpatched
+# SSLContext, and every HTTPS call to Telr then fails with a
+# RecursionError. The app imports requests (telr_api), so it can't be
+# preloaded under gevent either.
+GEVENT_UNSAFE_IMPORTS = ('requests', 'urllib3', 'ssl')
+if worker_class == 'gevent':
+    unsafe = [name for name in preimport if name.split('.')[0] in GEVENT_UNSAFE_IMPORTS]
+    if unsafe:
+        print(f"⚠️  Not preimporting {', '.join(unsafe)} under the gevent worker profile")
+        preimport = [name for name in preimport if name not in unsafe]
+    if preload_app:
+        print("⚠️  GUNICORN_PRELOAD is ignored under the gevent worker profile")
+        preload_app = False
+
 # Logging
 accesslog = "-"  # Log to stdout
 errorlog = "-"   # Log to stderr
@@ -43,9 +110,52 @@ limit_request_line = 4096
 limit_request_fields = 100
 limit_request_field_size = 8190
 
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _unload_app_modules():
+    """
+    Forget the app's own modules the master imported, so workers import
+    them fresh and a SIGHUP reload picks up code changes. Third-party
+    libraries stay loaded and are shared with the workers.
+    """
+    for name, module in list(sys.modules.items()):
+        path = getattr(module, '__file__', None)
+        if path and name != __name__ and os.path.dirname(os.path.abspath(path)) == APP_DIR:
+            del sys.modules[name]
+
 def on_starting(server):
     """Called just before the master process is initialized."""
     print("🚀 Starting Gunicorn server...")
+    # No background threads in the master: one holding a lock (the log
+    # queue's, the metrics registry's) while a worker is forked would
+    # leave it locked forever in that worker. post_fork starts them.
+    import log_config
+    import metrics
+    log_config.defer_listener()
+    metrics.registry.defer()
+    # Start /metrics from zero rather than summing files of a previous run
+    metrics.reset()
+
+    # Create the .xlsx files (or SQLite tables) once here rather than in every worker
+    from storage import create_storage
+    from tables import ensure_tables
+    storage = create_storage()
+    ensure_tables(storage)
+    storage.close()  # no SQLite connection may cross the fork
+    os.environ['APP_TABLES_READY'] = 'true'
+
+    started = time.perf_counter()
+    for name in preimport:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"⚠️  Could not preimport {name}: {str(e)}")
+    if preimport:
+        print(f"📚 Preimported {', '.join(preimport)} in {time.perf_counter() - started:.2f}s")
+    if worker_class == 'gevent' and 'urllib3' in sys.modules:
+        print("⚠️  urllib3 was imported before forking: HTTPS calls from gevent workers will fail")
+    if not preload_app:
+        _unload_app_modules()
 
 def on_reload(server):
     """Called to recycle workers during a reload via SIGHUP."""
@@ -56,11 +166,35 @@ def when_ready(server):
     print(f"✅ Gunicorn server ready on {bind}")
     print(f"👷 Workers: {workers}")
     print(f"⚙️  Worker class: {worker_class}")
+    if worker_class == "gthread":
+        print(f"🧵 Threads per worker: {threads}")
+    if preload_app:
+        from app import storage, warm_caches
+        warm_caches()
+        storage.close()  # as in on_starting: no SQLite connection may cross the fork
+        # Move everything loaded so far out of the collector's reach, so
+        # GC passes in the workers don't write to (and copy) shared pages
+        gc.freeze()
+        print(f"🧊 Preloaded app, {gc.get_freeze_count()} objects frozen before fork")
+
+def post_fork(server, worker):
+    """Called in the worker just after it is forked."""
+    # The threads the master didn't start (see on_starting)
+    import log_config
+    import metrics
+    metrics.registry.start_flusher()
+    log_config.start_listener()
 
 def worker_int(worker):
     """Called when a worker receives the SIGINT or SIGQUIT signal."""
     print(f"⚠️  Worker received INT or QUIT signal: {worker.pid}")
 
+def worker_exit(server, worker):
+    """Called in the worker just after it exits."""
+    # Write out the last few requests' metrics before the process goes away
+    import metrics
+    metrics.registry.flush()
+
 def worker_abort(worker):
     """Called when a worker times out."""
     print(f"❌ Worker timeout: {worker.pid}")
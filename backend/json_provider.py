@@ -0,0 +1,122 @@
+"""
+Fast JSON provider for the Flask app
+
+Serialization is a large share of CPU time on the list endpoints. When
+orjson is installed, FastJSONProvider uses it for every jsonify() call.
+Otherwise it falls back to the stdlib encoder. The two paths produce the
+same JSON:
+
+- NaN / Infinity (pandas' empty cells) become null instead of the invalid
+  NaN token the stdlib emits
+- numpy scalars and arrays become plain numbers and lists
+- datetimes and dates keep Flask's HTTP date format, NaT becomes null
+- keys are sorted, as with Flask's default provider
+
+orjson writes non-ASCII characters as UTF-8 rather than \\u escapes. Both
+are valid JSON.
+
+Bodies that are already serialized (e.g. from the read cache) can be
+returned with jsonify(RawJSON(body)) and are sent as-is.
+"""
+
+import json
+import math
+import sys
+from datetime import date
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import http_date
+
+from metrics import timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+
+class RawJSON:
+    """An already serialized JSON document (bytes)"""
+
+    __slots__ = ('body',)
+
+    def __init__(self, body):
+        self.body = body
+
+
+def _sanitize(value):
+    """Copy of value with NaN/Infinity replaced by None (stdlib fallback only)"""
+    if isinstance(value, float):
+        return None if math.isnan(value) or math.isinf(value) else value
+    if isinstance(value, dict):
+        return {key: _sanitize(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_sanitize(item) for item in value]
+    return value
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider using orjson when available, with NaN -> null"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            # NaT is a datetime that isn't equal to itself
+            return None if o != o else http_date(o)
+        # numpy is only checked for once something has imported it (pandas does)
+        np = sys.modules.get('numpy')
+        if np is not None:
+            if isinstance(o, np.generic):
+                value = o.item()
+                return None if isinstance(value, float) and not math.isfinite(value) else value
+            if isinstance(o, np.ndarray):
+                return _sanitize(o.tolist())
+        return DefaultJSONProvider.default(o)
+
+    def _orjson_options(self):
+        options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def _stdlib_dumps(self, obj, **kwargs):
+        kwargs.setdefault('default', self.default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        try:
+            return json.dumps(obj, allow_nan=False, **kwargs)
+        except ValueError:
+            # Only pay for the copy when there actually is a NaN
+            return json.dumps(_sanitize(obj), **kwargs)
+
+    def dumpb_raw(self, obj):
+        """dumpb without the timing metric, for callers serializing row by row"""
+        if orjson is not None:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._orjson_options())
+            except TypeError:
+                # e.g. integers beyond 64 bits; the stdlib handles those
+                pass
+        return self._stdlib_dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def dumpb(self, obj):
+        """Serialize obj to compact UTF-8 JSON bytes"""
+        with timer('json_serialization_duration_seconds', phase='json'):
+            return self.dumpb_raw(obj)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is not None and set(kwargs) <= {'separators'}:
+            return self.dumpb(obj).decode('utf-8')
+        with timer('json_serialization_duration_seconds', phase='json'):
+            return self._stdlib_dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if isinstance(obj, RawJSON):
+            return self._app.response_class(obj.body, mimetype=self.mimetype)
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            body = self.dumps(obj, indent=2) + '\n'
+        else:
+            body = self.dumpb(obj) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
@@ -0,0 +1,214 @@
+"""
+Logging setup for the payment paths
+
+configure_logging() installs one handler on the root logger, once per
+process:
+
+- Non-blocking: the handler only puts records on a bounded in-memory
+  queue. A background thread formats them and writes them to stderr. When
+  the queue is full, records are dropped and counted rather than
+  stalling a checkout or a webhook ACK.
+- Lazy: call sites pass %-style arguments, so messages are only built
+  for records that pass the level checks, and then on the writer thread.
+- Structured: fields passed as extra={...} stay on the record.
+  LOG_FORMAT=json writes one JSON object per line. The default text
+  format appends the fields as key=value.
+- Per-module levels: LOG_LEVEL (default INFO), overridden per logger by
+  LOG_LEVELS, e.g. LOG_LEVELS=telr_webhook=WARNING,webhook_queue=DEBUG.
+- Sampling: high-volume lines pass extra=sampled('name'), and only one in
+  every LOG_SAMPLE_EVERY (default 10) is written per name. Warnings and
+  errors are never sampled.
+
+Records are handed to the writer thread as they are, not pre-formatted,
+so don't log arguments that are mutated right afterwards.
+
+The Gunicorn master writes its few records synchronously instead
+(defer_listener), so no thread runs there while it forks workers.
+"""
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '10'))
+
+# Attributes every LogRecord has; anything else came in through extra={...}
+_STANDARD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {
+    'message', 'asctime', 'sample', 'taskName'
+}
+
+
+# Process that writes records on the calling thread (see defer_listener)
+_deferred_pid = None
+
+
+def defer_listener():
+    """
+    Write records synchronously in this process instead of starting the
+    writer thread
+
+    For the Gunicorn master: a thread running while it forks could leave
+    the queue's lock held in the worker. Workers start their own with
+    start_listener() (post_fork).
+    """
+    global _deferred_pid
+    _deferred_pid = os.getpid()
+
+
+def start_listener():
+    """Start this process's writer thread now rather than on the first record"""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, AsyncQueueHandler) and os.getpid() != _deferred_pid:
+            handler._start()
+
+
+def sampled(name, **fields):
+    """extra= for a high-volume line: only one in LOG_SAMPLE_EVERY is written"""
+    return dict(fields, sample=name)
+
+
+def _fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRIBUTES}
+
+
+class TextFormatter(logging.Formatter):
+    """The usual LEVEL:logger:message line, followed by extra fields as key=value"""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _fields(record)
+        if fields:
+            line += '  ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and extra fields"""
+
+    def format(self, record):
+        entry = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Pass one in every `every` records per sample name (below WARNING)"""
+
+    def __init__(self, every=LOG_SAMPLE_EVERY):
+        super().__init__()
+        self.every = every
+        self._counters = {}
+
+    def filter(self, record):
+        name = getattr(record, 'sample', None)
+        if name is None or self.every <= 1 or record.levelno >= logging.WARNING:
+            return True
+        counter = self._counters.get(name) or self._counters.setdefault(name, itertools.count())
+        if next(counter) % self.every:
+            return False
+        record.sampled_1_in = self.every
+        return True
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    QueueHandler that never blocks the caller
+
+    Records go onto a bounded queue that a QueueListener thread drains
+    into handlers. The thread (and queue) are created on first use in each
+    process, since a fork doesn't copy threads. When the queue is full the
+    record is dropped; the count is logged once there is room again.
+    """
+
+    def __init__(self, handlers, maxsize=LOG_QUEUE_SIZE):
+        super().__init__(None)
+        self.targets = handlers
+        self.maxsize = maxsize
+        self.listener = None
+        self.dropped = 0
+        self._pid = None
+        self._start_lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def _start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self.queue = queue.Queue(self.maxsize)
+            self.listener = QueueListener(self.queue, *self.targets, respect_handler_level=True)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def stop(self):
+        """Write out whatever is still queued (called at exit)"""
+        if self.listener is not None and self._pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+    def emit(self, record):
+        if _deferred_pid == os.getpid():
+            for target in self.targets:
+                if record.levelno >= target.level:
+                    target.handle(record)
+            return
+        # Unlike QueueHandler.emit, the record isn't formatted here: that
+        # happens on the listener thread
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            warning = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                        'Log queue full, dropped %d record(s)', (dropped,), None)
+            try:
+                self.queue.put_nowait(warning)
+            except queue.Full:
+                self.dropped += dropped
+
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def configure_logging():
+    """Route the root logger through the async queue handler (idempotent)"""
+    global _configured
+    with _configure_lock:
+        if _configured:
+            return
+        _configured = True
+
+        stream = logging.StreamHandler()
+        stream.setFormatter(JsonFormatter() if LOG_FORMAT == 'json' else TextFormatter(logging.BASIC_FORMAT))
+        handler = AsyncQueueHandler([stream])
+        handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        for item in LOG_LEVELS.split(','):
+            if '=' in item:
+                name, level = item.split('=', 1)
+                logging.getLogger(name.strip()).setLevel(level.strip().upper())
@@ -0,0 +1,294 @@
+"""
+Request latency metrics, aggregated across Gunicorn workers
+
+Every request is timed per route, and the time it spends in storage
+(load_workbook, wb.save, pd.read_excel, SQLite queries), JSON
+serialization and outbound Telr calls is broken out separately:
+
+- http_request_duration_seconds{method, route, status}
+- http_request_phase_seconds{route, phase}       (storage / json / telr)
+- storage_operation_duration_seconds{operation}
+- json_serialization_duration_seconds
+- telr_request_duration_seconds{method, outcome}
+
+Each worker keeps histograms in memory, and a background thread writes
+them to METRICS_DIR/<pid>.json every METRICS_FLUSH_INTERVAL seconds when
+they have changed. The Gunicorn master records nothing and starts no
+thread (Registry.defer); each worker starts its flusher after the fork.
+GET /metrics sums every worker's file into Prometheus text format. Files
+of workers that have exited are folded into METRICS_DIR/archived.json,
+so counters never go backwards when Gunicorn recycles workers.
+"""
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Blueprint, Response, g, request
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+METRICS_DIR = os.getenv('METRICS_DIR', 'metrics')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', '1'))
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+ARCHIVE_NAME = 'archived.json'
+
+METRIC_HELP = {
+    'http_request_duration_seconds': 'Time to handle a request, by route and status',
+    'http_request_phase_seconds': 'Time a request spent in storage, JSON serialization or Telr calls',
+    'storage_operation_duration_seconds': 'Time spent in individual storage operations',
+    'json_serialization_duration_seconds': 'Time spent serializing JSON responses',
+    'telr_request_duration_seconds': 'Time spent in outbound Telr API calls',
+}
+
+metrics_bp = Blueprint('metrics', __name__)
+
+
+class Registry:
+    """Histograms for this process: (name, labels) -> [bucket counts..., +Inf count, sum]"""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._pid = os.getpid()
+        self._flusher_pid = None
+        self._defer_pid = None
+
+    def defer(self):
+        """
+        Record nothing and start no thread in this process
+
+        For the Gunicorn master, which serves no requests: a thread
+        running there when it forks could leave a lock held in the worker.
+        Workers start their flusher with start_flusher() (post_fork).
+        """
+        self._defer_pid = os.getpid()
+
+    def start_flusher(self):
+        """Start this process's flusher thread unless it is already running"""
+        with self._lock:
+            self._start_flusher()
+
+    def _start_flusher(self):
+        if self._flusher_pid != os.getpid() and self._defer_pid != os.getpid():
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True).start()
+
+    def observe(self, name, seconds, **labels):
+        if self._defer_pid == os.getpid():
+            return
+        key = (name, tuple(sorted(labels.items())))
+        slot = len(BUCKETS)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                slot = i
+                break
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked (preload): the parent's numbers are not ours
+                self._series = {}
+                self._pid = os.getpid()
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(BUCKETS) + 2)
+            series[slot] += 1
+            series[-1] += seconds
+            self._dirty = True
+            self._start_flusher()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(METRICS_FLUSH_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def dump(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                return []
+            return [[name, list(labels), list(series)] for (name, labels), series in self._series.items()]
+
+    def flush(self):
+        """Write this worker's series to METRICS_DIR/<pid>.json"""
+        self._dirty = False
+        series = self.dump()
+        if not series:
+            return
+        try:
+            os.makedirs(METRICS_DIR, exist_ok=True)
+            path = os.path.join(METRICS_DIR, f'{os.getpid()}.json')
+            tmp_path = f'{path}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(series, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Could not write metrics: {str(e)}")
+
+
+registry = Registry()
+atexit.register(registry.flush)
+
+# Per-request phase totals (threading.local is greenlet-local under gevent)
+_request_phases = threading.local()
+
+
+def observe(name, seconds, phase=None, **labels):
+    """Record one observation, also counting it towards the current request's phase"""
+    registry.observe(name, seconds, **labels)
+    phases = getattr(_request_phases, 'totals', None)
+    if phase and phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+@contextmanager
+def timer(name, phase=None, **labels):
+    """Time the enclosed block as one observation of histogram name"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, phase, **labels)
+
+
+def time_storage(operation):
+    return timer('storage_operation_duration_seconds', phase='storage', operation=operation)
+
+
+@metrics_bp.before_app_request
+def start_request_timer():
+    g.metrics_started = time.perf_counter()
+    _request_phases.totals = {}
+
+
+@metrics_bp.after_app_request
+def record_request(response):
+    started = g.pop('metrics_started', None)
+    phases = getattr(_request_phases, 'totals', None) or {}
+    _request_phases.totals = None
+    if started is None:
+        return response
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    registry.observe('http_request_duration_seconds', time.perf_counter() - started,
+                     method=request.method, route=route, status=str(response.status_code))
+    for phase, seconds in phases.items():
+        registry.observe('http_request_phase_seconds', seconds, route=route, phase=phase)
+    return response
+
+
+def _worker_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(totals, series_list):
+    for name, labels, series in series_list:
+        key = (name, tuple(tuple(label) for label in labels))
+        current = totals.setdefault(key, [0] * len(series))
+        for i, value in enumerate(series):
+            current[i] += value
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return []
+
+
+def _archive_dead_workers():
+    """Fold the files of exited workers into archived.json"""
+    if fcntl is None or not os.path.isdir(METRICS_DIR):
+        return
+    with open(os.path.join(METRICS_DIR, '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            dead = [name for name in os.listdir(METRICS_DIR)
+                    if name.endswith('.json') and name[:-5].isdigit()
+                    and not _worker_alive(int(name[:-5]))]
+            if not dead:
+                return
+            archive_path = os.path.join(METRICS_DIR, ARCHIVE_NAME)
+            totals = {}
+            _merge(totals, _read(archive_path))
+            for name in dead:
+                _merge(totals, _read(os.path.join(METRICS_DIR, name)))
+            tmp_path = archive_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump([[name, list(labels), series] for (name, labels), series in totals.items()], f)
+            os.replace(tmp_path, archive_path)
+            for name in dead:
+                os.remove(os.path.join(METRICS_DIR, name))
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def collect():
+    """Sum of every worker's series: {(name, labels): [bucket counts..., +Inf count, sum]}"""
+    _archive_dead_workers()
+    totals = {}
+    own_file = f'{os.getpid()}.json'
+    if os.path.isdir(METRICS_DIR):
+        for name in os.listdir(METRICS_DIR):
+            if name.endswith('.json') and name != own_file:
+                _merge(totals, _read(os.path.join(METRICS_DIR, name)))
+    # This worker's numbers are read live rather than from its last flush
+    _merge(totals, registry.dump())
+    return totals
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render(totals):
+    """Prometheus text exposition format for collect()'s result"""
+    lines = []
+    for name in sorted({name for name, _ in totals}):
+        lines.append(f'# HELP {name} {METRIC_HELP.get(name, name)}')
+        lines.append(f'# TYPE {name} histogram')
+        for (series_name, labels), series in sorted(totals.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, series):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            cumulative += series[len(BUCKETS)]
+            lines.append(f'{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {series[-1]:.6f}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Remove every worker's metrics files (called by the Gunicorn master on start)"""
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for name in os.listdir(METRICS_DIR):
+        if name.endswith('.json') or name.endswith('.tmp'):
+            os.remove(os.path.join(METRICS_DIR, name))
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics for all workers"""
+    return Response(render(collect()), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,222 @@
+"""
+Booking payment ledger
+
+Local record of every Telr payment, keyed by cart_id (our booking
+reference) and indexed by Telr order_ref and transaction_ref. The webhook
+handler, /api/telr/create-order and /api/telr/check-status all write to
+it, so "is this booking paid?" is a local lookup instead of a Telr call.
+
+Status moves one way only: pending -> paid | failed | cancelled. Each
+transition is a single conditional UPDATE, so concurrent webhooks and
+status checks can't flip a settled payment back. Repeating a transition
+to the status a payment already has is a no-op. Transitions never create
+payments: a cart must have been registered with record_order() first.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_LEDGER_PATH = os.getenv('PAYMENT_LEDGER_PATH', 'payments.db')
+
+PENDING = 'pending'
+PAID = 'paid'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINAL_STATUSES = (PAID, FAILED, CANCELLED)
+
+# Telr order status code -> ledger status
+TELR_STATUS_MAP = {3: PAID, 2: FAILED, -1: CANCELLED}
+
+COLUMNS = ('cart_id', 'order_ref', 'transaction_ref', 'status', 'amount', 'currency',
+           'details', 'created_at', 'updated_at')
+
+
+def status_from_telr_code(code):
+    """Ledger status for a Telr status code, or None if it isn't final"""
+    try:
+        return TELR_STATUS_MAP.get(int(code))
+    except (TypeError, ValueError):
+        return None
+
+
+class PaymentLedger:
+    """SQLite-backed payment ledger (one connection per thread and process)"""
+
+    def __init__(self, db_path=PAYMENT_LEDGER_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS payments (
+                    cart_id TEXT PRIMARY KEY,
+                    order_ref TEXT,
+                    transaction_ref TEXT,
+                    status TEXT NOT NULL,
+                    amount TEXT,
+                    currency TEXT,
+                    details TEXT NOT NULL DEFAULT '{}',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_payments_order_ref ON payments (order_ref)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_payments_transaction_ref ON payments (transaction_ref)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status, updated_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS webhook_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    logged_at TEXT NOT NULL,
+                    order_ref TEXT,
+                    cart_id TEXT,
+                    status_code TEXT,
+                    status_text TEXT,
+                    transaction_ref TEXT,
+                    amount TEXT,
+                    currency TEXT,
+                    payload TEXT
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_webhook_log_order_ref ON webhook_log (order_ref)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _record(row):
+        if row is None:
+            return None
+        record = dict(zip(COLUMNS, row))
+        record['details'] = json.loads(record['details'] or '{}')
+        return record
+
+    def _get(self, column, value):
+        row = self._connect().execute(
+            f'SELECT {", ".join(COLUMNS)} FROM payments WHERE {column} = ?', (str(value),)
+        ).fetchone()
+        return self._record(row)
+
+    def get_by_cart(self, cart_id):
+        return self._get('cart_id', cart_id)
+
+    def get_by_order_ref(self, order_ref):
+        return self._get('order_ref', order_ref)
+
+    def get_by_transaction_ref(self, transaction_ref):
+        return self._get('transaction_ref', transaction_ref)
+
+    def record_order(self, cart_id, order_ref, amount=None, currency=None):
+        """Register a newly created Telr order as pending (keeps any settled status)"""
+        now = time.time()
+        self._connect().execute('''
+            INSERT INTO payments (cart_id, order_ref, status, amount, currency, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (cart_id) DO UPDATE SET
+                order_ref = excluded.order_ref,
+                amount = excluded.amount,
+                currency = excluded.currency,
+                updated_at = excluded.updated_at
+            WHERE payments.status = 'pending'
+        ''', (str(cart_id), order_ref, PENDING, _text(amount), currency, now, now))
+
+    def _transition(self, conn, cart_id, status, details):
+        """Apply one transition on conn; return True if applied or already in status"""
+        if status not in FINAL_STATUSES:
+            raise ValueError(f"Invalid payment status '{status}'")
+        details = dict(details or {})
+        now = time.time()
+        cursor = conn.execute('''
+            UPDATE payments SET
+                status = ?,
+                order_ref = COALESCE(?, order_ref),
+                transaction_ref = COALESCE(?, transaction_ref),
+                amount = COALESCE(?, amount),
+                currency = COALESCE(?, currency),
+                details = ?,
+                updated_at = ?
+            WHERE cart_id = ? AND status = 'pending'
+        ''', (status, details.get('telr_order_ref'), details.get('transaction_ref'),
+              _text(details.get('amount')), details.get('currency'),
+              json.dumps(details, default=str), now, str(cart_id)))
+        if cursor.rowcount:
+            return True
+
+        current = conn.execute('SELECT status FROM payments WHERE cart_id = ?', (str(cart_id),)).fetchone()
+        if current is None:
+            # Unknown carts are refused rather than created from whatever reported them
+            logger.warning("⚠️ Refusing %s for unknown cart %s", status, cart_id,
+                           extra={'cart_id': cart_id, 'status': status})
+            return False
+        if current[0] != status:
+            logger.warning("⚠️ Cart %s already settled as %s, ignoring %s", cart_id, current[0], status,
+                           extra={'cart_id': cart_id, 'status': status, 'settled_status': current[0]})
+            return False
+        return True
+
+    def transition(self, cart_id, status, details=None):
+        """
+        Move a payment from pending to status
+
+        Returns True if the payment is now in status, False if it had
+        already settled with a different status or the cart isn't in the
+        ledger.
+        """
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            return self._transition(conn, cart_id, status, details)
+
+    def apply_transitions(self, transitions):
+        """Apply many (cart_id, status, details) transitions in one transaction"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            return [self._transition(conn, cart_id, status, details)
+                    for cart_id, status, details in transitions]
+
+    def pending(self, older_than=0, limit=500):
+        """Pending payments not updated for at least older_than seconds, oldest first"""
+        rows = self._connect().execute(
+            f'SELECT {", ".join(COLUMNS)} FROM payments '
+            f'WHERE status = ? AND updated_at <= ? ORDER BY updated_at LIMIT ?',
+            (PENDING, time.time() - older_than, limit)
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def touch(self, cart_ids):
+        """Mark still-pending payments as just checked (moves them to the back of pending())"""
+        conn = self._connect()
+        now = time.time()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.executemany("UPDATE payments SET updated_at = ? WHERE cart_id = ? AND status = 'pending'",
+                             [(now, str(cart_id)) for cart_id in cart_ids])
+
+    def log_webhook_event(self, event_data):
+        """Append a webhook event to the audit log"""
+        self._connect().execute('''
+            INSERT INTO webhook_log (logged_at, order_ref, cart_id, status_code, status_text,
+                                     transaction_ref, amount, currency, payload)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (event_data.get('timestamp'), event_data.get('order_ref'), _text(event_data.get('cart_id')),
+              _text(event_data.get('status_code')), event_data.get('status_text'),
+              event_data.get('transaction_ref'), _text(event_data.get('amount')),
+              event_data.get('currency'), json.dumps(event_data.get('payload'), default=str)))
+
+
+def _text(value):
+    return None if value is None else str(value)
+
+
+ledger = PaymentLedger()
@@ -0,0 +1,242 @@
+"""
+Opt-in per-request profiling
+
+With PROFILE_ENABLED=true, a request is profiled with cProfile when it
+carries the PROFILE_HEADER header (default X-Profile: 1) together with a
+matching X-Profile-Token, or is picked by PROFILE_SAMPLE_RATE (e.g.
+0.01 = 1% of requests). The profile covers the
+whole request, including after-request hooks and streamed bodies.
+Profiling is off by default. When it is off, the only cost is one flag
+check per request.
+
+Profiled responses carry an X-Profile-Id header. Each profile is written
+to PROFILE_DIR as <id>.prof (loadable with pstats or snakeviz), plus
+<id>.json holding the route, duration, time per library (openpyxl,
+pandas, json, logging, ...) and the top functions.
+Only the newest PROFILE_KEEP profiles are kept. Every worker writes to the
+same directory, so the admin endpoints see profiles from all workers:
+
+- GET /admin/profiles?limit=20&route=/hotels   slowest recent profiles
+- GET /admin/profiles/<id>                     one profile's summary
+- GET /admin/profiles/<id>?format=prof         the raw .prof file
+
+The header trigger and the admin endpoints require PROFILE_TOKEN to be set
+and sent as X-Profile-Token. Without it, or with profiling disabled, the
+admin endpoints answer 404. Stored paths never include query strings.
+
+A process runs one profile at a time, and requests that arrive meanwhile
+are not profiled. Under gevent the profile also includes whatever other
+greenlets ran during the request.
+"""
+
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+from flask import Blueprint, jsonify, request, send_file
+
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_HEADER = os.getenv('PROFILE_HEADER', 'X-Profile')
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN', '')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '200'))
+PROFILE_TOP_FUNCTIONS = 25
+
+PROFILE_ID = re.compile(r'^[0-9]+-[0-9]+$')
+STDLIB_DIR = re.compile(r'^python[0-9.]+$')
+
+profiler_bp = Blueprint('profiler', __name__)
+
+# One profiler per process: cProfile instances can't overlap in one thread,
+# and one at a time keeps the overhead bounded under load
+_profile_lock = threading.Lock()
+_active = threading.local()
+
+
+def _token_ok():
+    token = request.headers.get('X-Profile-Token')
+    return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def _admin_allowed():
+    return PROFILE_ENABLED and _token_ok()
+
+
+def _wants_profile():
+    if request.headers.get(PROFILE_HEADER):
+        return _token_ok()
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _library(filename):
+    """Library a profiled function belongs to, from its file name"""
+    if filename.startswith('~') or filename.startswith('<'):
+        return 'builtins'
+    path = filename.replace('\\', '/')
+    for marker in ('/site-packages/', '/dist-packages/'):
+        if marker in path:
+            return path.split(marker, 1)[1].split('/', 1)[0].removesuffix('.py')
+    if path.startswith(os.path.dirname(os.path.abspath(__file__)).replace('\\', '/') + '/'):
+        return 'app'
+    # Standard library: the top-level package or module (logging, json, xml, ...)
+    parts = path.split('/')
+    for i, part in enumerate(parts[:-1]):
+        if STDLIB_DIR.match(part):
+            return parts[i + 1].removesuffix('.py')
+    return parts[-2] if len(parts) >= 2 else path
+
+
+def summarize(stats, limit=PROFILE_TOP_FUNCTIONS):
+    """Time per library and the top functions by cumulative time for pstats.Stats"""
+    by_library = {}
+    functions = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        library = _library(filename)
+        by_library[library] = by_library.get(library, 0.0) + own
+        functions.append({
+            'function': name,
+            'file': filename,
+            'line': line,
+            'library': library,
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3),
+        })
+    functions.sort(key=lambda f: f['cumulative_ms'], reverse=True)
+    return {
+        # A list rather than a dict: jsonify sorts keys, and the order matters here
+        'by_library': [{'library': library, 'own_ms': round(seconds * 1000, 3)}
+                       for library, seconds in sorted(by_library.items(), key=lambda i: i[1], reverse=True)],
+        'top_functions': functions[:limit],
+    }
+
+
+def _rotate():
+    """Delete all but the newest PROFILE_KEEP profiles"""
+    ids = sorted(name[:-5] for name in os.listdir(PROFILE_DIR) if name.endswith('.json'))
+    for profile_id in ids[:-PROFILE_KEEP] if PROFILE_KEEP > 0 else ids:
+        for suffix in ('.json', '.prof'):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + suffix))
+            except FileNotFoundError:
+                pass  # another worker got there first
+
+
+def _save(profile, profile_id, meta):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        base = os.path.join(PROFILE_DIR, profile_id)
+        profile.dump_stats(base + '.prof')
+        meta.update(summarize(pstats.Stats(profile)))
+        # The .json is written last and atomically: it marks the profile complete
+        tmp_path = f'{base}.json.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, base + '.json')
+        _rotate()
+    except OSError as e:
+        print(f"Could not write profile {profile_id}: {str(e)}")
+
+
+def _finish(meta):
+    """Stop the current thread's profile and write it out"""
+    profile, started, profile_id = _active.profile, _active.started, _active.profile_id
+    profile.disable()
+    _active.profile = None
+    _profile_lock.release()
+
+    meta.update(id=profile_id, pid=os.getpid(), duration_ms=round((time.perf_counter() - started) * 1000, 3),
+                created_at=time.strftime('%Y-%m-%d %H:%M:%S'))
+    _save(profile, profile_id, meta)
+
+
+@profiler_bp.before_app_request
+def start_profile():
+    if not PROFILE_ENABLED:
+        return
+    if getattr(_active, 'profile', None) is not None:
+        # The previous request on this thread never reached its response
+        _active.profile.disable()
+        _active.profile = None
+        _profile_lock.release()
+    if not _wants_profile() or not _profile_lock.acquire(blocking=False):
+        return
+    # Sortable by start time; the pid keeps workers apart
+    _active.profile_id = f'{time.time_ns() // 1000}-{os.getpid()}'
+    _active.profile = cProfile.Profile()
+    _active.started = time.perf_counter()
+    _active.profile.enable()
+
+
+@profiler_bp.after_app_request
+def stop_profile(response):
+    if getattr(_active, 'profile', None) is None:
+        return response
+    meta = {
+        'method': request.method,
+        'path': request.path,  # query strings may carry tokens or personal data
+        'route': request.url_rule.rule if request.url_rule else 'unmatched',
+        'status': response.status_code,
+        'sampled': not request.headers.get(PROFILE_HEADER),
+    }
+    response.headers['X-Profile-Id'] = _active.profile_id
+    # Finish once the body has been sent, so streamed responses are included
+    response.call_on_close(lambda: _finish(meta))
+    return response
+
+
+def _read_meta(profile_id):
+    try:
+        with open(os.path.join(PROFILE_DIR, profile_id + '.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+@profiler_bp.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Slowest recent profiles, across all workers"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "message": "Not found"}), 404
+
+    limit = request.args.get('limit', 20, type=int)
+    route = request.args.get('route')
+    profiles = []
+    if os.path.isdir(PROFILE_DIR):
+        for name in os.listdir(PROFILE_DIR):
+            if name.endswith('.json'):
+                meta = _read_meta(name[:-5])
+                if meta and (route is None or meta.get('route') == route):
+                    meta.pop('top_functions', None)
+                    profiles.append(meta)
+    profiles.sort(key=lambda meta: meta['duration_ms'], reverse=True)
+    return jsonify({
+        "success": True,
+        "enabled": PROFILE_ENABLED,
+        "sample_rate": PROFILE_SAMPLE_RATE,
+        "count": len(profiles),
+        "data": profiles[:limit]
+    }), 200
+
+
+@profiler_bp.route('/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """One profile's summary, or the raw .prof file with ?format=prof"""
+    if not _admin_allowed():
+        return jsonify({"success": False, "message": "Not found"}), 404
+    meta = _read_meta(profile_id) if PROFILE_ID.match(profile_id) else None
+    if meta is None:
+        return jsonify({"success": False, "message": "Profile not found"}), 404
+
+    if request.args.get('format') == 'prof':
+        return send_file(os.path.abspath(os.path.join(PROFILE_DIR, profile_id + '.prof')),
+                         mimetype='application/octet-stream', as_attachment=True,
+                         download_name=profile_id + '.prof')
+    return jsonify({"success": True, "data": meta}), 200
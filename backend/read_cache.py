@@ -0,0 +1,183 @@
+"""
+Per-worker read cache for the catalog tables
+
+GET /hotels and GET /rooms used to parse the whole workbook on every
+request. ReadCache keeps the parsed records and the fully serialized
+JSON response body for each table, keyed on the storage version token
+(file inode/mtime/size for Excel). A request only pays for an os.stat()
+until the underlying data changes, at which point the entry is rebuilt
+once, even if many threads ask for it at the same time.
+
+Index positions and sorted values are kept in flat arrays rather than
+lists of int/float objects. Besides being smaller, reading them doesn't
+touch per-element reference counts, so for an entry warmed in the
+Gunicorn master before forking (GUNICORN_PRELOAD) they stay shared
+between workers, like the body. The record dicts don't: reading one
+updates reference counts, which copies its page into the worker.
+
+Derived values (geo index, room summary) of the previous entry are only
+handed to the builders of the next one when storage.lineage(table) shows
+the table was just appended to; any delete or outside edit rebuilds them.
+"""
+
+import bisect
+from array import array
+import math
+import threading
+
+
+def _row_key(record):
+    """Cheap identity of a record, used to check the table was only appended to"""
+    return tuple(str(value) for value in record.values())
+
+
+def _appended_to(old, new):
+    """Whether new looks like old with rows appended (length and last row)"""
+    return len(new) >= len(old) and (not old or _row_key(new[len(old) - 1]) == _row_key(old[-1]))
+
+
+class CacheEntry:
+    """Parsed records for one table plus the pre-serialized response body"""
+
+    def __init__(self, version, records, body, previous=None, lineage=None):
+        self.version = version
+        self.records = records
+        self.body = body
+        self.lineage = lineage
+        # Built lazily on first use and dropped with the entry
+        self._indexes = {}
+        self._sorted_indexes = {}
+        self._derived = {}
+        # Derived values of earlier versions, so builders can extend them.
+        # Only kept if storage vouches the rows in between were appended.
+        if (previous is not None and lineage is not None and previous.lineage == lineage
+                and _appended_to(previous.records, records)):
+            self._derived_base = {**previous._derived_base, **previous._derived}
+        else:
+            self._derived_base = {}
+
+    def index(self, column):
+        """Map of str(value) -> ascending record positions for column"""
+        index = self._indexes.get(column)
+        if index is None:
+            index = {}
+            for position, record in enumerate(self.records):
+                index.setdefault(str(record.get(column)), array('q')).append(position)
+            self._indexes[column] = index
+        return index
+
+    def sorted_index(self, column):
+        """(values, positions) for the numeric values of column, sorted by value"""
+        sorted_index = self._sorted_indexes.get(column)
+        if sorted_index is None:
+            pairs = []
+            for position, record in enumerate(self.records):
+                try:
+                    value = float(record.get(column))
+                except (TypeError, ValueError):
+                    continue
+                if not math.isnan(value):
+                    pairs.append((value, position))
+            pairs.sort()
+            sorted_index = (array('d', [value for value, _ in pairs]),
+                            array('q', [position for _, position in pairs]))
+            self._sorted_indexes[column] = sorted_index
+        return sorted_index
+
+    def derived(self, key, build):
+        """
+        Value computed from the records, cached with the entry
+
+        build(records, previous) is called once per entry; previous is
+        the value built under the same key for an earlier version of the
+        table that records only appends rows to, or None if there is no
+        such version, so builders can index just the new rows.
+        """
+        value = self._derived.get(key)
+        if value is None:
+            value = build(self.records, self._derived_base.pop(key, None))
+            self._derived[key] = value
+        return value
+
+    def geo_index(self, lat_column, lon_column):
+        """GeoIndex over the records' coordinates"""
+        from geo_index import GeoIndex  # numpy; imported on first use
+        return self.derived(('geo', lat_column, lon_column), lambda records, previous: (
+            previous.extended(records) if previous else GeoIndex.build(records, lat_column, lon_column)
+        ))
+
+    def select(self, equals=None, ranges=None):
+        """
+        Positions of records matching every filter, in storage order
+
+        equals maps column -> value (compared as strings); ranges maps
+        column -> (low, high) with either bound optional and inclusive.
+        """
+        candidates = None
+        for column, value in (equals or {}).items():
+            matches = self.index(column).get(str(value), [])
+            candidates = set(matches) if candidates is None else candidates & set(matches)
+            if not candidates:
+                return []
+
+        for column, (low, high) in (ranges or {}).items():
+            values, positions = self.sorted_index(column)
+            start = 0 if low is None else bisect.bisect_left(values, low)
+            end = len(values) if high is None else bisect.bisect_right(values, high)
+            matches = set(positions[start:end])
+            candidates = matches if candidates is None else candidates & matches
+            if not candidates:
+                return []
+
+        if candidates is None:
+            return list(range(len(self.records)))
+        return sorted(candidates)
+
+
+class ReadCache:
+    """
+    Caches table reads until storage.version(table) changes
+
+    render(records) must return the response body as bytes.
+    """
+
+    def __init__(self, storage, render):
+        self.storage = storage
+        self.render = render
+        self._entries = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, table):
+        with self._guard:
+            return self._locks.setdefault(table.name, threading.Lock())
+
+    def get(self, table):
+        """Return the CacheEntry for table, rebuilding it if the data changed"""
+        version = self.storage.version(table)
+        entry = self._entries.get(table.name)
+        if entry is not None and entry.version == version:
+            return entry
+
+        with self._lock_for(table):
+            # Another thread may have rebuilt it while we waited
+            version = self.storage.version(table)
+            entry = self._entries.get(table.name)
+            if entry is not None and entry.version == version:
+                return entry
+
+            # Read before the records: a delete landing in between then
+            # shows up as a lineage change on the next rebuild
+            lineage = self.storage.lineage(table)
+            records = self.storage.read_records(table)
+            entry = CacheEntry(version, records, self.render(records), previous=entry, lineage=lineage)
+            self._entries[table.name] = entry
+            return entry
+
+    def invalidate(self, table=None):
+        """Drop the cached entry for table (or every table)"""
+        with self._guard:
+            if table is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(table.name, None)
@@ -0,0 +1,156 @@
+"""
+Per-hotel room price summary
+
+Search results pages need the price range of every hotel. RoomSummary
+precomputes, per (Hotel Code, Currency): room count, refundable room
+count, min / max / median Total Fare, min Base Price and the cheapest
+room and cheapest refundable room. Fares in different currencies are
+never mixed.
+
+The full build is a single pandas group-by over the rooms table. When
+storage shows rooms were only appended since the last build (see
+read_cache.CacheEntry.derived), extended() recomputes just the hotels
+that received new rooms and shares every other group with the previous
+summary.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+HOTEL_COLUMN = 'Hotel Code'
+CURRENCY_COLUMN = 'Currency'
+FARE_COLUMN = 'Total Fare'
+BASE_PRICE_COLUMN = 'Base Price'
+REFUNDABLE_COLUMN = 'Is Refundable'
+ROOM_ID_COLUMN = 'Room ID'
+
+TRUE_VALUES = ('true', '1', 'yes', 'y')
+
+
+def _number(value):
+    """Plain float for JSON, None for NaN"""
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def _frame(records, positions):
+    """Typed columns needed for the summary, for the records at positions"""
+    rows = [records[pos] for pos in positions]
+
+    def column(name):
+        return pd.Series([row.get(name) for row in rows], index=positions, dtype=object)
+
+    return pd.DataFrame({
+        'hotel': column(HOTEL_COLUMN).fillna('').astype(str),
+        'currency': column(CURRENCY_COLUMN).fillna('').astype(str),
+        'fare': pd.to_numeric(column(FARE_COLUMN), errors='coerce'),
+        'base': pd.to_numeric(column(BASE_PRICE_COLUMN), errors='coerce'),
+        'refundable': column(REFUNDABLE_COLUMN).astype(str).str.strip().str.lower().isin(TRUE_VALUES),
+        'room_id': column(ROOM_ID_COLUMN),
+    })
+
+
+def _cheapest(frame):
+    """(fare, room id) of the cheapest priced room per group"""
+    priced = frame.dropna(subset=['fare']).sort_values('fare', kind='stable')
+    return priced.drop_duplicates(['hotel', 'currency']).set_index(['hotel', 'currency'])[['fare', 'room_id']]
+
+
+def _summarize(frame):
+    """Vectorized group-by of frame into {(hotel, currency): summary dict}"""
+    if frame.empty:
+        return {}
+    grouped = frame.groupby(['hotel', 'currency'], sort=False)
+    stats = pd.DataFrame({
+        'rooms': grouped.size(),
+        'refundable_rooms': grouped['refundable'].sum(),
+        'min_fare': grouped['fare'].min(),
+        'max_fare': grouped['fare'].max(),
+        'median_fare': grouped['fare'].median(),
+        'min_base_price': grouped['base'].min(),
+    })
+    stats = stats.join(_cheapest(frame).rename(columns={'fare': '_fare', 'room_id': 'cheapest_room_id'}))
+    refundable = _cheapest(frame[frame['refundable']])
+    stats = stats.join(refundable.rename(columns={'fare': 'cheapest_refundable_fare',
+                                                  'room_id': 'cheapest_refundable_room_id'}))
+
+    summaries = {}
+    for (hotel, currency), row in zip(stats.index, stats.itertuples(index=False)):
+        summaries[(hotel, currency)] = {
+            'hotel_code': hotel,
+            'currency': currency,
+            'rooms': int(row.rooms),
+            'refundable_rooms': int(row.refundable_rooms),
+            'min_fare': _number(row.min_fare),
+            'max_fare': _number(row.max_fare),
+            'median_fare': _number(row.median_fare),
+            'min_base_price': _number(row.min_base_price),
+            'cheapest_room_id': None if pd.isna(row.cheapest_room_id) else row.cheapest_room_id,
+            'cheapest_refundable_fare': _number(row.cheapest_refundable_fare),
+            'cheapest_refundable_room_id': (None if pd.isna(row.cheapest_refundable_room_id)
+                                            else row.cheapest_refundable_room_id),
+        }
+    return summaries
+
+
+class RoomSummary:
+    """Precomputed price summary per (hotel code, currency)"""
+
+    def __init__(self):
+        self.size = 0
+        self.summaries = {}  # (hotel, currency) -> summary dict
+        self.members = {}    # (hotel, currency) -> record positions (numpy array)
+        self.by_hotel = {}   # hotel -> [(hotel, currency), ...]
+
+    def _index(self, frame):
+        for key, positions in frame.groupby(['hotel', 'currency'], sort=False).indices.items():
+            self.members[key] = np.concatenate([self.members.get(key, np.empty(0, dtype=np.int64)),
+                                                frame.index.values[positions]])
+
+    def _finish(self, records):
+        self.by_hotel = {}
+        for key in self.summaries:
+            self.by_hotel.setdefault(key[0], []).append(key)
+        self.size = len(records)
+
+    @classmethod
+    def build(cls, records):
+        summary = cls()
+        frame = _frame(records, np.arange(len(records)))
+        summary.summaries = _summarize(frame)
+        summary._index(frame)
+        summary._finish(records)
+        return summary
+
+    def extended(self, records):
+        """
+        Summary for records, which must be this summary's records with rows appended
+
+        Returns a new RoomSummary; this one is left untouched.
+        """
+        if len(records) < self.size:
+            return RoomSummary.build(records)
+
+        summary = RoomSummary()
+        summary.summaries = dict(self.summaries)
+        summary.members = dict(self.members)
+        new_rows = _frame(records, np.arange(self.size, len(records)))
+        if not new_rows.empty:
+            summary._index(new_rows)
+            touched = set(zip(new_rows['hotel'], new_rows['currency']))
+            positions = np.sort(np.concatenate([summary.members[key] for key in touched]))
+            summary.summaries.update(_summarize(_frame(records, positions)))
+        summary._finish(records)
+        return summary
+
+    def for_hotels(self, hotel_codes=None, currency=None):
+        """Summaries for the given hotels (all hotels if None), optionally one currency"""
+        if hotel_codes is None:
+            keys = self.summaries.keys()
+        else:
+            keys = [key for code in hotel_codes for key in self.by_hotel.get(str(code), ())]
+        return [self.summaries[key] for key in keys if currency is None or key[1] == currency]
@@ -0,0 +1,1437 @@
+"""
+Pluggable storage for the hotel, room and wishlist tables
+
+The Flask app talks to a StorageBackend instead of opening workbooks
+directly. Two backends ship with the app:
+
+- ExcelStorage: the original .xlsx files, one workbook per table
+- SqliteStorage: one embedded SQLite database in WAL mode. Rows are
+  appended with a single INSERT, so write latency stays flat as the
+  catalog grows.
+
+Select the backend with STORAGE_BACKEND=excel|sqlite (default: excel).
+The Excel files remain the import/export format for the SQLite backend:
+
+    python storage.py import    # hotels.xlsx etc. -> SQLite
+    python storage.py export    # SQLite -> hotels.xlsx etc.
+"""
+
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# pandas and openpyxl are imported where they're used: together they take
+# about half a second, which every Gunicorn worker would otherwise pay at
+# startup (see GUNICORN_PREIMPORT in gunicorn.conf.py)
+from metrics import time_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows development machines
+    fcntl = None
+
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'excel').lower()
+SQLITE_DB_PATH = os.getenv('STORAGE_SQLITE_PATH', 'hotelrbs.db')
+# Single-row table counting SqliteStorage write transactions (version token)
+COMMITS_TABLE = '_storage_commits'
+# Highest generated ID number per table, for tables with an id_format. The
+# Excel backend keeps it in a custom document property of the workbook
+ID_COUNTERS_TABLE = '_storage_id_counters'
+ID_COUNTER_PROPERTY = 'Last Generated ID'
+# Per-table count of writes that changed or removed existing rows (lineage)
+REWRITES_TABLE = '_storage_rewrites'
+
+# Rows converted to records at a time by ExcelStorage.iter_records
+ITER_CHUNK_ROWS = 1000
+# Changes appended to a key index's delta log before it is rewritten
+INDEX_COMPACT_EVERY = int(os.getenv('STORAGE_INDEX_COMPACT_EVERY', '1000'))
+# How long a write waits for another writer (Excel file lock, SQLite
+# write lock) before failing. The wait polls with time.sleep, which gevent
+# patches, so a waiting greenlet doesn't stall the rest of its worker.
+WRITE_LOCK_TIMEOUT = float(os.getenv('STORAGE_WRITE_LOCK_TIMEOUT', '30'))
+WRITE_LOCK_POLL_MAX = 0.05  # seconds between polls, after backing off from 1 ms
+
+
+def _wait_for_lock(try_lock, what):
+    """Call try_lock() until it returns True, sleeping between attempts"""
+    deadline = time.monotonic() + WRITE_LOCK_TIMEOUT
+    delay = 0.001
+    while not try_lock():
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Timed out after {WRITE_LOCK_TIMEOUT:g}s waiting for {what}")
+        time.sleep(delay)
+        delay = min(delay * 2, WRITE_LOCK_POLL_MAX)
+
+
+class TableSpec:
+    """Describes one logical table and its Excel representation"""
+
+    def __init__(self, name, excel_path, sheet_name, headers, id_format=None, key_columns=None):
+        self.name = name
+        self.excel_path = excel_path
+        self.sheet_name = sheet_name
+        self.headers = list(headers)
+        # Format for generated IDs in the first column, e.g. 'WL{:05d}'
+        self.id_format = id_format
+        # Columns that identify a row, e.g. ('Customer ID', 'Hotel Code').
+        # Backends index these; lookups by the first column are O(k).
+        self.key_columns = tuple(key_columns) if key_columns else None
+
+    def column_index(self, column):
+        return self.headers.index(column)
+
+
+def _matches(row, positions, values):
+    """Compare cells the same way the original Excel code did (as strings)"""
+    return all(str(row[pos]) == str(value) for pos, value in zip(positions, values))
+
+
+def _id_number(table, value):
+    """Numeric part of an ID generated with table.id_format (42 for WL00042), or None"""
+    prefix = table.id_format.split('{', 1)[0]
+    text = '' if value is None else str(value)
+    if text.startswith(prefix) and text[len(prefix):].isdigit():
+        return int(text[len(prefix):])
+    return None
+
+
+def _frame_records(frame):
+    """Same result as frame.to_dict('records'), without boxing every cell separately"""
+    columns = list(frame.columns)
+    values = [frame.iloc[:, i].tolist() for i in range(len(columns))]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+
+class _RowCounter:
+    """
+    Fenwick tree over row slots, 1 while the row exists and 0 once removed
+
+    Gives the sheet position of a slot (live rows before it) in O(log n),
+    so deleting a row doesn't need a scan to find its row number.
+    """
+
+    def __init__(self):
+        self.tree = [0]  # 1-based
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def append(self):
+        """Add a live slot at the end and return its number"""
+        i = len(self.tree)
+        # Node i covers slots (i - lowbit(i), i]
+        total = 1
+        j, low = i - 1, i - (i & -i)
+        while j > low:
+            total += self.tree[j]
+            j -= j & -j
+        self.tree.append(total)
+        return i
+
+    def clear(self, i):
+        while i < len(self.tree):
+            self.tree[i] -= 1
+            i += i & -i
+
+    def before(self, i):
+        """Number of live slots below i"""
+        i -= 1
+        total = 0
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def copy(self):
+        counter = _RowCounter()
+        counter.tree = list(self.tree)
+        return counter
+
+
+class _IdCounter:
+    """
+    High-water mark of the IDs generated for a workbook
+
+    Stored in the workbook's custom document properties, so it is saved in
+    the same atomic replace as the rows it numbers, survives index
+    rebuilds and is kept by Excel when the file is edited by hand.
+    Deleting the newest row doesn't lower it, so IDs are never reused.
+    """
+
+    def __init__(self, table, wb, in_use):
+        self.table = table
+        props = wb.custom_doc_props
+        stored = int(props[ID_COUNTER_PROPERTY].value) if ID_COUNTER_PROPERTY in props.names else 0
+        # IDs in use count too: rows may have been added by hand or before
+        # the counter existed
+        self.last = max(stored, in_use)
+
+    def observe(self, value):
+        """Account for a row added with an explicit ID"""
+        number = _id_number(self.table, value)
+        if number is not None and number > self.last:
+            self.last = number
+
+    def next(self):
+        self.last += 1
+        return self.table.id_format.format(self.last)
+
+    def store(self, wb):
+        props = wb.custom_doc_props
+        if ID_COUNTER_PROPERTY in props.names:
+            props[ID_COUNTER_PROPERTY].value = self.last
+        else:
+            from openpyxl.packaging.custom import IntProperty
+            props.append(IntProperty(name=ID_COUNTER_PROPERTY, value=self.last))
+
+
+class KeyIndex:
+    """
+    In-memory index over a table with key_columns
+
+    Records are grouped by the (stringified) value of the first key
+    column, so dedupe, remove and list only touch that group, e.g. one
+    customer's wishlist. Every row gets a slot, counted by a _RowCounter,
+    so the Excel row number of a key is found in O(log n) for deletes. For
+    tables with an id_format, last_id is the highest ID number this index
+    has seen added. The persisted high-water mark of issued IDs is kept
+    with the data itself (see _IdCounter).
+
+    On disk the index is a JSON snapshot plus a delta log of the rows
+    added and removed by each commit since (see persist()), so a commit
+    writes only its own changes. A process that already holds the index
+    catches up with other workers' commits by replaying just the log
+    entries past log_offset (see caught_up()).
+    """
+
+    def __init__(self, table, version=None):
+        self.table = table
+        self.version = version
+        self.groups = {}  # first key value -> records, in row order
+        self.slots = {}  # key -> slots of its records, in row order
+        self.rows = {}  # slot -> record, in row order
+        self.counter = _RowCounter()
+        self.last_id = 0
+        # Keys whose lists in groups / slots this index may modify (None:
+        # all of them). Copies share the lists until they change one
+        self._own_groups = None
+        self._own_slots = None
+        # Persistence: changes since base_version (None once they can't be
+        # replayed), and what the files on disk hold
+        self.changes = []
+        self.base_version = version
+        self.disk_version = None
+        self.log_id = None
+        self.logged = 0
+        self.log_offset = 0  # bytes of the delta log applied to this index
+
+    def key(self, values):
+        return tuple(str(value) for value in values)
+
+    def key_of(self, record):
+        return self.key(record.get(col) for col in self.table.key_columns)
+
+    @staticmethod
+    def _list(mapping, owned, key):
+        """mapping[key] as a list this index may modify"""
+        items = mapping.get(key)
+        if items is None:
+            items = mapping[key] = []
+        elif owned is not None and key not in owned:
+            items = mapping[key] = list(items)
+        else:
+            return items
+        if owned is not None:
+            owned.add(key)
+        return items
+
+    def add(self, record):
+        key = self.key_of(record)
+        self._list(self.groups, self._own_groups, key[0]).append(record)
+        slot = self.counter.append()
+        self.rows[slot] = record
+        self._list(self.slots, self._own_slots, key).append(slot)
+        if self.table.id_format:
+            number = _id_number(self.table, record.get(self.table.headers[0]))
+            if number is not None and number > self.last_id:
+                self.last_id = number
+        if self.changes is not None:
+            self.changes.append({'add': record})
+
+    def contains(self, key_values):
+        return bool(self.slots.get(self.key(key_values)))
+
+    def find(self, match):
+        """Records matching match, which must include the first key column"""
+        records = self.groups.get(str(match[self.table.key_columns[0]]), [])
+        return [
+            record for record in records
+            if all(str(record.get(col)) == str(value) for col, value in match.items())
+        ]
+
+    def remove(self, key_values):
+        """Drop the first record with this key; return its row position or None"""
+        key = self.key(key_values)
+        if not self.slots.get(key):
+            return None
+        slots = self._list(self.slots, self._own_slots, key)
+        slot = slots.pop(0)
+        if not slots:
+            del self.slots[key]
+        record = self.rows.pop(slot)
+        group = self._list(self.groups, self._own_groups, key[0])
+        for i, candidate in enumerate(group):
+            if candidate is record:
+                del group[i]
+                break
+        if not group:
+            del self.groups[key[0]]
+        position = self.counter.before(slot)
+        self.counter.clear(slot)
+        if self.changes is not None:
+            self.changes.append({'remove': list(key)})
+        if len(self.counter) > 2 * len(self.rows) + 1024:
+            self._renumber()
+        return position
+
+    def _renumber(self):
+        """Drop the slots of removed rows"""
+        records = list(self.rows.values())
+        self.rows = {}
+        self.slots = {}
+        self.counter = _RowCounter()
+        self._own_slots = None
+        for record in records:
+            slot = self.counter.append()
+            self.rows[slot] = record
+            self.slots.setdefault(self.key_of(record), []).append(slot)
+
+    def copy(self):
+        """Copy a writer can update while readers use the original"""
+        index = KeyIndex(self.table, self.version)
+        index.groups = dict(self.groups)
+        index.slots = dict(self.slots)
+        index.rows = dict(self.rows)
+        index.counter = self.counter.copy()
+        index.last_id = self.last_id
+        index._own_groups = set()
+        index._own_slots = set()
+        index.disk_version = self.disk_version
+        index.log_id = self.log_id
+        index.logged = self.logged
+        index.log_offset = self.log_offset
+        return index
+
+    def covers(self, columns):
+        """True if a lookup on columns can be answered from this index"""
+        columns = set(columns)
+        return self.table.key_columns[0] in columns and columns <= set(self.table.key_columns)
+
+    def reset(self, rows):
+        """Rebuild the index from sheet rows (lists in header order), keeping last_id"""
+        self.groups = {}
+        self.slots = {}
+        self.rows = {}
+        self.counter = _RowCounter()
+        self._own_groups = None
+        self._own_slots = None
+        # Blank rows are kept so positions line up with sheet row numbers
+        for row in rows:
+            self.add(dict(zip(self.table.headers, row)))
+        self.changes = None
+
+    @classmethod
+    def from_rows(cls, table, rows, version=None):
+        index = cls(table, version)
+        index.reset(rows)
+        return index
+
+    def persist(self, path):
+        """
+        Write the index next to the data, tagged with its version
+
+        Appends this index's changes to the delta log when the files on
+        disk hold exactly the version they were made against. Otherwise,
+        or once the log has INDEX_COMPACT_EVERY changes, rewrites the
+        snapshot and starts a new log. Callers hold the table's writer lock.
+        """
+        if (self.changes is not None and self.log_id is not None
+                and self.disk_version == self.base_version
+                and self.logged + len(self.changes) <= INDEX_COMPACT_EVERY):
+            lines = [json.dumps(change, default=str) + '\n' for change in self.changes]
+            lines.append(json.dumps({'version': list(self.version), 'last_id': self.last_id}) + '\n')
+            with open(path + '.log', 'a') as f:
+                if f.tell() == 0:
+                    f.write(json.dumps({'log_id': self.log_id}) + '\n')
+                # One write per commit: a reader never sees half a commit
+                # followed by the next one
+                f.write(''.join(lines))
+                self.log_offset = f.tell()
+            self.logged += len(self.changes)
+        else:
+            log_id = uuid.uuid4().hex
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': list(self.version), 'last_id': self.last_id, 'log_id': log_id,
+                           'records': list(self.rows.values())}, f, default=str)
+            os.replace(tmp_path, path)
+            try:
+                os.remove(path + '.log')
+            except FileNotFoundError:
+                pass
+            self.log_id = log_id
+            self.logged = 0
+            self.log_offset = 0
+        self.disk_version = self.version
+        self.base_version = self.version
+        self.changes = []
+
+    def _replay(self, f):
+        """
+        Apply the complete commits in the delta log f (opened in binary
+        mode) from its current position
+
+        Returns the version of the last one applied, or None.
+        """
+        version = None
+        commit = []
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # a commit still being written
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                break
+            if 'version' not in entry:
+                commit.append(entry)
+                continue
+            for change in commit:
+                if 'add' in change:
+                    self.add(change['add'])
+                else:
+                    self.remove(change['remove'])
+            self.logged += len(commit)
+            commit = []
+            version = tuple(entry['version'])
+            self.last_id = max(self.last_id, entry.get('last_id') or 0)
+            self.log_offset = f.tell()
+        return version
+
+    @staticmethod
+    def _log_header(f, log_id):
+        """Read the delta log's header; True if it continues the snapshot log_id"""
+        header = f.readline()
+        if not header.endswith(b'\n'):
+            return False
+        return json.loads(header).get('log_id') == log_id
+
+    def caught_up(self, path, version):
+        """
+        A copy of this index brought up to version from the delta log, or None
+
+        Only the log entries this index hasn't applied yet are read, so
+        another worker's commit costs its own few lines rather than a
+        reload of the snapshot. None if this index doesn't match the
+        files, or the log was compacted or doesn't reach version; the
+        caller then loads the files.
+        """
+        if self.log_id is None or self.disk_version != self.version:
+            return None
+        try:
+            with open(path + '.log', 'rb') as f:
+                if not self._log_header(f, self.log_id):
+                    return None
+                f.seek(max(f.tell(), self.log_offset))
+                index = self.copy()
+                current = index._replay(f)
+        except (OSError, ValueError):
+            return None
+        if current != tuple(version):
+            return None
+        index.version = index.base_version = index.disk_version = version
+        index.changes = []
+        return index
+
+    @classmethod
+    def load(cls, table, path, version):
+        """Load a persisted index, or return None if it is missing or stale"""
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        index = cls(table)
+        for record in data['records']:
+            index.add(record)
+        current = tuple(data.get('version') or ())
+        index.last_id = max(index.last_id, data.get('last_id') or 0)
+        log_id = data.get('log_id')
+        stale_log = False
+        if log_id is not None:
+            try:
+                with open(path + '.log', 'rb') as f:
+                    if index._log_header(f, log_id):
+                        index.log_offset = f.tell()
+                        current = index._replay(f) or current
+                    else:
+                        # Empty (not yet written) or left by an interrupted rewrite
+                        stale_log = f.tell() > 0
+            except FileNotFoundError:
+                pass
+            except ValueError:
+                stale_log = True
+        if current != tuple(version):
+            return None
+        index.version = index.base_version = version
+        index.changes = []
+        index.log_id = log_id
+        # A log left behind by an interrupted rewrite: rewrite again next time
+        index.disk_version = None if stale_log else version
+        return index
+
+
+class StorageBackend:
+    """
+    Interface shared by all storage backends
+
+    Rows are plain lists in table.headers order. Records returned by the
+    read methods are dicts keyed by header.
+    """
+
+    def ensure_table(self, table):
+        """Create the table (and its file) if it doesn't exist"""
+        raise NotImplementedError
+
+    def table_exists(self, table):
+        raise NotImplementedError
+
+    def close(self):
+        """Release this thread's resources (e.g. before the process forks)"""
+
+    def append_rows(self, table, rows):
+        """Append rows to the table and return how many were written"""
+        raise NotImplementedError
+
+    def insert_unique(self, table, row, key_columns):
+        """
+        Append row unless a row with the same key_columns values exists
+
+        If table.id_format is set and row[0] is None, an ID is generated.
+        Returns True if the row was inserted, False if it already existed.
+        """
+        raise NotImplementedError
+
+    def read_records(self, table):
+        raise NotImplementedError
+
+    def iter_records(self, table):
+        """Yield records one at a time without materializing the table"""
+        yield from self.read_records(table)
+
+    def find_records(self, table, match):
+        """Return records whose columns equal the values in match"""
+        columns = list(match)
+        return [
+            record for record in self.read_records(table)
+            if all(str(record.get(col)) == str(match[col]) for col in columns)
+        ]
+
+    def delete_first(self, table, match):
+        """Delete the first row matching match; return True if one was deleted"""
+        raise NotImplementedError
+
+    def count(self, table):
+        raise NotImplementedError
+
+    def describe(self, table):
+        """Human readable location of the table, used in startup logs"""
+        raise NotImplementedError
+
+    def version(self, table):
+        """
+        Cheap token that changes whenever the table's data changes
+
+        Used by read caches to decide when to rebuild. None means the
+        table doesn't exist yet.
+        """
+        raise NotImplementedError
+
+    def lineage(self, table):
+        """
+        Token that stays the same while the table only has rows appended
+
+        It changes whenever rows are removed or changed, or the data is
+        modified outside this storage. Read caches use it to decide
+        whether values derived from an older version can be extended with
+        the new rows instead of rebuilt. None means it can't be told.
+        """
+        return None
+
+    def replace_rows(self, table, rows):
+        """Replace every row of the table with rows in one commit; return the count"""
+        raise NotImplementedError
+
+    def append_row(self, table, row):
+        return self.append_rows(table, [row]) == 1
+
+
+class ExcelStorage(StorageBackend):
+    """
+    Stores each table in its own .xlsx workbook
+
+    Writes go through a single-writer pipeline so concurrent Gunicorn
+    workers can't overwrite each other's rows:
+
+    1. The caller spools its operation as a file in <workbook>.spool/
+    2. It takes an exclusive lock on <workbook>.lock
+    3. If its operation is still in the spool, it becomes the writer: it
+       applies every spooled operation (its own and any queued by other
+       workers meanwhile) to one loaded workbook and saves it once, via a
+       temp file and an atomic rename (group commit)
+    4. Otherwise another worker already committed it; the caller just
+       picks up its result file
+
+    Each commit also records the workbook version it produced in
+    <workbook>.lineage.json, with a token that only changes when a commit
+    deletes rows. If the workbook's version differs from the recorded
+    one, it was changed outside this storage (see lineage()).
+
+    Reads don't parse the workbook. After each commit the writer stores
+    the sheet as a pickled DataFrame in <workbook>.snapshot.pkl, tagged
+    with the workbook version, and read_records loads that instead. A
+    missing or stale snapshot (e.g. the workbook was edited in Excel) is
+    rebuilt by the first reader.
+    """
+
+    # In-process locks, used alongside flock (and instead of it where
+    # fcntl isn't available)
+    _thread_locks = {}
+    _thread_locks_guard = threading.Lock()
+
+    def __init__(self):
+        # KeyIndex per table name, for tables with key_columns
+        self._key_indexes = {}
+
+    def ensure_table(self, table):
+        if os.path.exists(table.excel_path):
+            return
+        with self._writer_lock(table):
+            if not os.path.exists(table.excel_path):
+                from openpyxl import Workbook
+                wb = Workbook()
+                ws = wb.active
+                ws.title = table.sheet_name
+
+                # Add headers
+                for col, header in enumerate(table.headers, 1):
+                    ws.cell(row=1, column=col, value=header)
+
+                self._atomic_save(wb, table.excel_path)
+                print(f"Created new Excel file: {table.excel_path}")
+
+    def table_exists(self, table):
+        return os.path.exists(table.excel_path)
+
+    @staticmethod
+    def _spool_dir(table):
+        return table.excel_path + '.spool'
+
+    @contextmanager
+    def _writer_lock(self, table):
+        with self._thread_locks_guard:
+            thread_lock = self._thread_locks.setdefault(table.excel_path, threading.Lock())
+        with thread_lock:
+            if fcntl is None:
+                yield
+                return
+            with open(table.excel_path + '.lock', 'a') as lock_file:
+                # Not a blocking LOCK_EX: that would stall every greenlet
+                # of a gevent worker until the other writer is done
+                _wait_for_lock(lambda: self._try_flock(lock_file), f'the lock on {table.excel_path}')
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _try_flock(lock_file):
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+
+    @staticmethod
+    def _atomic_save(wb, path):
+        """Save next to path and rename over it, so readers never see a partial file"""
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with time_storage('save'):
+                wb.save(tmp_path)
+                with open(tmp_path, 'rb+') as f:
+                    os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _submit(self, table, operation):
+        """Queue operation for the single writer and return its result"""
+        self.ensure_table(table)
+        spool_dir = self._spool_dir(table)
+        os.makedirs(spool_dir, exist_ok=True)
+
+        # Names sort by enqueue time, so operations are applied in order
+        name = f'{time.time_ns():020d}-{os.getpid()}-{uuid.uuid4().hex}'
+        op_path = os.path.join(spool_dir, name + '.op')
+        result_path = os.path.join(spool_dir, name + '.result')
+        tmp_path = os.path.join(spool_dir, name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(operation, f)
+        os.replace(tmp_path, op_path)
+
+        with self._writer_lock(table):
+            if os.path.exists(op_path):
+                try:
+                    self._flush(table)
+                except Exception:
+                    # Don't leave our own operation behind to be applied later
+                    if os.path.exists(op_path):
+                        os.remove(op_path)
+                    raise
+
+        with open(result_path) as f:
+            result = json.load(f)
+        os.remove(result_path)
+        if 'error' in result:
+            raise RuntimeError(result['error'])
+        return result['value']
+
+    def _flush(self, table):
+        """Apply every spooled operation in one load/save (caller holds the lock)"""
+        spool_dir = self._spool_dir(table)
+        names = sorted(name[:-3] for name in os.listdir(spool_dir) if name.endswith('.op'))
+        if not names:
+            return
+
+        from openpyxl import load_workbook
+        loaded_version = self.version(table)
+        with time_storage('load_workbook'):
+            wb = load_workbook(table.excel_path)
+        ws = wb[table.sheet_name]
+        # Work on a copy: threaded workers may be reading the shared index
+        index = self._key_index(table, ws).copy() if table.key_columns else None
+        ids = None
+        if table.id_format:
+            if index is not None:
+                in_use = index.last_id
+            else:
+                numbers = (_id_number(table, cell) for (cell,) in ws.iter_rows(min_row=2, max_col=1, values_only=True))
+                in_use = max((number for number in numbers if number is not None), default=0)
+            ids = _IdCounter(table, wb, in_use)
+
+        results = {}
+        appended_only = True
+        for name in names:
+            with open(os.path.join(spool_dir, name + '.op')) as f:
+                operation = json.load(f)
+            appended_only = appended_only and operation['op'] != 'delete_first'
+            try:
+                results[name] = {'value': self._apply(table, ws, operation, index, ids)}
+            except Exception as e:
+                results[name] = {'error': str(e)}
+
+        if ids is not None:
+            ids.store(wb)
+        lineage = self._read_lineage(table)
+        if not (appended_only and lineage and lineage['version'] == list(loaded_version)):
+            lineage = {'lineage': uuid.uuid4().hex}
+        self._atomic_save(wb, table.excel_path)
+        lineage['version'] = list(self.version(table))
+        self._write_lineage(table, lineage)
+        if index is not None:
+            index.version = self.version(table)
+            self._save_key_index(table, index)
+        try:
+            # Parse the workbook we already have in memory rather than
+            # re-reading the zipped XML
+            with time_storage('snapshot_build'):
+                import pandas as pd
+                frame = pd.read_excel(wb, sheet_name=table.sheet_name, engine='openpyxl')
+            self._save_snapshot(table, frame, self.version(table))
+        except Exception as e:
+            print(f"Could not write snapshot for {table.excel_path}: {str(e)}")
+
+        for name, result in results.items():
+            with open(os.path.join(spool_dir, name + '.result'), 'w') as f:
+                json.dump(result, f)
+            os.remove(os.path.join(spool_dir, name + '.op'))
+        if len(names) > 1:
+            print(f"Group commit: {len(names)} operations written to {table.excel_path}")
+
+    def _apply(self, table, ws, operation, index=None, ids=None):
+        kind = operation['op']
+        if kind == 'append':
+            for row in operation['rows']:
+                ws.append(row)
+                if ids is not None:
+                    ids.observe(row[0])
+                if index is not None:
+                    index.add(dict(zip(table.headers, row)))
+            return len(operation['rows'])
+
+        if kind == 'insert_unique':
+            row = operation['row']
+            positions = [table.column_index(col) for col in operation['key_columns']]
+            values = [row[pos] for pos in positions]
+            if index is not None and tuple(operation['key_columns']) == table.key_columns:
+                if index.contains(values):
+                    return False
+            else:
+                for existing in ws.iter_rows(min_row=2, values_only=True):
+                    if _matches(existing, positions, values):
+                        return False
+            if ids is not None:
+                if row[0] is None:
+                    row[0] = ids.next()
+                else:
+                    ids.observe(row[0])
+            ws.append(row)
+            if index is not None:
+                index.add(dict(zip(table.headers, row)))
+            return True
+
+        if kind == 'delete_first':
+            match = operation['match']
+            if index is not None and tuple(match) == table.key_columns:
+                position = index.remove(list(match.values()))
+                if position is None:
+                    return False
+                ws.delete_rows(position + 2, 1)
+                return True
+
+            positions = [table.column_index(col) for col in match]
+            values = list(match.values())
+            for row_number, existing in enumerate(ws.iter_rows(min_row=2, values_only=True), 2):
+                if _matches(existing, positions, values):
+                    ws.delete_rows(row_number, 1)
+                    if index is not None:
+                        # Not a key lookup, so rebuild the index from the sheet
+                        index.reset(ws.iter_rows(min_row=2, values_only=True))
+                    return True
+            return False
+
+        raise ValueError(f"Unknown storage operation '{kind}'")
+
+    @staticmethod
+    def _key_index_path(table):
+        return table.excel_path + '.index.json'
+
+    def _key_index(self, table, ws=None):
+        """
+        Return the KeyIndex for the current version of table
+
+        Tries, in order: this process's copy, that copy caught up with the
+        delta log, the index persisted next to the workbook, and finally a
+        rebuild from the sheet (ws if the caller already has it loaded).
+        """
+        version = self.version(table)
+        index = self._key_indexes.get(table.name)
+        if index is not None and index.version == version:
+            return index
+
+        path = self._key_index_path(table)
+        index = index.caught_up(path, version) if index is not None else None
+        if index is None:
+            index = KeyIndex.load(table, path, version)
+        if index is None:
+            if ws is not None:
+                # Called from _flush, which persists the index after applying its operations
+                index = KeyIndex.from_rows(table, ws.iter_rows(min_row=2, values_only=True), version)
+            else:
+                from openpyxl import load_workbook
+                with time_storage('index_rebuild'):
+                    wb = load_workbook(table.excel_path, read_only=True)
+                    try:
+                        rows = wb[table.sheet_name].iter_rows(min_row=2, values_only=True)
+                        index = KeyIndex.from_rows(table, rows, version)
+                    finally:
+                        wb.close()
+                # The index files are only written under the writer lock
+                with self._writer_lock(table):
+                    if self.version(table) == version:
+                        self._save_key_index(table, index)
+
+        self._key_indexes[table.name] = index
+        return index
+
+    def _save_key_index(self, table, index):
+        self._key_indexes[table.name] = index
+        try:
+            index.persist(self._key_index_path(table))
+        except OSError as e:
+            # The index can always be rebuilt from the workbook
+            print(f"Could not persist index for {table.excel_path}: {str(e)}")
+
+    @staticmethod
+    def _lineage_path(table):
+        return table.excel_path + '.lineage.json'
+
+    def _read_lineage(self, table):
+        try:
+            with open(self._lineage_path(table)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_lineage(self, table, lineage):
+        path = self._lineage_path(table)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(lineage, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # Without it the next reader rebuilds instead of extending
+            print(f"Could not persist lineage for {table.excel_path}: {str(e)}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @staticmethod
+    def _snapshot_path(table):
+        return table.excel_path + '.snapshot.pkl'
+
+    def _save_snapshot(self, table, frame, version):
+        path = self._snapshot_path(table)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                # Version first, so readers can reject a stale snapshot
+                # without unpickling the frame. The frame follows in
+                # ITER_CHUNK_ROWS-row pieces that iter_records unpickles
+                # one at a time; all of them keep the frame's dtypes.
+                starts = range(0, len(frame), ITER_CHUNK_ROWS) or [0]
+                pickle.dump(tuple(version), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(len(starts), f, protocol=pickle.HIGHEST_PROTOCOL)
+                for start in starts:
+                    pickle.dump(frame.iloc[start:start + ITER_CHUNK_ROWS], f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            # The snapshot can always be rebuilt from the workbook
+            print(f"Could not persist snapshot for {table.excel_path}: {str(e)}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _open_snapshot(self, table, version):
+        """(open file, chunk count) positioned at the first chunk, or None if missing or stale"""
+        try:
+            f = open(self._snapshot_path(table), 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            if pickle.load(f) != tuple(version):
+                f.close()
+                return None
+            return f, pickle.load(f)
+        except Exception as e:
+            f.close()
+            print(f"Ignoring unreadable snapshot for {table.excel_path}: {str(e)}")
+            return None
+
+    def _load_snapshot(self, table, version):
+        """Load the snapshot DataFrame, or return None if it is missing or stale"""
+        opened = self._open_snapshot(table, version)
+        if opened is None:
+            return None
+        f, count = opened
+        try:
+            with f:
+                import pandas as pd
+                return pd.concat([pickle.load(f) for _ in range(count)])
+        except Exception as e:
+            # Truncated file, pandas upgrade, ...: fall back to the workbook
+            print(f"Ignoring unreadable snapshot for {table.excel_path}: {str(e)}")
+            return None
+
+    def _frame(self, table):
+        """The table as a DataFrame, from the snapshot when it is current"""
+        version = self.version(table)
+        with time_storage('snapshot_load'):
+            frame = self._load_snapshot(table, version)
+        if frame is None:
+            import pandas as pd
+            with time_storage('read_excel'):
+                frame = pd.read_excel(table.excel_path, sheet_name=table.sheet_name)
+            if self.version(table) == version:
+                self._save_snapshot(table, frame, version)
+        return frame
+
+    def append_rows(self, table, rows):
+        return self._submit(table, {'op': 'append', 'rows': [list(row) for row in rows]})
+
+    def insert_unique(self, table, row, key_columns):
+        return self._submit(table, {'op': 'insert_unique', 'row': list(row), 'key_columns': list(key_columns)})
+
+    def read_records(self, table):
+        if not os.path.exists(table.excel_path):
+            return []
+        return _frame_records(self._frame(table))
+
+    def iter_records(self, table):
+        if not os.path.exists(table.excel_path):
+            return
+        # The same chunks (and so the same dtypes) read_records concatenates,
+        # unpickled one at a time. The open file stays readable if a
+        # commit replaces the snapshot meanwhile.
+        opened = self._open_snapshot(table, self.version(table))
+        if opened is None:
+            # Missing or stale (workbook edited outside the app): the
+            # workbook has to be parsed whole once, which rewrites it
+            frame = self._frame(table)
+            for start in range(0, len(frame), ITER_CHUNK_ROWS):
+                yield from _frame_records(frame.iloc[start:start + ITER_CHUNK_ROWS])
+            return
+        f, count = opened
+        with f:
+            for _ in range(count):
+                yield from _frame_records(pickle.load(f))
+
+    def find_records(self, table, match):
+        if not os.path.exists(table.excel_path):
+            return []
+        if table.key_columns:
+            index = self._key_index(table)
+            if index.covers(match):
+                return index.find(match)
+        df = self._frame(table)
+        for column, value in match.items():
+            df = df[df[column].astype(str) == str(value)]
+        return _frame_records(df)
+
+    def delete_first(self, table, match):
+        if not os.path.exists(table.excel_path):
+            return False
+        return self._submit(table, {'op': 'delete_first', 'match': dict(match)})
+
+    def count(self, table):
+        if not os.path.exists(table.excel_path):
+            return 0
+        from openpyxl import load_workbook
+        wb = load_workbook(table.excel_path, read_only=True)
+        try:
+            return max(wb[table.sheet_name].max_row - 1, 0)
+        finally:
+            wb.close()
+
+    def describe(self, table):
+        return os.path.abspath(table.excel_path)
+
+    def version(self, table):
+        try:
+            stat = os.stat(table.excel_path)
+        except FileNotFoundError:
+            return None
+        # Saves replace the file, so the inode changes even if mtime and
+        # size happen to match
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def lineage(self, table):
+        version = self.version(table)
+        if version is None:
+            return None
+        recorded = self._read_lineage(table)
+        if recorded and recorded.get('version') == list(version):
+            return recorded['lineage']
+        # Not the workbook our last commit wrote: edited in Excel, restored, ...
+        return ('external', version)
+
+
+class SqliteStorage(StorageBackend):
+    """
+    Stores every table in one SQLite database (WAL journal)
+
+    Connections are opened per thread and per process, so the backend is
+    safe to share between Gunicorn workers and threaded workers.
+    """
+
+    def __init__(self, db_path=SQLITE_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._writes = 0
+        # One read-only connection per process for version(): its
+        # data_version moves on every commit made by any other connection
+        self._version_conn = None
+        self._version_pid = None
+        self._version_seen = None
+        self._version_commits = None
+        self._version_lock = threading.Lock()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # SQLite's own busy handler sleeps in C and would block a
+            # gevent worker's hub; writers wait in _begin instead
+            conn = sqlite3.connect(self.db_path, timeout=0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with conn:
+                self._begin(conn)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {COMMITS_TABLE} '
+                             f'(id INTEGER PRIMARY KEY CHECK (id = 1), n INTEGER NOT NULL)')
+                conn.execute(f'INSERT OR IGNORE INTO {COMMITS_TABLE} VALUES (1, 0)')
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {ID_COUNTERS_TABLE} '
+                             f'(name TEXT PRIMARY KEY, last_id INTEGER NOT NULL)')
+                conn.execute(f'CREATE TABLE IF NOT EXISTS {REWRITES_TABLE} '
+                             f'(name TEXT PRIMARY KEY, n INTEGER NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+        with self._version_lock:
+            if self._version_conn is not None and self._version_pid == os.getpid():
+                self._version_conn.close()
+            self._version_conn = None
+            self._version_seen = None
+
+    @staticmethod
+    def _count_commit(conn):
+        # Called inside every write transaction, so the counter moves
+        # atomically with the data it describes
+        conn.execute(f'UPDATE {COMMITS_TABLE} SET n = n + 1 WHERE id = 1')
+
+    @staticmethod
+    def _count_rewrite(conn, table):
+        # Existing rows changed: derived values can't be extended (lineage)
+        conn.execute(
+            f'INSERT INTO {REWRITES_TABLE} (name, n) VALUES (?, 1) '
+            f'ON CONFLICT(name) DO UPDATE SET n = n + 1',
+            (table.name,)
+        )
+
+    @staticmethod
+    def _quote(identifier):
+        return '"' + identifier.replace('"', '""') + '"'
+
+    def _columns(self, table):
+        return ', '.join(self._quote(header) for header in table.headers)
+
+    def ensure_table(self, table):
+        conn = self._connect()
+        index_name = 'idx_' + table.name + '_key'
+        names = [table.name, index_name] if table.key_columns else [table.name]
+        # Called before every write: only take the write lock if something is missing
+        existing = conn.execute(
+            f"SELECT COUNT(*) FROM sqlite_master WHERE name IN ({', '.join('?' for _ in names)})", names
+        ).fetchone()[0]
+        if existing == len(names):
+            return
+        with conn:
+            self._begin(conn)
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS {self._quote(table.name)} '
+                f'(_rowid INTEGER PRIMARY KEY AUTOINCREMENT, {self._columns(table)})'
+            )
+            if table.key_columns:
+                # Lookups compare CAST(column AS TEXT), so index those expressions
+                expressions = ', '.join(f'CAST({self._quote(col)} AS TEXT)' for col in table.key_columns)
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS {self._quote(index_name)} '
+                    f'ON {self._quote(table.name)} ({expressions})'
+                )
+
+    def table_exists(self, table):
+        row = self._connect().execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table.name,)
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _begin(conn):
+        """BEGIN IMMEDIATE, waiting (cooperatively) while another connection writes"""
+        def try_begin():
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                return True
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                return False
+        _wait_for_lock(try_begin, 'the SQLite write lock')
+
+    def _insert_sql(self, table):
+        placeholders = ', '.join('?' for _ in table.headers)
+        return f'INSERT INTO {self._quote(table.name)} ({self._columns(table)}) VALUES ({placeholders})'
+
+    def _where(self, columns):
+        return ' AND '.join(f'CAST({self._quote(col)} AS TEXT) = ?' for col in columns)
+
+    def append_rows(self, table, rows):
+        self.ensure_table(table)
+        conn = self._connect()
+        with time_storage('sqlite_write'), conn:
+            self._begin(conn)
+            conn.executemany(self._insert_sql(table), [list(row) for row in rows])
+            if table.id_format:
+                numbers = [_id_number(table, row[0]) for row in rows]
+                self._raise_id_counter(conn, table, max((n for n in numbers if n is not None), default=0))
+            self._count_commit(conn)
+        self._writes += 1
+        return len(rows)
+
+    def replace_rows(self, table, rows):
+        self.ensure_table(table)
+        conn = self._connect()
+        with time_storage('sqlite_write'), conn:
+            self._begin(conn)
+            conn.execute(f'DELETE FROM {self._quote(table.name)}')
+            conn.executemany(self._insert_sql(table), [list(row) for row in rows])
+            if table.id_format:
+                # The high-water mark is kept: IDs of the old rows stay retired
+                numbers = [_id_number(table, row[0]) for row in rows]
+                self._raise_id_counter(conn, table, max((n for n in numbers if n is not None), default=0))
+            self._count_rewrite(conn, table)
+            self._count_commit(conn)
+        self._writes += 1
+        return len(rows)
+
+    def insert_unique(self, table, row, key_columns):
+        self.ensure_table(table)
+        conn = self._connect()
+        values = [str(row[table.column_index(col)]) for col in key_columns]
+        with time_storage('sqlite_write'), conn:
+            # IMMEDIATE takes the write lock up front so the existence
+            # check and the insert can't interleave with another writer
+            self._begin(conn)
+            exists = conn.execute(
+                f'SELECT 1 FROM {self._quote(table.name)} WHERE {self._where(key_columns)} LIMIT 1',
+                values
+            ).fetchone()
+            if exists:
+                return False
+
+            row = list(row)
+            if table.id_format:
+                if row[0] is None:
+                    number = self._last_id(conn, table) + 1
+                    row[0] = table.id_format.format(number)
+                else:
+                    number = _id_number(table, row[0]) or 0
+                self._raise_id_counter(conn, table, number)
+            conn.execute(self._insert_sql(table), row)
+            self._count_commit(conn)
+        self._writes += 1
+        return True
+
+    def _last_id(self, conn, table):
+        """
+        Highest ID number ever issued for table (call inside the write transaction)
+
+        Kept in ID_COUNTERS_TABLE and raised in the same transaction as
+        every insert, so deleting the newest row doesn't free its ID. A
+        table without a counter yet (e.g. created by an older version)
+        starts from the highest ID in use.
+        """
+        counter = conn.execute(
+            f'SELECT last_id FROM {ID_COUNTERS_TABLE} WHERE name = ?', (table.name,)
+        ).fetchone()
+        if counter is not None:
+            return counter[0]
+        prefix = table.id_format.split('{', 1)[0]
+        id_column = self._quote(table.headers[0])
+        return conn.execute(
+            f'SELECT MAX(CAST(SUBSTR({id_column}, ?) AS INTEGER)) FROM {self._quote(table.name)} '
+            f'WHERE {id_column} LIKE ?',
+            (len(prefix) + 1, prefix.replace('%', '') + '%')
+        ).fetchone()[0] or 0
+
+    def _raise_id_counter(self, conn, table, number):
+        """Make the table's ID counter at least number (inside the write transaction)"""
+        conn.execute(
+            f'INSERT INTO {ID_COUNTERS_TABLE} (name, last_id) VALUES (?, ?) '
+            f'ON CONFLICT(name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)',
+            (table.name, max(number, self._last_id(conn, table)))
+        )
+
+    def _select(self, table, where='', params=()):
+        if not self.table_exists(table):
+            return []
+        with time_storage('sqlite_query'):
+            cursor = self._connect().execute(
+                f'SELECT {self._columns(table)} FROM {self._quote(table.name)} {where} ORDER BY _rowid',
+                params
+            )
+            return [dict(zip(table.headers, row)) for row in cursor]
+
+    def read_records(self, table):
+        return self._select(table)
+
+    def iter_records(self, table):
+        if not self.table_exists(table):
+            return
+        cursor = self._connect().execute(
+            f'SELECT {self._columns(table)} FROM {self._quote(table.name)} ORDER BY _rowid'
+        )
+        try:
+            for row in cursor:
+                yield dict(zip(table.headers, row))
+        finally:
+            cursor.close()
+
+    def find_records(self, table, match):
+        return self._select(table, f'WHERE {self._where(match)}', [str(v) for v in match.values()])
+
+    def delete_first(self, table, match):
+        if not self.table_exists(table):
+            return False
+        conn = self._connect()
+        with time_storage('sqlite_write'), conn:
+            self._begin(conn)
+            cursor = conn.execute(
+                f'DELETE FROM {self._quote(table.name)} WHERE _rowid = ('
+                f'SELECT _rowid FROM {self._quote(table.name)} WHERE {self._where(match)} '
+                f'ORDER BY _rowid LIMIT 1)',
+                [str(v) for v in match.values()]
+            )
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._count_rewrite(conn, table)
+                self._count_commit(conn)
+        self._writes += 1
+        return deleted
+
+    def count(self, table):
+        if not self.table_exists(table):
+            return 0
+        return self._connect().execute(f'SELECT COUNT(*) FROM {self._quote(table.name)}').fetchone()[0]
+
+    def describe(self, table):
+        return f"{os.path.abspath(self.db_path)} (table '{table.name}')"
+
+    def version(self, table):
+        # File stats can't be trusted here: a WAL commit may leave the size
+        # and (coarse) mtime unchanged. The token is the commit counter kept
+        # in the database, which every process reads the same way, so caches
+        # warmed in the Gunicorn master stay valid in its workers. It is only
+        # re-read when PRAGMA data_version (which moves whenever another
+        # connection commits) or our own write count says something changed
+        if not os.path.exists(self.db_path):
+            return None
+        self._connect()  # creates the counter table in a fresh database
+        with self._version_lock:
+            if self._version_conn is None or self._version_pid != os.getpid():
+                self._version_conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None,
+                                                     check_same_thread=False)
+                self._version_pid = os.getpid()
+                self._version_seen = None
+            seen = (self._version_conn.execute('PRAGMA data_version').fetchone()[0], self._writes)
+            if seen != self._version_seen:
+                self._version_commits = self._version_conn.execute(
+                    f'SELECT n FROM {COMMITS_TABLE} WHERE id = 1'
+                ).fetchone()[0]
+                self._version_seen = seen
+            return self._version_commits
+
+    def lineage(self, table):
+        # Rows are read in _rowid order and AUTOINCREMENT only hands out
+        # higher ones, so anything but a delete_first is an append
+        row = self._connect().execute(
+            f'SELECT n FROM {REWRITES_TABLE} WHERE name = ?', (table.name,)
+        ).fetchone()
+        return row[0] if row else 0
+
+
+def create_storage(backend=None):
+    """Create the storage backend selected by STORAGE_BACKEND"""
+    backend = (backend or STORAGE_BACKEND).lower()
+    if backend == 'sqlite':
+        return SqliteStorage()
+    if backend == 'excel':
+        return ExcelStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected 'excel' or 'sqlite')")
+
+
+def import_excel(storage, table, replace=False):
+    """
+    Copy every row of table's .xlsx file into storage; return the row count
+
+    Refuses (ValueError) if the table already has rows, so running the
+    import twice can't duplicate them. With replace, the existing rows are
+    swapped for the workbook's in one transaction.
+    """
+    if not replace and storage.table_exists(table) and storage.count(table):
+        raise ValueError(f"{storage.describe(table)} already has rows; use --replace to overwrite them")
+    if not os.path.exists(table.excel_path):
+        return 0
+    from openpyxl import load_workbook
+    wb = load_workbook(table.excel_path, read_only=True)
+    try:
+        rows = [
+            list(row) for row in wb[table.sheet_name].iter_rows(min_row=2, values_only=True)
+            if any(cell is not None for cell in row)
+        ]
+    finally:
+        wb.close()
+    storage.ensure_table(table)
+    if replace:
+        return storage.replace_rows(table, rows)
+    return storage.append_rows(table, rows) if rows else 0
+
+
+def export_excel(storage, table, path=None):
+    """Write every row of table from storage to an .xlsx file"""
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(table.sheet_name)
+    ws.append(table.headers)
+    count = 0
+    for record in storage.read_records(table):
+        ws.append([record.get(header) for header in table.headers])
+        count += 1
+    wb.save(path or table.excel_path)
+    return count
+
+
+def main(argv):
+    """Copy the Excel tables into SQLite or back out again"""
+    if argv[1:] not in (['import'], ['import', '--replace'], ['export']):
+        print("Usage: python storage.py import [--replace] | export")
+        return 1
+    replace = '--replace' in argv
+
+    from tables import HOTEL_TABLE, ROOM_TABLE, WISHLIST_TABLE
+
+    sqlite_storage = SqliteStorage()
+    tables = (HOTEL_TABLE, ROOM_TABLE, WISHLIST_TABLE)
+    if argv[1] == 'import' and not replace:
+        # Check every table first rather than stopping halfway through
+        filled = [table for table in tables if sqlite_storage.table_exists(table) and sqlite_storage.count(table)]
+        if filled:
+            names = ', '.join(sqlite_storage.describe(table) for table in filled)
+            print(f"❌ Not importing, these tables already have rows: {names}. Importing again "
+                  f"would duplicate them; use `python storage.py import --replace` to overwrite.")
+            return 1
+    for table in tables:
+        if argv[1] == 'import':
+            count = import_excel(sqlite_storage, table, replace)
+            print(f"📥 Imported {count} rows from {table.excel_path} into {sqlite_storage.describe(table)}")
+        else:
+            count = export_excel(sqlite_storage, table)
+            print(f"📤 Exported {count} rows from {sqlite_storage.describe(table)} to {table.excel_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
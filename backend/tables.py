@@ -0,0 +1,40 @@
+"""
+Table definitions for the hotel, room and wishlist tables
+
+Kept apart from app.py so the Gunicorn master can create the storage
+files before forking without importing the Flask app (see on_starting in
+gunicorn.conf.py).
+"""
+
+from storage import TableSpec
+
+# Hotel configuration
+HOTEL_EXCEL_FILE_PATH = 'hotels.xlsx'
+HOTEL_SHEET_NAME = 'Hotels'
+HOTEL_HEADERS = ['Hotel Code', 'Name', 'Rating', 'Address', 'City ID', 'Country Code', 
+                 'Latitude', 'Longitude', 'Facilities', 'Images', 'Created At']
+
+# Room configuration
+ROOM_EXCEL_FILE_PATH = 'hotel_rooms.xlsx'
+ROOM_SHEET_NAME = 'Rooms'
+ROOM_HEADERS = ['Room ID', 'Hotel Code', 'Booking Code', 'Room Name', 'Base Price', 
+                'Total Fare', 'Currency', 'Is Refundable', 'Day Rates', 'Extras', 'Created At']
+
+# Wishlist configuration
+WISHLIST_EXCEL_FILE_PATH = 'wishlist.xlsx'
+WISHLIST_SHEET_NAME = 'Wishlist'
+WISHLIST_HEADERS = ['Wishlist ID', 'Customer ID', 'Hotel Code', 'Hotel Name', 'Hotel Rating', 
+                    'Address', 'City', 'Country', 'Price', 'Currency', 'Image URL', 'Search Params', 'Created At']
+
+HOTEL_TABLE = TableSpec('hotels', HOTEL_EXCEL_FILE_PATH, HOTEL_SHEET_NAME, HOTEL_HEADERS)
+ROOM_TABLE = TableSpec('rooms', ROOM_EXCEL_FILE_PATH, ROOM_SHEET_NAME, ROOM_HEADERS)
+WISHLIST_TABLE = TableSpec('wishlist', WISHLIST_EXCEL_FILE_PATH, WISHLIST_SHEET_NAME, WISHLIST_HEADERS,
+                           id_format='WL{:05d}', key_columns=('Customer ID', 'Hotel Code'))
+
+ALL_TABLES = (HOTEL_TABLE, ROOM_TABLE, WISHLIST_TABLE)
+
+
+def ensure_tables(storage):
+    """Create any table (and its file) that doesn't exist yet"""
+    for table in ALL_TABLES:
+        storage.ensure_table(table)
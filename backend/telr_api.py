@@ -7,9 +7,19 @@ All Telr API calls should go through this backend proxy.
 
 from flask import Blueprint, request, jsonify
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError
+from urllib3.util.timeout import Timeout
 import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from telr_status_cache import status_cache
+from telr_circuit import telr_circuit, CircuitOpenError, TELR_MAX_IN_FLIGHT
+import metrics
+from log_config import configure_logging, sampled
+from payment_ledger import ledger, status_from_telr_code, FINAL_STATUSES, PAID
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,12 +27,12 @@ load_dotenv()
 # Create blueprint
 telr_api_bp = Blueprint('telr_api', __name__)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queued, written from a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Telr API endpoint
-TELR_API_URL = 'https://secure.telr.com/gateway/order.json'
+# Telr API endpoint (overridable to point benchmarks at a local stub)
+TELR_API_URL = os.getenv('TELR_API_URL', 'https://secure.telr.com/gateway/order.json')
 
 # Get Telr credentials from environment variables
 TELR_TEST_STORE_ID = os.getenv('TELR_TEST_STORE_ID', '')
@@ -31,11 +41,140 @@ TELR_LIVE_STORE_ID = os.getenv('TELR_LIVE_STORE_ID', '')
 TELR_LIVE_AUTH_KEY = os.getenv('TELR_LIVE_AUTH_KEY', '')
 TELR_USE_TEST_MODE = os.getenv('TELR_USE_TEST_MODE', 'true').lower() == 'true'
 
+# HTTP client tuning
+TELR_CONNECT_TIMEOUT = float(os.getenv('TELR_CONNECT_TIMEOUT', '5'))
+TELR_READ_TIMEOUT = float(os.getenv('TELR_READ_TIMEOUT', '20'))
+# Total time for one Telr call including retries. By default it ends 5s
+# before Gunicorn's worker timeout (exported by gunicorn.conf.py)
+TELR_CALL_DEADLINE = float(os.getenv('TELR_CALL_DEADLINE',
+                                     str(max(1.0, float(os.getenv('GUNICORN_TIMEOUT', '30')) - 5))))
+# Enough pooled connections for every call the bulkhead lets through
+TELR_POOL_SIZE = int(os.getenv('TELR_POOL_SIZE', str(max(10, TELR_MAX_IN_FLIGHT))))
+TELR_CHECK_RETRIES = int(os.getenv('TELR_CHECK_RETRIES', '3'))
+TELR_CREATE_RETRIES = 2
+TELR_RETRY_BACKOFF = float(os.getenv('TELR_RETRY_BACKOFF', '0.3'))
+TELR_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
 # Log what we loaded (without exposing sensitive data)
-logger.info(f"🔐 Telr credentials loaded:")
-logger.info(f"  - Test Store ID: {'✅ ' + TELR_TEST_STORE_ID[:5] + '...' if TELR_TEST_STORE_ID else '❌ MISSING'}")
-logger.info(f"  - Test Auth Key: {'✅ Present' if TELR_TEST_AUTH_KEY else '❌ MISSING'}")
-logger.info(f"  - Use Test Mode: {TELR_USE_TEST_MODE}")
+logger.info("🔐 Telr credentials loaded: test store id %s, test auth key %s, test mode %s",
+            '✅ ' + TELR_TEST_STORE_ID[:5] + '...' if TELR_TEST_STORE_ID else '❌ MISSING',
+            '✅ present' if TELR_TEST_AUTH_KEY else '❌ MISSING',
+            TELR_USE_TEST_MODE)
+
+
+# The session is created lazily per process (Gunicorn forks workers, and
+# pooled sockets must not be shared across a fork)
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def _build_session():
+    """Create a keep-alive session with a connection pool to Telr"""
+    session = requests.Session()
+    # No adapter retries: post_to_telr retries itself, within the call's deadline
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=TELR_POOL_SIZE, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.headers.update({'Content-Type': 'application/json'})
+    return session
+
+
+def get_telr_session():
+    """Get this worker's pooled session for Telr API calls"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            _session = _build_session()
+            _session_pid = os.getpid()
+        return _session
+
+
+def telr_timeout(deadline):
+    """Timeout for one attempt: the usual connect/read limits, but never past deadline"""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise requests.exceptions.Timeout(f'Telr call exceeded its {TELR_CALL_DEADLINE:g}s deadline')
+    return Timeout(connect=TELR_CONNECT_TIMEOUT, read=TELR_READ_TIMEOUT, total=remaining)
+
+
+def _never_sent(error):
+    """True if a ConnectionError means no connection was made, so Telr never saw the request"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    # NewConnectionError (refused, DNS failure) is a ConnectTimeoutError too
+    return isinstance(reason, ConnectTimeoutError)
+
+
+def _backoff(attempt, deadline):
+    """Sleep before retry number attempt + 1; False if that would pass the deadline"""
+    delay = TELR_RETRY_BACKOFF * 2 ** attempt
+    if time.monotonic() + delay >= deadline:
+        return False
+    time.sleep(delay)
+    return True
+
+
+def post_to_telr(telr_payload, idempotent=False):
+    """
+    POST a request to Telr through the circuit breaker; returns the parsed response
+
+    The whole call - waiting for a bulkhead slot, every attempt and the
+    backoff in between - ends within TELR_CALL_DEADLINE seconds. Requests
+    that never reached Telr are retried. Idempotent calls ('check') are
+    also retried on dropped connections and 429/5xx responses; 'create'
+    must not be sent twice. Read timeouts are never retried: a retry
+    would wait for the same slow gateway all over again.
+    """
+    deadline = time.monotonic() + TELR_CALL_DEADLINE
+    retries = TELR_CHECK_RETRIES if idempotent else TELR_CREATE_RETRIES
+
+    def send():
+        for attempt in range(retries + 1):
+            last = attempt == retries
+            try:
+                response = get_telr_session().post(
+                    TELR_API_URL,
+                    json=telr_payload,
+                    timeout=telr_timeout(deadline)
+                )
+            except requests.exceptions.ConnectionError as e:
+                if last or not (idempotent or _never_sent(e)) or not _backoff(attempt, deadline):
+                    raise
+                continue
+            if (idempotent and response.status_code in TELR_RETRY_STATUSES
+                    and not last and _backoff(attempt, deadline)):
+                response.close()
+                continue
+            response.raise_for_status()
+            return response.json()
+    
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        result = telr_circuit.call(send, deadline=deadline)
+        outcome = 'ok'
+        return result
+    except CircuitOpenError:
+        outcome = 'rejected'
+        raise
+    finally:
+        metrics.observe('telr_request_duration_seconds', time.perf_counter() - started, phase='telr',
+                        method=telr_payload.get('method'), outcome=outcome)
+
+
+def circuit_open_response(e):
+    """503 response for a call rejected by the circuit breaker"""
+    logger.warning("🚧 Telr call rejected: %s", e, extra={'retry_after': e.retry_after})
+    response = jsonify({
+        'success': False,
+        'error': 'Payment gateway is temporarily unavailable. Please try again shortly.'
+    })
+    response.status_code = 503
+    if e.retry_after is not None:
+        response.headers['Retry-After'] = str(max(1, int(e.retry_after + 0.999)))
+    return response
 
 
 def get_telr_credentials():
@@ -68,15 +207,15 @@ def create_telr_order():
     try:
         data = request.get_json()
         
-        logger.info(f"📥 Received create order request for cart: {data.get('cartId')}")
+        logger.info("📥 Received create order request for cart: %s", data.get('cartId'),
+                    extra=sampled('telr.create.received', cart_id=data.get('cartId')))
         
         # Get credentials
         creds = get_telr_credentials()
         
         if not creds['store_id'] or not creds['auth_key']:
-            logger.error("❌ Telr credentials not configured in backend/.env file")
-            logger.error(f"Store ID: {'✅' if creds['store_id'] else '❌ MISSING'}")
-            logger.error(f"Auth Key: {'✅' if creds['auth_key'] else '❌ MISSING'}")
+            logger.error("❌ Telr credentials not configured in backend/.env file (store id %s, auth key %s)",
+                         '✅' if creds['store_id'] else '❌ MISSING', '✅' if creds['auth_key'] else '❌ MISSING')
             return jsonify({
                 'success': False,
                 'error': 'Telr credentials not configured on server. Please create backend/.env file with TELR_TEST_STORE_ID and TELR_TEST_AUTH_KEY.'
@@ -118,44 +257,111 @@ def create_telr_order():
             }
         }
         
-        logger.info(f"📤 Sending request to Telr API (test mode: {TELR_USE_TEST_MODE})")
-        logger.debug(f"Payload: {telr_payload}")
+        logger.info("📤 Sending request to Telr API (test mode: %s)", TELR_USE_TEST_MODE,
+                    extra=sampled('telr.create.sending'))
+        # Never log the payload itself: it carries the store auth key
         
         # Make request to Telr
-        response = requests.post(
-            TELR_API_URL,
-            json=telr_payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
+        telr_response = post_to_telr(telr_payload)
         
-        response.raise_for_status()
-        telr_response = response.json()
+        logger.info("✅ Telr order created: %s", telr_response.get('order', {}).get('ref'),
+                    extra={'cart_id': data.get('cartId'), 'order_ref': telr_response.get('order', {}).get('ref')})
         
-        logger.info(f"✅ Telr order created successfully")
-        logger.info(f"Order ref: {telr_response.get('order', {}).get('ref')}")
+        # Track the payment locally; the order exists at Telr either way
+        order_ref = telr_response.get('order', {}).get('ref')
+        if order_ref and data.get('cartId'):
+            try:
+                ledger.record_order(data.get('cartId'), order_ref, data.get('amount'), data.get('currency'))
+            except Exception as e:
+                logger.error("Failed to record order %s in payment ledger: %s", order_ref, e)
         
         return jsonify({
             'success': True,
             'data': telr_response
         }), 200
         
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
+        
     except requests.exceptions.RequestException as e:
-        logger.error(f"❌ Error calling Telr API: {str(e)}")
+        logger.error("❌ Error calling Telr API: %s", e)
         return jsonify({
             'success': False,
             'error': f'Failed to communicate with Telr: {str(e)}'
         }), 500
         
     except Exception as e:
-        logger.error(f"💥 Error creating Telr order: {str(e)}")
-        logger.exception(e)
+        logger.exception("💥 Error creating Telr order: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+def fetch_telr_status(order_ref):
+    """Call Telr's 'check' method for order_ref and return the parsed response"""
+    creds = get_telr_credentials()
+    
+    # Build Telr status check request
+    telr_payload = {
+        'method': 'check',
+        'store': creds['store_id'],
+        'authkey': creds['auth_key'],
+        'order': {
+            'ref': order_ref
+        }
+    }
+    
+    logger.info("📤 Sending status check request to Telr", extra=sampled('telr.check.sending', order_ref=order_ref))
+    
+    # Make request to Telr (retried with backoff, 'check' is idempotent)
+    return post_to_telr(telr_payload, idempotent=True)
+
+
+def fetch_order_status(order_ref):
+    """
+    Status for order_ref from the payment ledger if it has settled,
+    otherwise from Telr (recording any final status in the ledger)
+    """
+    payment = ledger.get_by_order_ref(order_ref)
+    # Only record_telr_status() stores telr_response, so this is Telr's own
+    # answer, never a webhook payload
+    if payment and payment['status'] in FINAL_STATUSES and payment['details'].get('telr_response'):
+        return payment['details']['telr_response']
+    
+    telr_response = fetch_telr_status(order_ref)
+    record_telr_status(order_ref, telr_response, payment)
+    return telr_response
+
+
+def record_telr_status(order_ref, telr_response, payment=None):
+    """Write a final Telr status for order_ref to the payment ledger"""
+    order = telr_response.get('order', {})
+    status = status_from_telr_code(order.get('status', {}).get('code'))
+    if status is None:
+        return
+    
+    payment = payment or ledger.get_by_order_ref(order_ref)
+    cart_id = payment['cart_id'] if payment else order.get('cartid')
+    if not cart_id:
+        return
+    
+    try:
+        if payment is None and ledger.get_by_cart(cart_id) is None:
+            # An order created before the ledger existed; Telr vouches for it
+            ledger.record_order(cart_id, order_ref, order.get('amount'), order.get('currency'))
+        ledger.transition(cart_id, status, {
+            'telr_order_ref': order_ref,
+            'transaction_ref': order.get('transaction', {}).get('ref'),
+            'amount': order.get('amount'),
+            'currency': order.get('currency'),
+            'telr_response': telr_response,
+            'source': 'telr_check'
+        })
+    except Exception as e:
+        logger.error("Failed to record status for order %s in payment ledger: %s", order_ref, e)
+
+
 @telr_api_bp.route('/api/telr/check-status', methods=['POST'])
 def check_telr_status():
     """
@@ -174,7 +380,7 @@ def check_telr_status():
                 'error': 'Order reference is required'
             }), 400
         
-        logger.info(f"🔍 Checking status for order: {order_ref}")
+        logger.info("🔍 Checking status for order: %s", order_ref, extra=sampled('telr.check.received'))
         
         # Get credentials
         creds = get_telr_credentials()
@@ -186,55 +392,81 @@ def check_telr_status():
                 'error': 'Telr payment gateway is not configured on the server.'
             }), 500
         
-        # Build Telr status check request
-        telr_payload = {
-            'method': 'check',
-            'store': creds['store_id'],
-            'authkey': creds['auth_key'],
-            'order': {
-                'ref': order_ref
-            }
-        }
-        
-        logger.info(f"📤 Sending status check request to Telr")
-        
-        # Make request to Telr
-        response = requests.post(
-            TELR_API_URL,
-            json=telr_payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
-        
-        response.raise_for_status()
-        telr_response = response.json()
+        # Served from the status cache when possible; concurrent polls for
+        # the same order share a single upstream call
+        telr_response, from_cache = status_cache.get_or_fetch(order_ref, fetch_order_status)
         
         status_code = telr_response.get('order', {}).get('status', {}).get('code')
         status_text = telr_response.get('order', {}).get('status', {}).get('text')
         
-        logger.info(f"✅ Status retrieved: {status_text} ({status_code})")
+        logger.info("✅ Status retrieved%s: %s (%s)", ' (cached)' if from_cache else '', status_text, status_code,
+                    extra=sampled('telr.check.retrieved', order_ref=order_ref, status_code=status_code))
         
         return jsonify({
             'success': True,
             'data': telr_response
         }), 200
         
+    except CircuitOpenError as e:
+        return circuit_open_response(e)
+        
     except requests.exceptions.RequestException as e:
-        logger.error(f"❌ Error calling Telr API: {str(e)}")
+        logger.error("❌ Error calling Telr API: %s", e)
         return jsonify({
             'success': False,
             'error': f'Failed to communicate with Telr: {str(e)}'
         }), 500
         
     except Exception as e:
-        logger.error(f"💥 Error checking Telr status: {str(e)}")
-        logger.exception(e)
+        logger.exception("💥 Error checking Telr status: %s", e)
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 
+@telr_api_bp.route('/api/telr/payment/<cart_id>', methods=['GET'])
+def get_payment(cart_id):
+    """Get the locally recorded payment status for a booking"""
+    try:
+        payment = ledger.get_by_cart(cart_id)
+        if payment is None:
+            return jsonify({
+                'success': False,
+                'error': 'Payment not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'cartId': payment['cart_id'],
+                'orderRef': payment['order_ref'],
+                'transactionRef': payment['transaction_ref'],
+                'status': payment['status'],
+                'paid': payment['status'] == PAID,
+                'amount': payment['amount'],
+                'currency': payment['currency'],
+                'updatedAt': payment['updated_at']
+            }
+        }), 200
+        
+    except Exception as e:
+        logger.error("💥 Error reading payment ledger: %s", e)
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@telr_api_bp.route('/api/telr/circuit', methods=['GET'])
+def get_circuit_state():
+    """Get this worker's Telr circuit breaker state"""
+    return jsonify({
+        'success': True,
+        'data': telr_circuit.snapshot()
+    }), 200
+
+
 # Export blueprint
 __all__ = ['telr_api_bp']
 
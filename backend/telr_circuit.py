@@ -0,0 +1,193 @@
+"""
+Circuit breaker and bulkhead for calls to the Telr gateway
+
+If Telr slows down or starts failing, every request waiting on it holds a
+worker thread for up to the full timeout. The breaker records the outcome
+and latency of each call over a rolling window:
+
+- closed: calls go through. Once at least TELR_CIRCUIT_MIN_CALLS calls in
+  the last TELR_CIRCUIT_WINDOW seconds have a failure rate of at least
+  TELR_CIRCUIT_ERROR_RATE, the circuit opens. Calls slower than
+  TELR_CIRCUIT_SLOW_CALL count as failures.
+- open: calls fail immediately with CircuitOpenError for
+  TELR_CIRCUIT_OPEN_SECONDS.
+- half_open: up to TELR_CIRCUIT_PROBES probe calls are let through. A
+  successful probe closes the circuit, a failed one re-opens it.
+
+Independently of the circuit state, at most TELR_MAX_IN_FLIGHT calls per
+worker may wait on Telr at once, by default as many as the worker serves
+concurrently (its threads; up to 100 of a gevent worker's greenlets).
+Extra calls queue for a free slot for at most TELR_BULKHEAD_WAIT seconds
+(and never past the caller's deadline), then fail with CircuitOpenError.
+
+State is per worker process; each Gunicorn worker trips on its own.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+TELR_CIRCUIT_WINDOW = float(os.getenv('TELR_CIRCUIT_WINDOW', '30'))
+TELR_CIRCUIT_MIN_CALLS = int(os.getenv('TELR_CIRCUIT_MIN_CALLS', '10'))
+TELR_CIRCUIT_ERROR_RATE = float(os.getenv('TELR_CIRCUIT_ERROR_RATE', '0.5'))
+TELR_CIRCUIT_SLOW_CALL = float(os.getenv('TELR_CIRCUIT_SLOW_CALL', '5'))
+TELR_CIRCUIT_OPEN_SECONDS = float(os.getenv('TELR_CIRCUIT_OPEN_SECONDS', '30'))
+TELR_CIRCUIT_PROBES = int(os.getenv('TELR_CIRCUIT_PROBES', '1'))
+# Requests a worker serves at once, exported by gunicorn.conf.py. The
+# bulkhead defaults to that, up to 100 (a gevent worker may hold 1000)
+WORKER_CONCURRENCY = int(os.getenv('GUNICORN_WORKER_CONCURRENCY', '4'))
+TELR_MAX_IN_FLIGHT = int(os.getenv('TELR_MAX_IN_FLIGHT', str(min(WORKER_CONCURRENCY, 100))))
+TELR_BULKHEAD_WAIT = float(os.getenv('TELR_BULKHEAD_WAIT', '2'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Telr while the circuit is open or saturated"""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def is_upstream_failure(error):
+    """True if error says Telr is unhealthy (not just that our request was bad)"""
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        code = error.response.status_code
+        return code >= 500 or code == 429
+    return isinstance(error, requests.exceptions.RequestException)
+
+
+class CircuitBreaker:
+    """Rolling-window circuit breaker with half-open probes and a bulkhead"""
+
+    def __init__(self, window=TELR_CIRCUIT_WINDOW, min_calls=TELR_CIRCUIT_MIN_CALLS,
+                 error_rate=TELR_CIRCUIT_ERROR_RATE, slow_call=TELR_CIRCUIT_SLOW_CALL,
+                 open_seconds=TELR_CIRCUIT_OPEN_SECONDS, probes=TELR_CIRCUIT_PROBES,
+                 max_in_flight=TELR_MAX_IN_FLIGHT, max_wait=TELR_BULKHEAD_WAIT):
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.open_seconds = open_seconds
+        self.probes = probes
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.state = CLOSED
+        self.opened_at = None
+        self._calls = deque()  # (finished_at, failed, latency)
+        self._probes_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._slot_free = threading.Condition(self._lock)
+
+    def _trim(self, now):
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def _open(self, now):
+        self.state = OPEN
+        self.opened_at = now
+        self._calls.clear()
+
+    def _acquire(self, deadline=None):
+        """Admit a call; returns True if it is a half-open probe"""
+        wait_until = time.monotonic() + self.max_wait
+        if deadline is not None:
+            wait_until = min(wait_until, deadline)
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                if self.state == OPEN:
+                    remaining = self.opened_at + self.open_seconds - now
+                    if remaining > 0:
+                        raise CircuitOpenError('Telr gateway circuit is open', retry_after=remaining)
+                if self._in_flight < self.max_in_flight:
+                    break
+                # Queue for a bulkhead slot, bounded by max_wait and the deadline
+                if now >= wait_until:
+                    raise CircuitOpenError('Too many Telr requests in flight', retry_after=1)
+                self._slot_free.wait(wait_until - now)
+            if self.state == OPEN:
+                self.state = HALF_OPEN
+            probe = self.state == HALF_OPEN
+            if probe and self._probes_in_flight >= self.probes:
+                raise CircuitOpenError('Telr gateway circuit is half-open, probe in progress',
+                                       retry_after=1)
+            self._in_flight += 1
+            if probe:
+                self._probes_in_flight += 1
+            return probe
+
+    def _release(self, probe, failed, latency):
+        now = time.monotonic()
+        with self._lock:
+            self._in_flight -= 1
+            self._slot_free.notify()
+            if probe:
+                self._probes_in_flight -= 1
+                if failed:
+                    self._open(now)
+                else:
+                    self.state = CLOSED
+                    self.opened_at = None
+                    self._calls.clear()
+                return
+            if self.state != CLOSED:
+                return
+            self._calls.append((now, failed, latency))
+            self._trim(now)
+            if len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, f, _ in self._calls if f)
+                if failures / len(self._calls) >= self.error_rate:
+                    self._open(now)
+
+    def call(self, func, *args, deadline=None, **kwargs):
+        """
+        Run func through the breaker, recording its outcome and latency
+
+        deadline (a time.monotonic() value) bounds the wait for a bulkhead slot.
+        """
+        probe = self._acquire(deadline)
+        started = time.monotonic()
+        failed = True
+        try:
+            result = func(*args, **kwargs)
+            failed = time.monotonic() - started > self.slow_call
+            return result
+        except Exception as e:
+            failed = is_upstream_failure(e)
+            raise
+        finally:
+            self._release(probe, failed, time.monotonic() - started)
+
+    def snapshot(self):
+        """Current state and window statistics"""
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = len(self._calls)
+            failures = sum(1 for _, f, _ in self._calls if f)
+            latencies = sorted(latency for _, _, latency in self._calls)
+            retry_after = None
+            if self.state == OPEN:
+                retry_after = max(0.0, self.opened_at + self.open_seconds - now)
+            return {
+                'state': self.state,
+                'calls': calls,
+                'failures': failures,
+                'failureRate': round(failures / calls, 3) if calls else 0.0,
+                'p95LatencyMs': round(latencies[int(0.95 * (calls - 1))] * 1000, 1) if calls else None,
+                'inFlight': self._in_flight,
+                'maxInFlight': self.max_in_flight,
+                'retryAfter': round(retry_after, 1) if retry_after is not None else None,
+                'pid': os.getpid()
+            }
+
+
+telr_circuit = CircuitBreaker()
@@ -0,0 +1,156 @@
+"""
+Telr payment reconciliation job
+
+Finds payments the ledger still has as pending - orders whose webhook
+never arrived or was lost - and asks Telr for their current status. Checks
+run on a small thread pool sharing the pooled, retrying 'check' session
+from telr_api, throttled by a token bucket so a large backlog doesn't
+trip Telr's rate limits. Final statuses are written back to the ledger in
+one transaction per run; orders that are still pending are marked as
+checked so the next run moves on to others.
+
+Usage (cron / systemd timer / one-off):
+    python telr_reconciler.py                # one pass
+    python telr_reconciler.py --interval 300 # keep running every 5 minutes
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import telr_api
+from payment_ledger import ledger, status_from_telr_code
+from telr_circuit import telr_circuit
+from telr_status_cache import status_cache
+
+logger = logging.getLogger(__name__)
+
+TELR_RECONCILE_CONCURRENCY = int(os.getenv('TELR_RECONCILE_CONCURRENCY', str(min(4, telr_api.TELR_POOL_SIZE))))
+TELR_RECONCILE_RATE = float(os.getenv('TELR_RECONCILE_RATE', '5'))
+TELR_RECONCILE_MIN_AGE = float(os.getenv('TELR_RECONCILE_MIN_AGE', '600'))
+TELR_RECONCILE_BATCH = int(os.getenv('TELR_RECONCILE_BATCH', '500'))
+
+
+class RateLimiter:
+    """Token bucket: at most rate acquisitions per second, bursts up to burst"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def check_payment(payment, limiter):
+    """Fetch the Telr status for one pending payment; returns (payment, response)"""
+    limiter.acquire()
+    return payment, telr_api.fetch_telr_status(payment['order_ref'])
+
+
+def reconcile(min_age=TELR_RECONCILE_MIN_AGE, limit=TELR_RECONCILE_BATCH,
+              concurrency=TELR_RECONCILE_CONCURRENCY, rate=TELR_RECONCILE_RATE):
+    """
+    Run one reconciliation pass
+
+    Returns a dict of counts: checked, settled, still_pending, errors.
+    Checks go through the Telr circuit breaker, whose bulkhead rejects
+    calls beyond its in-flight limit, so concurrency is capped at that.
+    """
+    stats = {'checked': 0, 'settled': 0, 'still_pending': 0, 'errors': 0}
+    payments = [p for p in ledger.pending(older_than=min_age, limit=limit) if p['order_ref']]
+    if not payments:
+        return stats
+
+    if concurrency > telr_circuit.max_in_flight:
+        logger.warning("⚠️ Reconcile concurrency %d capped at TELR_MAX_IN_FLIGHT=%d",
+                       concurrency, telr_circuit.max_in_flight)
+        concurrency = telr_circuit.max_in_flight
+
+    logger.info("🔄 Reconciling %d pending payment(s) with Telr", len(payments))
+    limiter = RateLimiter(rate)
+    transitions = []
+    unchanged = []
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        futures = [pool.submit(check_payment, payment, limiter) for payment in payments]
+        for payment, future in zip(payments, futures):
+            try:
+                _, telr_response = future.result()
+            except Exception as e:
+                stats['errors'] += 1
+                logger.warning("⚠️ Status check failed for order %s: %s", payment['order_ref'], e)
+                continue
+
+            stats['checked'] += 1
+            order = telr_response.get('order', {})
+            status = status_from_telr_code(order.get('status', {}).get('code'))
+            if status is None:
+                unchanged.append(payment['cart_id'])
+                continue
+
+            status_cache.store(payment['order_ref'], telr_response)
+            transitions.append((payment['cart_id'], status, {
+                'telr_order_ref': payment['order_ref'],
+                'transaction_ref': order.get('transaction', {}).get('ref'),
+                'amount': order.get('amount'),
+                'currency': order.get('currency'),
+                'telr_response': telr_response,
+                'source': 'reconciler'
+            }))
+
+    if transitions:
+        stats['settled'] = sum(1 for applied in ledger.apply_transitions(transitions) if applied)
+    if unchanged:
+        ledger.touch(unchanged)
+
+    stats['still_pending'] = len(unchanged)
+    logger.info("✅ Reconciliation done", extra=stats)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Reconcile pending Telr payments with Telr')
+    parser.add_argument('--min-age', type=float, default=TELR_RECONCILE_MIN_AGE,
+                        help='only check payments pending for at least this many seconds')
+    parser.add_argument('--limit', type=int, default=TELR_RECONCILE_BATCH,
+                        help='maximum payments to check per pass')
+    parser.add_argument('--concurrency', type=int, default=TELR_RECONCILE_CONCURRENCY,
+                        help='parallel status checks (at most TELR_MAX_IN_FLIGHT)')
+    parser.add_argument('--rate', type=float, default=TELR_RECONCILE_RATE,
+                        help='maximum status checks per second (0 = unlimited)')
+    parser.add_argument('--interval', type=float, default=0,
+                        help='repeat every N seconds instead of running once')
+    args = parser.parse_args()
+
+    creds = telr_api.get_telr_credentials()
+    if not creds['store_id'] or not creds['auth_key']:
+        logger.error("❌ Telr credentials not configured")
+        return 1
+
+    while True:
+        stats = reconcile(args.min_age, args.limit, args.concurrency, args.rate)
+        if not args.interval:
+            return 1 if stats['errors'] and not stats['checked'] else 0
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+"""
+Telr order status cache
+
+The payment return page polls /api/telr/check-status for the same order
+until it settles. This cache keeps the last Telr response per order ref:
+
+- Terminal statuses (3 authorised, 2 declined, -1 cancelled) never change,
+  so they are kept until evicted by size
+- Anything else (pending, on hold, ...) is kept for a short TTL
+
+Concurrent lookups for the same order ref are coalesced: one caller
+fetches from Telr while the others wait for its result.
+
+Two sources are stored: responses from Telr's own check API, and webhook
+payloads whose signature verified (telr_webhook.py), which carry the same
+order object. Unverified webhook deliveries are never stored; the handler
+calls invalidate() instead, so the next poll asks Telr again rather than
+trusting the payload.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+TERMINAL_STATUS_CODES = {3, 2, -1}
+
+TELR_STATUS_CACHE_TTL = float(os.getenv('TELR_STATUS_CACHE_TTL', '5'))
+TELR_STATUS_CACHE_SIZE = int(os.getenv('TELR_STATUS_CACHE_SIZE', '10000'))
+
+
+def status_code_of(telr_response):
+    """Extract the integer status code from a Telr order response, if any"""
+    code = (telr_response or {}).get('order', {}).get('status', {}).get('code')
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+class _Flight:
+    """An in-progress upstream lookup that other callers can wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TelrStatusCache:
+    """Per-worker LRU of Telr order responses with single-flight fetches"""
+
+    def __init__(self, ttl=TELR_STATUS_CACHE_TTL, max_size=TELR_STATUS_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()  # order_ref -> (expires_at or None, response)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, order_ref):
+        """Return the cached response for order_ref, or None if missing/expired"""
+        with self._lock:
+            entry = self._entries.get(order_ref)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._entries[order_ref]
+                return None
+            self._entries.move_to_end(order_ref)
+            return response
+
+    def store(self, order_ref, telr_response):
+        """Cache a Telr order response from a 'check' call or a verified webhook"""
+        if not order_ref:
+            return
+        terminal = status_code_of(telr_response) in TERMINAL_STATUS_CODES
+        expires_at = None if terminal else time.monotonic() + self.ttl
+        with self._lock:
+            current = self._entries.get(order_ref)
+            # Never replace a final status with a stale pending one
+            if current is not None and current[0] is None and not terminal:
+                return
+            self._entries[order_ref] = (expires_at, telr_response)
+            self._entries.move_to_end(order_ref)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, order_ref):
+        """Drop the cached response for order_ref, so the next lookup asks Telr"""
+        with self._lock:
+            self._entries.pop(order_ref, None)
+
+    def get_or_fetch(self, order_ref, fetch):
+        """
+        Return (response, from_cache) for order_ref
+
+        On a miss, exactly one caller runs fetch(order_ref); concurrent
+        callers for the same ref wait for and share its result (or error).
+        """
+        cached = self.get(order_ref)
+        if cached is not None:
+            return cached, True
+
+        with self._lock:
+            flight = self._flights.get(order_ref)
+            leader = flight is None
+            if leader:
+                flight = self._flights[order_ref] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fetch(order_ref)
+            self.store(order_ref, flight.result)
+            return flight.result, False
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(order_ref, None)
+            flight.done.set()
+
+
+# Shared by telr_api (status checks) and telr_webhook (invalidation)
+status_cache = TelrStatusCache()
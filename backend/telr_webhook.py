@@ -4,143 +4,243 @@ Telr Payment Gateway Webhook Handler
 This handles asynchronous payment notifications from Telr.
 Configure this endpoint in your Telr dashboard.
 
+Deliveries are journaled (see webhook_queue.py) and acknowledged at once;
+processing happens in a background consumer with retries.
+
+With TELR_WEBHOOK_SECRET set, deliveries must carry a valid HMAC-SHA256
+signature of the raw body in TELR_WEBHOOK_SIGNATURE_HEADER and are
+settled from their payload. Without it, a delivery is only a hint: the
+order's status is confirmed with a Telr 'check' call before anything is
+settled.
+
 Endpoint: /api/telr/webhook
 Method: POST
 """
 
 from flask import Blueprint, request, jsonify
+import hashlib
+import hmac
 import logging
 import json
+import os
 from datetime import datetime
+from telr_status_cache import status_cache
+import webhook_queue
+from payment_ledger import ledger, status_from_telr_code, PAID, FAILED, CANCELLED
+from log_config import configure_logging
 
 # Create blueprint for Telr webhooks
 telr_webhook_bp = Blueprint('telr_webhook', __name__)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queued, written from a background thread)
+configure_logging()
 logger = logging.getLogger(__name__)
 
+TELR_WEBHOOK_SECRET = os.getenv('TELR_WEBHOOK_SECRET', '')
+TELR_WEBHOOK_SIGNATURE_HEADER = os.getenv('TELR_WEBHOOK_SIGNATURE_HEADER', 'X-Telr-Signature')
+
 @telr_webhook_bp.route('/api/telr/webhook', methods=['POST'])
 def handle_telr_webhook():
     """
     Handle Telr payment webhook notifications
     
-    Telr sends payment status updates to this endpoint.
-    Process the notification and update order status accordingly.
+    The raw payload is appended to the durable webhook journal and
+    acknowledged right away; process_webhook_event() runs in the
+    background consumer, with retries. If the payload can't be journaled
+    we return 500 so Telr redelivers it instead of it being lost.
     """
     try:
-        # Get webhook payload
-        payload = request.get_json()
-        
-        logger.info(f"📨 Received Telr webhook: {json.dumps(payload, indent=2)}")
+        raw_body = request.get_data(as_text=True)
+        verified = False
+        if TELR_WEBHOOK_SECRET:
+            verified = validate_webhook_signature(
+                raw_body, request.headers.get(TELR_WEBHOOK_SIGNATURE_HEADER), TELR_WEBHOOK_SECRET
+            )
+            if not verified:
+                logger.warning("🚫 Rejected Telr webhook with a missing or invalid signature",
+                               extra={'remote_addr': request.remote_addr})
+                return jsonify({
+                    'success': False,
+                    'message': 'Invalid webhook signature'
+                }), 401
         
-        # Extract order information
-        order_ref = payload.get('order', {}).get('ref')
-        cart_id = payload.get('order', {}).get('cartid')
-        status_code = payload.get('order', {}).get('status', {}).get('code')
-        status_text = payload.get('order', {}).get('status', {}).get('text')
-        transaction_ref = payload.get('order', {}).get('transaction', {}).get('ref')
-        amount = payload.get('order', {}).get('amount')
-        currency = payload.get('order', {}).get('currency')
+        payload = request.get_json(silent=True)
+        if not isinstance(payload, dict):
+            return jsonify({
+                'success': False,
+                'message': 'Invalid webhook payload'
+            }), 400
         
-        logger.info(f"📋 Order Ref: {order_ref}")
-        logger.info(f"🛒 Cart ID: {cart_id}")
-        logger.info(f"💳 Status: {status_text} ({status_code})")
-        logger.info(f"💰 Amount: {currency} {amount}")
-        logger.info(f"🔖 Transaction Ref: {transaction_ref}")
-        
-        # Process based on status code
-        if status_code == 3:  # Authorised
-            logger.info(f"✅ Payment successful for order {order_ref}")
-            
-            # TODO: Update your database
-            # - Mark booking as paid
-            # - Send confirmation email
-            # - Trigger any post-payment workflows
-            
-            # Example:
-            # update_booking_status(cart_id, 'paid', {
-            #     'telr_order_ref': order_ref,
-            #     'transaction_ref': transaction_ref,
-            #     'amount': amount,
-            #     'currency': currency,
-            #     'payment_date': datetime.utcnow()
-            # })
-            
-        elif status_code == 2:  # Declined
-            logger.warning(f"❌ Payment declined for order {order_ref}")
-            
-            # TODO: Update your database
-            # - Mark booking as payment failed
-            # - Send failure notification
-            
-        elif status_code == -1:  # Cancelled
-            logger.info(f"⚠️ Payment cancelled for order {order_ref}")
-            
-            # TODO: Update your database
-            # - Mark booking as cancelled
-            # - Release inventory if applicable
-            
-        else:
-            logger.info(f"ℹ️ Other status ({status_code}) for order {order_ref}")
+        # Telr retries deliveries; repeats are acknowledged but not journaled
+        event_id, duplicate = webhook_queue.journal.append_unique(
+            webhook_queue.dedupe_key(payload, verified),
+            raw_body,
+            verified
+        )
         
-        # Log webhook for audit trail
-        log_webhook_event({
-            'timestamp': datetime.utcnow().isoformat(),
-            'order_ref': order_ref,
-            'cart_id': cart_id,
-            'status_code': status_code,
-            'status_text': status_text,
-            'transaction_ref': transaction_ref,
-            'amount': amount,
-            'currency': currency,
-            'payload': payload
-        })
+        if not duplicate:
+            # Process now in this worker rather than waiting for the next poll
+            webhook_queue.ensure_consumer(handle_journaled_event).wake.set()
         
         # Acknowledge receipt
         return jsonify({
             'success': True,
-            'message': 'Webhook processed successfully',
-            'order_ref': order_ref
+            'message': 'Duplicate webhook ignored' if duplicate else 'Webhook received',
+            'event_id': event_id,
+            'duplicate': duplicate,
+            'order_ref': payload.get('order', {}).get('ref')
         }), 200
         
     except Exception as e:
-        logger.error(f"💥 Error processing Telr webhook: {str(e)}")
-        logger.exception(e)
+        logger.exception("💥 Error journaling Telr webhook: %s", e)
         
-        # Return 200 even on error to prevent Telr from retrying unnecessarily
-        # Log the error for manual review
         return jsonify({
             'success': False,
-            'message': 'Error processing webhook',
+            'message': 'Error receiving webhook',
             'error': str(e)
-        }), 200
+        }), 500
+
+
+@telr_webhook_bp.before_app_request
+def start_webhook_consumer():
+    """Make sure every worker drains the journal, not just ones that got a webhook"""
+    webhook_queue.ensure_consumer(handle_journaled_event)
+
+
+def handle_journaled_event(event):
+    """Consumer callback: decode a journaled event and process it"""
+    process_webhook_event(json.loads(event.payload), verified=event.verified)
+
+
+def process_webhook_event(payload, verified=False):
+    """
+    Process a Telr payment notification and update order status accordingly
+    
+    A verified (signed) payload settles the booking directly. An
+    unverified one is never trusted: the order's status is re-checked with
+    Telr, and only Telr's answer is recorded.
+    
+    Runs in the webhook consumer. Exceptions are retried with backoff and
+    eventually dead-lettered, so don't swallow errors that should retry.
+    """
+    # Extract order information
+    order_ref = payload.get('order', {}).get('ref')
+    cart_id = payload.get('order', {}).get('cartid')
+    status_code = payload.get('order', {}).get('status', {}).get('code')
+    status_text = payload.get('order', {}).get('status', {}).get('text')
+    transaction_ref = payload.get('order', {}).get('transaction', {}).get('ref')
+    amount = payload.get('order', {}).get('amount')
+    currency = payload.get('order', {}).get('currency')
+    
+    # Telr may send the code as a number or a string
+    status = status_from_telr_code(status_code)
+    
+    logger.info("📨 Processing Telr webhook for order %s: %s (%s)", order_ref, status_text, status_code,
+                extra={'order_ref': order_ref, 'cart_id': cart_id, 'status_code': status_code,
+                       'amount': amount, 'currency': currency, 'transaction_ref': transaction_ref,
+                       'verified': verified})
+    # The full payload is only serialized when DEBUG is on for this module
+    logger.debug("Telr webhook payload: %s", payload)
+    
+    if not verified:
+        # Not authenticated, so never served or settled from: drop any cached
+        # response and settle from Telr's own answer instead
+        status_cache.invalidate(order_ref)
+        if status is not None and order_ref:
+            confirm_with_telr(order_ref)
+        else:
+            logger.info("ℹ️ Other status (%s) for order %s", status_code, order_ref)
+    else:
+        # Let status polls for this order answer from cache from now on
+        status_cache.store(order_ref, payload)
+        
+        # The ledger's cart for this order wins; webhooks may omit the cart id
+        if order_ref:
+            payment = ledger.get_by_order_ref(order_ref)
+            cart_id = payment['cart_id'] if payment else cart_id
+        
+        payment_details = {
+            'telr_order_ref': order_ref,
+            'transaction_ref': transaction_ref,
+            'amount': amount,
+            'currency': currency,
+            'status_code': status_code,
+            'status_text': status_text,
+            'payment_date': datetime.utcnow().isoformat(),
+            'source': 'webhook'
+        }
+        
+        # Process based on status
+        if status == PAID:
+            logger.info("✅ Payment successful for order %s", order_ref)
+            update_booking_status(cart_id, PAID, payment_details)
+            
+        elif status == FAILED:
+            logger.warning("❌ Payment declined for order %s", order_ref)
+            update_booking_status(cart_id, FAILED, payment_details)
+            
+        elif status == CANCELLED:
+            logger.info("⚠️ Payment cancelled for order %s", order_ref)
+            update_booking_status(cart_id, CANCELLED, payment_details)
+            
+        else:
+            logger.info("ℹ️ Other status (%s) for order %s", status_code, order_ref)
+    
+    # Log webhook for audit trail
+    log_webhook_event({
+        'timestamp': datetime.utcnow().isoformat(),
+        'order_ref': order_ref,
+        'cart_id': cart_id,
+        'status_code': status_code,
+        'status_text': status_text,
+        'transaction_ref': transaction_ref,
+        'amount': amount,
+        'currency': currency,
+        'payload': payload
+    })
+
+
+def confirm_with_telr(order_ref):
+    """
+    Settle order_ref from Telr's own answer rather than a webhook payload
+    
+    Errors (Telr unreachable, circuit open) propagate so the event is
+    retried.
+    """
+    # Imported here: telr_api pulls in the HTTP client stack
+    from telr_api import fetch_order_status
+    
+    telr_response, _ = status_cache.get_or_fetch(order_ref, fetch_order_status)
+    logger.info("🔍 Confirmed order %s with Telr: %s", order_ref,
+                telr_response.get('order', {}).get('status', {}).get('text'),
+                extra={'order_ref': order_ref,
+                       'status_code': telr_response.get('order', {}).get('status', {}).get('code')})
 
 
 def log_webhook_event(event_data):
     """
     Log webhook events for audit trail and debugging
     
-    In production, store this in a database table for:
+    Stored in the payment ledger's webhook_log table for:
     - Audit trail
     - Debugging payment issues
     - Reconciliation
     """
     try:
-        # TODO: Store in database
-        # Example:
-        # db.webhook_logs.insert_one(event_data)
-        
-        # For now, just log to file/console
-        logger.info(f"📝 Webhook event logged: {event_data['order_ref']}")
+        ledger.log_webhook_event(event_data)
+        logger.debug("📝 Webhook event logged: %s", event_data['order_ref'])
         
     except Exception as e:
-        logger.error(f"Failed to log webhook event: {str(e)}")
+        logger.error("Failed to log webhook event: %s", e)
 
 
 def update_booking_status(cart_id, status, payment_details):
     """
-    Update booking status in your database
+    Update booking payment status in the payment ledger
+    
+    Only pending payments change status; a payment that already settled
+    with a different status, or a cart the ledger never recorded, is left
+    alone and logged.
     
     Args:
         cart_id: The booking/cart ID
@@ -148,47 +248,40 @@ def update_booking_status(cart_id, status, payment_details):
         payment_details: Dict with payment information
     """
     try:
-        # TODO: Implement database update
-        # Example:
-        # db.bookings.update_one(
-        #     {'booking_reference_id': cart_id},
-        #     {
-        #         '$set': {
-        #             'payment_status': status,
-        #             'payment_details': payment_details,
-        #             'updated_at': datetime.utcnow()
-        #         }
-        #     }
-        # )
+        if not cart_id:
+            raise ValueError(f"No cart id for order {payment_details.get('telr_order_ref')}")
         
-        logger.info(f"✅ Booking {cart_id} updated to status: {status}")
+        if ledger.transition(cart_id, status, payment_details):
+            logger.info("✅ Booking %s updated to status: %s", cart_id, status)
+        else:
+            current = ledger.get_by_cart(cart_id)
+            if current is None:
+                logger.warning("⚠️ Booking %s is not in the payment ledger, ignoring '%s'", cart_id, status)
+            else:
+                logger.warning("⚠️ Booking %s already %s, ignoring '%s'", cart_id, current['status'], status)
         
     except Exception as e:
-        logger.error(f"Failed to update booking status: {str(e)}")
+        logger.error("Failed to update booking status: %s", e)
         raise
 
 
-# Webhook security validation (optional but recommended)
+# Webhook security validation
 def validate_webhook_signature(payload, signature, secret):
     """
-    Validate webhook signature if Telr provides signing
+    Check a hex HMAC-SHA256 signature of the raw payload against secret
     
-    Check Telr documentation for signature validation method
+    Returns False when either the signature or the secret is missing.
     """
-    # TODO: Implement signature validation
-    # Example:
-    # import hmac
-    # import hashlib
-    # 
-    # expected_signature = hmac.new(
-    #     secret.encode(),
-    #     payload.encode(),
-    #     hashlib.sha256
-    # ).hexdigest()
-    # 
-    # return hmac.compare_digest(expected_signature, signature)
+    if not signature or not secret:
+        return False
+    
+    expected_signature = hmac.new(
+        secret.encode(),
+        payload.encode(),
+        hashlib.sha256
+    ).hexdigest()
     
-    pass
+    return hmac.compare_digest(expected_signature, signature.strip().lower())
 
 
 # Export blueprint
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The backend is a flat set of modules, imported the way app.py imports them
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep the metrics files written by instrumented code out of the source tree
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.mkdtemp(prefix='hotelrbs-tests-'), 'metrics'))
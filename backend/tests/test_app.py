@@ -0,0 +1,180 @@
+import importlib
+import json
+
+import pytest
+
+from read_cache import ReadCache
+from storage import ExcelStorage, SqliteStorage
+from tables import ensure_tables
+
+DUBAI = (25.2, 55.3)
+ABU_DHABI = (24.45, 54.38)
+
+
+@pytest.fixture(params=['excel', 'sqlite'])
+def app_module(request, tmp_path, monkeypatch):
+    # Table files are relative to the working directory; the first import
+    # must not create them in the source tree either
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('APP_TABLES_READY', 'true')
+    app_module = importlib.import_module('app')
+    storage = ExcelStorage() if request.param == 'excel' else SqliteStorage(str(tmp_path / 'test.db'))
+    ensure_tables(storage)
+    monkeypatch.setattr(app_module, 'storage', storage)
+    monkeypatch.setattr(app_module, 'read_cache', ReadCache(storage, app_module.render_records_response))
+    yield app_module
+    storage.close()
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+def hotel(n, city='DXB', location=DUBAI):
+    return {'hotel_code': f'H{n}', 'name': f'Hotel {n}', 'rating': n, 'address': 'Street',
+            'city_id': city, 'map_lat': location[0], 'map_lon': location[1]}
+
+
+def add_hotels(client, hotels):
+    response = client.post('/hotel/add-hotels', data='\n'.join(json.dumps(item) for item in hotels))
+    assert response.status_code == 200, response.get_json()
+
+
+def codes(response):
+    return [record['Hotel Code'] for record in response.get_json()['data']]
+
+
+def test_cursor_pages_cover_every_row_once(client):
+    add_hotels(client, [hotel(n) for n in range(1, 6)])
+
+    seen, cursor, pages = [], '', 0
+    while cursor is not None:
+        body = client.get(f'/hotels?limit=2&cursor={cursor}').get_json()
+        assert body['total'] == 5
+        seen += [record['Hotel Code'] for record in body['data']]
+        cursor = body['next_cursor']
+        pages += 1
+
+    assert seen == ['H1', 'H2', 'H3', 'H4', 'H5']
+    assert pages == 3
+
+
+def test_pages_stay_stable_while_rows_are_appended(client):
+    add_hotels(client, [hotel(n) for n in range(1, 5)])
+    first = client.get('/hotels?limit=2').get_json()
+
+    assert client.post('/hotel/add-hotel', json=hotel(5)).status_code == 200
+    second = client.get(f"/hotels?limit=2&cursor={first['next_cursor']}").get_json()
+    third = client.get(f"/hotels?limit=2&cursor={second['next_cursor']}").get_json()
+
+    assert [r['Hotel Code'] for r in second['data']] == ['H3', 'H4']
+    assert [r['Hotel Code'] for r in third['data']] == ['H5']
+    assert third['next_cursor'] is None
+
+
+def test_filters_and_fields(client):
+    add_hotels(client, [hotel(1, 'DXB'), hotel(2, 'AUH'), hotel(3, 'DXB'), hotel(4, 'DXB')])
+
+    body = client.get('/hotels?city_id=DXB&min_rating=3&fields=Hotel Code,Rating').get_json()
+
+    assert body['data'] == [{'Hotel Code': 'H3', 'Rating': 3}, {'Hotel Code': 'H4', 'Rating': 4}]
+    assert body['total'] == 2
+
+
+@pytest.mark.parametrize('query', ['limit=-1', 'limit=ten', 'cursor=x', 'min_rating=high', 'fields=Nope'])
+def test_invalid_query_parameters_are_rejected(client, query):
+    add_hotels(client, [hotel(1)])
+
+    response = client.get(f'/hotels?{query}')
+
+    assert response.status_code == 400
+    assert response.get_json()['success'] is False
+
+
+def test_streamed_exports_match_the_full_response(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'STREAM_CHUNK_SIZE', 64)  # several chunks
+    add_hotels(client, [hotel(n) for n in range(1, 6)])
+    full = client.get('/hotels').get_json()
+
+    ndjson = client.get('/hotels?stream=ndjson')
+    streamed_json = client.get('/hotels?stream=json')
+
+    assert ndjson.mimetype == 'application/x-ndjson'
+    assert [json.loads(line) for line in ndjson.get_data().splitlines()] == full['data']
+    assert streamed_json.get_json() == {'success': True, 'data': full['data'], 'count': 5}
+    assert client.get('/hotels?stream=xml').status_code == 400
+
+
+def test_bulk_ingest_reports_each_rejected_item(client):
+    body = '\n'.join([
+        json.dumps(hotel(1)),
+        '{"hotel_code": ',
+        json.dumps({'hotel_code': 'H3', 'rating': 3}),
+        json.dumps(hotel(4)),
+        '[1, 2]',
+    ])
+
+    response = client.post('/hotel/add-hotels', data=body)
+    result = response.get_json()
+
+    assert response.status_code == 200
+    assert (result['success'], result['inserted'], result['failed']) == (False, 2, 3)
+    assert [error['index'] for error in result['errors']] == [1, 2, 4]
+    assert result['errors'][0]['message'].startswith('Invalid JSON')
+    assert result['errors'][1]['message'] == 'Missing required fields: name, address'
+    assert result['errors'][2]['message'] == 'Item must be a JSON object'
+    assert codes(client.get('/hotels')) == ['H1', 'H4']
+
+
+def test_bulk_ingest_rejects_empty_invalid_and_oversized_requests(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'MAX_BULK_ITEMS', 2)
+
+    assert client.post('/hotel/add-hotels', data='').status_code == 400
+    assert client.post('/hotel/add-hotels', data='[{"hotel_code": ').status_code == 400
+    assert client.post('/hotel/add-hotels', data=json.dumps([{'hotel_code': 'H1'}])).status_code == 400
+    oversized = client.post('/hotel/add-hotels', data=json.dumps([hotel(n) for n in range(3)]))
+    assert oversized.status_code == 413
+    assert codes(client.get('/hotels')) == []
+
+
+def test_nearby_hotels_nearest_first(client):
+    add_hotels(client, [hotel(1, location=(25.25, 55.3)), hotel(2, location=ABU_DHABI), hotel(3, location=DUBAI)])
+
+    body = client.get('/hotels/nearby?lat=25.2&lon=55.3&radius=10').get_json()
+
+    assert [record['Hotel Code'] for record in body['data']] == ['H3', 'H1']
+    assert body['data'][0]['distance_km'] == 0
+    assert client.get('/hotels/nearby?lat=25.2').status_code == 400
+    assert client.get('/hotels/nearby?lat=95&lon=0').status_code == 400
+
+
+def test_room_summary_per_hotel_and_currency(client):
+    rooms = [
+        {'room_id': 'R1', 'hotel_code': 'H1', 'booking_code': 'B', 'room_name': 'Std', 'total_fare': 100,
+         'currency': 'AED', 'is_refundable': True},
+        {'room_id': 'R2', 'hotel_code': 'H1', 'booking_code': 'B', 'room_name': 'Dlx', 'total_fare': 300,
+         'currency': 'AED', 'is_refundable': False},
+        {'room_id': 'R3', 'hotel_code': 'H1', 'booking_code': 'B', 'room_name': 'Std', 'total_fare': 50,
+         'currency': 'USD', 'is_refundable': False},
+    ]
+    assert client.post('/hotelRoom/add-bulk', json=rooms).status_code == 200
+
+    [summary] = client.get('/rooms/summary?hotel_code=H1&currency=AED').get_json()['data']
+
+    assert (summary['rooms'], summary['refundable_rooms']) == (2, 1)
+    assert (summary['min_fare'], summary['max_fare'], summary['median_fare']) == (100, 300, 200)
+    assert (summary['cheapest_room_id'], summary['cheapest_refundable_room_id']) == ('R1', 'R1')
+    assert client.get('/rooms/summary?hotel_code=H1').get_json()['count'] == 2
+
+
+def test_wishlist_add_is_idempotent_and_remove_deletes(client):
+    item = {'customer_id': 'C1', 'hotel_code': 'H1', 'hotel_name': 'Hotel 1'}
+
+    assert client.post('/wishlist/add', json=item).status_code == 200
+    assert client.post('/wishlist/add', json=item).status_code == 200
+    assert [r['Wishlist ID'] for r in client.get('/wishlist/C1').get_json()['data']] == ['WL00001']
+
+    assert client.post('/wishlist/remove', json={'customer_id': 'C1', 'hotel_code': 'H1'}).status_code == 200
+    assert client.post('/wishlist/remove', json={'customer_id': 'C1', 'hotel_code': 'H1'}).status_code == 404
+    assert client.get('/wishlist/C1').get_json()['count'] == 0
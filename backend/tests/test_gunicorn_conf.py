@@ -0,0 +1,83 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs the master's startup hooks, then what a gevent worker does after
+# the fork: monkey.patch_all(), import the app, open an HTTPS context
+GEVENT_STARTUP = '''
+import json, runpy, sys, warnings
+warnings.simplefilter('error', category=Warning)
+conf = runpy.run_path(sys.argv[1])
+conf['on_starting'](None)
+if conf['preload_app']:
+    conf['when_ready'](None)
+imported = sorted(name for name in ('requests', 'urllib3') if name in sys.modules)
+
+from gevent import monkey
+monkey.patch_all()
+import app
+from urllib3.util.ssl_ import create_urllib3_context
+create_urllib3_context().load_default_certs()
+print(json.dumps({'preload': conf['preload_app'], 'preimport': conf['preimport'], 'imported': imported}))
+'''
+
+
+def test_gevent_profile_leaves_http_stack_to_the_worker(tmp_path):
+    pytest.importorskip('gevent')
+    env = dict(os.environ, GUNICORN_WORKER_PROFILE='gevent', GUNICORN_PRELOAD='true',
+               GUNICORN_PREIMPORT='flask,requests,pandas,openpyxl', METRICS_DIR=str(tmp_path / 'metrics'),
+               PYTHONPATH=BACKEND_DIR, STORAGE_BACKEND='excel')
+    result = subprocess.run([sys.executable, '-c', GEVENT_STARTUP, os.path.join(BACKEND_DIR, 'gunicorn.conf.py')],
+                            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    report = result.stdout.strip().splitlines()[-1]
+    assert report == '{"preload": false, "preimport": ["flask", "pandas", "openpyxl"], "imported": []}'
+
+
+# Runs the master's startup hooks with preload on, logs from the master,
+# then forks a worker and runs post_fork in it
+PRELOAD_STARTUP = '''
+import json, logging, os, runpy, sys, threading
+conf = runpy.run_path(sys.argv[1])
+conf['on_starting'](None)
+conf['when_ready'](None)
+logging.getLogger('master').warning('logged in the master')
+master = sorted(thread.name for thread in threading.enumerate())
+
+read_end, write_end = os.pipe()
+pid = os.fork()
+if pid == 0:
+    try:
+        conf['post_fork'](None, None)
+        names = sorted(thread.name for thread in threading.enumerate())
+    except BaseException as e:
+        names = repr(e)
+    os.write(write_end, json.dumps(names).encode())
+    os._exit(0)
+os.close(write_end)
+os.waitpid(pid, 0)
+worker = json.loads(os.read(read_end, 65536))
+print(json.dumps({'master': master, 'worker': worker}))
+'''
+
+
+def test_master_starts_no_threads_before_forking(tmp_path):
+    if not hasattr(os, 'fork'):
+        pytest.skip('needs os.fork')
+    env = dict(os.environ, GUNICORN_WORKER_PROFILE='sync', GUNICORN_PRELOAD='true',
+               METRICS_DIR=str(tmp_path / 'metrics'), PYTHONPATH=BACKEND_DIR, STORAGE_BACKEND='excel')
+    result = subprocess.run([sys.executable, '-c', PRELOAD_STARTUP, os.path.join(BACKEND_DIR, 'gunicorn.conf.py')],
+                            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=120)
+
+    assert result.returncode == 0, result.stderr
+    assert 'logged in the master' in result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    assert report['master'] == ['MainThread']
+    assert 'metrics-flusher' in report['worker']
+    assert len(report['worker']) == 3  # main, metrics flusher, log writer
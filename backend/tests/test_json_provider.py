@@ -0,0 +1,42 @@
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from flask import Flask, jsonify
+
+import json_provider
+from json_provider import FastJSONProvider, RawJSON
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def app(request, monkeypatch):
+    if request.param == 'orjson':
+        if json_provider.orjson is None:
+            pytest.skip('orjson is not installed')
+    else:
+        monkeypatch.setattr(json_provider, 'orjson', None)
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    return app
+
+
+def test_nan_and_numpy_values_become_plain_json(app):
+    value = {'b': float('nan'), 'a': np.int64(3), 'c': np.array([1.5, np.inf]), 'd': pd.NaT,
+             'e': datetime(2024, 1, 2, 3, 4, 5)}
+
+    with app.app_context():
+        body = app.json.dumps(value)
+
+    assert json.loads(body) == {'a': 3, 'b': None, 'c': [1.5, None], 'd': None,
+                                'e': 'Tue, 02 Jan 2024 03:04:05 GMT'}
+    assert list(json.loads(body)) == ['a', 'b', 'c', 'd', 'e']
+
+
+def test_raw_json_is_sent_as_is(app):
+    with app.test_request_context():
+        response = jsonify(RawJSON(b'{"already":"serialized"}'))
+
+    assert response.get_data() == b'{"already":"serialized"}'
+    assert response.mimetype == 'application/json'
@@ -0,0 +1,141 @@
+import os
+
+import pytest
+
+import storage as storage_module
+from storage import KeyIndex, TableSpec, _RowCounter
+
+HEADERS = ['Wishlist ID', 'Customer ID', 'Hotel Code']
+TABLE = TableSpec('wishlist', 'wishlist.xlsx', 'Wishlist', HEADERS,
+                  id_format='WL{:05d}', key_columns=('Customer ID', 'Hotel Code'))
+
+
+def record(number, customer, hotel):
+    return {'Wishlist ID': f'WL{number:05d}', 'Customer ID': customer, 'Hotel Code': hotel}
+
+
+def hotels(index, customer):
+    return [r['Hotel Code'] for r in index.find({'Customer ID': customer})]
+
+
+def commit(index, version, path, *changes):
+    """Apply changes to a copy of index the way ExcelStorage._flush does, and persist it"""
+    index = index.copy()
+    for change in changes:
+        if isinstance(change, dict):
+            index.add(change)
+        else:
+            index.remove(change)
+    index.version = version
+    index.persist(path)
+    return index
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'wishlist.xlsx.index.json')
+
+
+def test_row_counter_positions_skip_cleared_slots():
+    counter = _RowCounter()
+    slots = [counter.append() for _ in range(5)]
+    counter.clear(slots[1])
+    copy = counter.copy()
+    counter.clear(slots[3])
+
+    assert len(counter) == 5
+    assert [counter.before(slot) for slot in slots] == [0, 1, 1, 2, 2]
+    # The copy doesn't see changes made after it was taken
+    assert [copy.before(slot) for slot in slots] == [0, 1, 1, 2, 3]
+    assert counter.before(counter.append()) == 3
+
+
+def test_add_find_and_remove_by_key():
+    index = KeyIndex.from_rows(TABLE, [['WL00001', 'C1', 'H1'], ['WL00002', 'C2', 'H1'], ['WL00003', 'C1', 'H2']])
+
+    assert index.contains(['C1', 'H2'])
+    assert hotels(index, 'C1') == ['H1', 'H2']
+    assert index.last_id == 3
+    # Sheet position (0-based, without the header) of the removed row
+    assert index.remove(['C2', 'H1']) == 1
+    assert index.remove(['C2', 'H1']) is None
+    assert index.remove(['C1', 'H2']) == 1
+    assert hotels(index, 'C1') == ['H1']
+    assert not index.contains(['C2', 'H1'])
+
+
+def test_copy_leaves_the_original_untouched():
+    index = KeyIndex.from_rows(TABLE, [['WL00001', 'C1', 'H1'], ['WL00002', 'C1', 'H2']])
+    copy = index.copy()
+    copy.add(record(3, 'C1', 'H3'))
+    copy.remove(['C1', 'H1'])
+
+    assert hotels(index, 'C1') == ['H1', 'H2']
+    assert hotels(copy, 'C1') == ['H2', 'H3']
+    assert copy.remove(['C1', 'H3']) == 1
+
+
+def test_removed_slots_are_renumbered():
+    rows = [[f'WL{n:05d}', 'C1', f'H{n}'] for n in range(1, 2001)]
+    index = KeyIndex.from_rows(TABLE, rows)
+    for n in range(1, 2000):
+        index.remove(['C1', f'H{n}'])
+
+    assert len(index.counter) < 2000
+    assert index.remove(['C1', 'H2000']) == 0
+
+
+def test_persist_appends_commits_to_the_delta_log(path):
+    index = KeyIndex.from_rows(TABLE, [['WL00001', 'C1', 'H1']], (1,))
+    index.persist(path)
+    index = commit(index, (2,), path, record(2, 'C1', 'H2'))
+    index = commit(index, (3,), path, ['C1', 'H1'])
+
+    assert os.path.exists(path + '.log')
+    loaded = KeyIndex.load(TABLE, path, (3,))
+    assert hotels(loaded, 'C1') == ['H2']
+    assert loaded.last_id == 2
+    assert KeyIndex.load(TABLE, path, (2,)) is None
+
+
+def test_log_is_compacted_into_the_snapshot(path, monkeypatch):
+    monkeypatch.setattr(storage_module, 'INDEX_COMPACT_EVERY', 2)
+    index = KeyIndex.from_rows(TABLE, [], (1,))
+    index.persist(path)
+    for n in range(1, 4):
+        index = commit(index, (n + 1,), path, record(n, 'C1', f'H{n}'))
+
+    # The third change didn't fit in the log: rewritten snapshot, no log yet
+    assert not os.path.exists(path + '.log')
+    assert hotels(KeyIndex.load(TABLE, path, (4,)), 'C1') == ['H1', 'H2', 'H3']
+
+
+def test_caught_up_replays_only_new_log_entries(path):
+    writer = KeyIndex.from_rows(TABLE, [['WL00001', 'C1', 'H1']], (1,))
+    writer.persist(path)
+    writer = commit(writer, (2,), path, record(2, 'C1', 'H2'))
+    reader = KeyIndex.load(TABLE, path, (2,))
+    writer = commit(writer, (3,), path, record(3, 'C2', 'H1'), ['C1', 'H1'])
+    # Proves the snapshot isn't read again
+    with open(path, 'w') as f:
+        f.write('not json')
+
+    caught_up = reader.caught_up(path, (3,))
+
+    assert caught_up.version == (3,)
+    assert hotels(caught_up, 'C1') == ['H2']
+    assert hotels(caught_up, 'C2') == ['H1']
+    assert caught_up.last_id == 3
+    assert hotels(reader, 'C1') == ['H1', 'H2']
+
+
+def test_caught_up_gives_up_after_compaction(path, monkeypatch):
+    monkeypatch.setattr(storage_module, 'INDEX_COMPACT_EVERY', 1)
+    writer = KeyIndex.from_rows(TABLE, [], (1,))
+    writer.persist(path)
+    writer = commit(writer, (2,), path, record(1, 'C1', 'H1'))
+    reader = KeyIndex.load(TABLE, path, (2,))
+    writer = commit(writer, (3,), path, record(2, 'C1', 'H2'))
+
+    assert reader.caught_up(path, (3,)) is None
+    assert hotels(KeyIndex.load(TABLE, path, (3,)), 'C1') == ['H1', 'H2']
@@ -0,0 +1,47 @@
+import json
+import os
+
+import metrics
+from metrics import Registry
+
+
+def test_observations_are_bucketed_and_rendered():
+    registry = Registry()
+    registry.observe('storage_operation_duration_seconds', 0.002, operation='read')
+    registry.observe('storage_operation_duration_seconds', 0.2, operation='read')
+    totals = {}
+    metrics._merge(totals, registry.dump())
+
+    text = metrics.render(totals)
+
+    assert 'storage_operation_duration_seconds_bucket{operation="read",le="0.001"} 0' in text
+    assert 'storage_operation_duration_seconds_bucket{operation="read",le="0.0025"} 1' in text
+    assert 'storage_operation_duration_seconds_bucket{operation="read",le="+Inf"} 2' in text
+    assert 'storage_operation_duration_seconds_count{operation="read"} 2' in text
+    assert 'storage_operation_duration_seconds_sum{operation="read"} 0.202000' in text
+
+
+def test_deferred_registry_records_nothing():
+    registry = Registry()
+    registry.defer()
+    registry.observe('storage_operation_duration_seconds', 0.1, operation='read')
+
+    assert registry.dump() == []
+
+
+def test_collect_archives_files_of_exited_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_DIR', str(tmp_path))
+    monkeypatch.setattr(metrics, 'registry', Registry())
+    series = [['storage_operation_duration_seconds', [['operation', 'read']], [1] + [0] * len(metrics.BUCKETS) + [0.5]]]
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    for name in (f'{pid}.json', metrics.ARCHIVE_NAME):
+        with open(tmp_path / name, 'w') as f:
+            json.dump(series, f)
+
+    totals = metrics.collect()
+
+    assert totals[('storage_operation_duration_seconds', (('operation', 'read'),))][0] == 2
+    assert sorted(os.listdir(tmp_path)) == ['.lock', metrics.ARCHIVE_NAME]
@@ -0,0 +1,94 @@
+import pytest
+
+from payment_ledger import PaymentLedger, status_from_telr_code, PENDING, PAID, FAILED, CANCELLED
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return PaymentLedger(str(tmp_path / 'payments.db'))
+
+
+def test_transition_settles_pending_payment(ledger):
+    ledger.record_order('CART1', 'ORD1', '100.00', 'AED')
+
+    assert ledger.transition('CART1', PAID, {'transaction_ref': 'TX1'})
+
+    payment = ledger.get_by_cart('CART1')
+    assert payment['status'] == PAID
+    assert payment['transaction_ref'] == 'TX1'
+    assert payment['amount'] == '100.00'
+
+
+def test_repeated_transition_is_idempotent(ledger):
+    ledger.record_order('CART1', 'ORD1')
+    assert ledger.transition('CART1', PAID, {'transaction_ref': 'TX1'})
+    settled = ledger.get_by_cart('CART1')
+
+    assert ledger.transition('CART1', PAID, {'transaction_ref': 'TX2'})
+
+    assert ledger.get_by_cart('CART1') == settled
+
+
+@pytest.mark.parametrize('later', [FAILED, CANCELLED])
+def test_settled_payment_keeps_its_status(ledger, later):
+    ledger.record_order('CART1', 'ORD1')
+    ledger.transition('CART1', PAID)
+
+    assert not ledger.transition('CART1', later)
+    assert ledger.get_by_cart('CART1')['status'] == PAID
+
+
+def test_refused_transitions_are_logged(ledger, caplog):
+    ledger.record_order('CART1', 'ORD1')
+    ledger.transition('CART1', PAID)
+
+    with caplog.at_level('WARNING', logger='payment_ledger'):
+        ledger.transition('CART1', FAILED)
+        ledger.transition('CART2', PAID)
+
+    assert [record.cart_id for record in caplog.records] == ['CART1', 'CART2']
+    assert caplog.records[0].settled_status == PAID
+
+
+def test_settled_payment_never_returns_to_pending(ledger):
+    ledger.record_order('CART1', 'ORD1')
+    ledger.transition('CART1', PAID)
+
+    with pytest.raises(ValueError):
+        ledger.transition('CART1', PENDING)
+    # Re-creating the order doesn't reset it either
+    ledger.record_order('CART1', 'ORD2')
+
+    payment = ledger.get_by_cart('CART1')
+    assert payment['status'] == PAID
+    assert payment['order_ref'] == 'ORD1'
+    assert ledger.pending() == []
+
+
+def test_unknown_cart_is_rejected(ledger):
+    assert not ledger.transition('NOPE', PAID, {'telr_order_ref': 'ORD1'})
+
+    assert ledger.get_by_cart('NOPE') is None
+    assert ledger.get_by_order_ref('ORD1') is None
+
+
+def test_apply_transitions_reports_each_result(ledger):
+    ledger.record_order('CART1', 'ORD1')
+    ledger.record_order('CART2', 'ORD2')
+    ledger.transition('CART2', CANCELLED)
+
+    results = ledger.apply_transitions([
+        ('CART1', PAID, {}),
+        ('CART2', PAID, {}),
+        ('NOPE', PAID, {}),
+    ])
+
+    assert results == [True, False, False]
+    assert ledger.get_by_cart('CART2')['status'] == CANCELLED
+
+
+@pytest.mark.parametrize('code, status', [
+    (3, PAID), ('3', PAID), (2, FAILED), ('-1', CANCELLED), (1, None), ('x', None), (None, None),
+])
+def test_status_from_telr_code(code, status):
+    assert status_from_telr_code(code) == status
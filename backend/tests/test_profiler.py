@@ -0,0 +1,56 @@
+import os
+
+import pytest
+from flask import Flask
+
+import profiler
+
+TOKEN = 'secret'
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, 'PROFILE_ENABLED', True)
+    monkeypatch.setattr(profiler, 'PROFILE_TOKEN', TOKEN)
+    monkeypatch.setattr(profiler, 'PROFILE_DIR', str(tmp_path))
+    app = Flask(__name__)
+    app.register_blueprint(profiler.profiler_bp)
+
+    @app.route('/work')
+    def work():
+        return {'total': sum(range(1000))}
+
+    return app.test_client()
+
+
+def profile(client, query=''):
+    response = client.get('/work' + query, headers={'X-Profile': '1', 'X-Profile-Token': TOKEN})
+    response.close()
+    return response.headers.get('X-Profile-Id')
+
+
+def test_header_with_token_profiles_the_request(client, tmp_path):
+    profile_id = profile(client, '?card=4111')
+
+    assert sorted(os.listdir(tmp_path)) == [f'{profile_id}.json', f'{profile_id}.prof']
+    meta = client.get(f'/admin/profiles/{profile_id}', headers={'X-Profile-Token': TOKEN}).get_json()['data']
+    assert (meta['route'], meta['path'], meta['status']) == ('/work', '/work', 200)
+    assert meta['top_functions']
+    listed = client.get('/admin/profiles?route=/work', headers={'X-Profile-Token': TOKEN}).get_json()
+    assert [p['id'] for p in listed['data']] == [profile_id]
+
+
+def test_wrong_token_neither_profiles_nor_lists(client, tmp_path):
+    response = client.get('/work', headers={'X-Profile': '1', 'X-Profile-Token': 'guess'})
+
+    assert 'X-Profile-Id' not in response.headers
+    assert os.listdir(tmp_path) == []
+    assert client.get('/admin/profiles', headers={'X-Profile-Token': 'guess'}).status_code == 404
+    assert client.get('/admin/profiles/../../etc', headers={'X-Profile-Token': TOKEN}).status_code == 404
+
+
+def test_only_the_newest_profiles_are_kept(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(profiler, 'PROFILE_KEEP', 2)
+    ids = [profile(client) for _ in range(3)]
+
+    assert sorted(name[:-5] for name in os.listdir(tmp_path) if name.endswith('.json')) == ids[1:]
@@ -0,0 +1,124 @@
+import pytest
+from openpyxl import load_workbook
+
+from read_cache import ReadCache
+from room_summary import RoomSummary
+from storage import ExcelStorage, SqliteStorage, TableSpec
+
+HEADERS = ['Hotel Code', 'Latitude', 'Longitude']
+DUBAI = (25.2, 55.3)
+ABU_DHABI = (24.45, 54.38)
+ROOM_HEADERS = ['Room ID', 'Hotel Code', 'Currency', 'Total Fare']
+ROOMS = [['R1', 'H1', 'AED', 100], ['R2', 'H1', 'AED', 200], ['R3', 'H2', 'AED', 300]]
+
+
+def open_storage(kind, tmp_path, table, rows):
+    storage = ExcelStorage() if kind == 'excel' else SqliteStorage(str(tmp_path / 'test.db'))
+    storage.ensure_table(table)
+    storage.append_rows(table, rows)
+    return storage
+
+
+@pytest.fixture(params=['excel', 'sqlite'])
+def backend(request, tmp_path):
+    table = TableSpec('hotels', str(tmp_path / 'hotels.xlsx'), 'Hotels', HEADERS)
+    storage = open_storage(request.param, tmp_path, table, [['H1', *DUBAI], ['H2', *DUBAI], ['H3', *DUBAI]])
+    yield storage, table
+    storage.close()
+
+
+@pytest.fixture(params=['excel', 'sqlite'])
+def backend_rooms(request, tmp_path):
+    table = TableSpec('rooms', str(tmp_path / 'rooms.xlsx'), 'Rooms', ROOM_HEADERS)
+    storage = open_storage(request.param, tmp_path, table, ROOMS)
+    yield storage, table
+    storage.close()
+
+
+def near(cache, table, point):
+    entry = cache.get(table)
+    return sorted(entry.records[position]['Hotel Code']
+                  for position, _ in entry.geo_index('Latitude', 'Longitude').nearby(*point, 10))
+
+
+def test_appends_extend_the_previous_value(backend):
+    storage, table = backend
+    cache = ReadCache(storage, lambda records: b'')
+    seen = []
+
+    def build(records, previous):
+        seen.append(previous)
+        return len(records)
+
+    cache.get(table).derived('count', build)
+    storage.append_rows(table, [['H4', *DUBAI]])
+
+    assert cache.get(table).derived('count', build) == 4
+    assert seen == [None, 3]
+
+
+def test_geo_index_is_rebuilt_after_a_delete(backend):
+    storage, table = backend
+    storage.append_rows(table, [['H4', *ABU_DHABI], ['H3', *DUBAI]])
+    cache = ReadCache(storage, lambda records: b'')
+    assert near(cache, table, DUBAI) == ['H1', 'H2', 'H3', 'H3']
+
+    # Same length and last row as before: only the lineage tells them apart
+    storage.delete_first(table, {'Hotel Code': 'H4'})
+    storage.append_rows(table, [['H3', *DUBAI]])
+
+    assert near(cache, table, DUBAI) == ['H1', 'H2', 'H3', 'H3', 'H3']
+    assert near(cache, table, ABU_DHABI) == []
+
+
+def test_geo_index_is_rebuilt_after_a_middle_row_is_edited_in_excel(tmp_path):
+    table = TableSpec('hotels', str(tmp_path / 'hotels.xlsx'), 'Hotels', HEADERS)
+    storage = open_storage('excel', tmp_path, table, [['H1', *DUBAI], ['H2', *DUBAI], ['H3', *DUBAI]])
+    cache = ReadCache(storage, lambda records: b'')
+    assert near(cache, table, DUBAI) == ['H1', 'H2', 'H3']
+
+    wb = load_workbook(table.excel_path)
+    wb[table.sheet_name]['B3'], wb[table.sheet_name]['C3'] = ABU_DHABI
+    wb.save(table.excel_path)
+
+    assert near(cache, table, DUBAI) == ['H1', 'H3']
+    assert near(cache, table, ABU_DHABI) == ['H2']
+
+    # The next commit doesn't make the edited workbook look append-only
+    storage.append_rows(table, [['H4', *ABU_DHABI]])
+    assert near(cache, table, ABU_DHABI) == ['H2', 'H4']
+
+
+def room_summary(cache, table):
+    entry = cache.get(table)
+    return entry.derived('room_summary', lambda records, previous: (
+        previous.extended(records) if previous else RoomSummary.build(records)
+    ))
+
+
+def test_room_summary_is_rebuilt_after_a_middle_row_is_edited_in_excel(tmp_path):
+    table = TableSpec('rooms', str(tmp_path / 'rooms.xlsx'), 'Rooms', ROOM_HEADERS)
+    storage = open_storage('excel', tmp_path, table, ROOMS)
+    cache = ReadCache(storage, lambda records: b'')
+    assert room_summary(cache, table).for_hotels(['H1'])[0]['min_fare'] == 100
+
+    wb = load_workbook(table.excel_path)
+    wb[table.sheet_name]['D2'] = 50
+    wb.save(table.excel_path)
+    storage.append_rows(table, [['R4', 'H2', 'AED', 400]])
+
+    summaries = {s['hotel_code']: s for s in room_summary(cache, table).for_hotels()}
+    assert summaries['H1']['min_fare'] == 50
+    assert summaries['H2']['max_fare'] == 400
+
+
+def test_room_summary_is_extended_after_appends(backend_rooms):
+    storage, table = backend_rooms
+    cache = ReadCache(storage, lambda records: b'')
+    first = room_summary(cache, table)
+    storage.append_rows(table, [['R4', 'H2', 'AED', 50]])
+
+    second = room_summary(cache, table)
+    # H1 wasn't touched, so its summary is shared with the previous version
+    assert second.summaries[('H1', 'AED')] is first.summaries[('H1', 'AED')]
+    assert second.for_hotels(['H2'])[0]['min_fare'] == 50
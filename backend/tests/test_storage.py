@@ -0,0 +1,236 @@
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import storage as storage_module
+from storage import ExcelStorage, SqliteStorage, TableSpec, import_excel
+
+HEADERS = ['Wishlist ID', 'Customer ID', 'Hotel Code', 'Price']
+KEY = ('Customer ID', 'Hotel Code')
+
+
+@pytest.fixture(params=['excel', 'sqlite'])
+def backend(request, tmp_path):
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS,
+                      id_format='WL{:05d}', key_columns=KEY)
+    if request.param == 'excel':
+        storage = ExcelStorage()
+    else:
+        storage = SqliteStorage(str(tmp_path / 'test.db'))
+    storage.ensure_table(table)
+    yield storage, table
+    storage.close()
+
+
+def insert(storage, table, customer, hotel):
+    return storage.insert_unique(table, [None, customer, hotel, 10], KEY)
+
+
+def ids(storage, table):
+    return [record['Wishlist ID'] for record in storage.read_records(table)]
+
+
+def test_insert_unique_skips_existing_keys(backend):
+    storage, table = backend
+    assert insert(storage, table, 'C1', 'H1')
+    assert insert(storage, table, 'C1', 'H2')
+    assert not insert(storage, table, 'C1', 'H1')
+
+    assert ids(storage, table) == ['WL00001', 'WL00002']
+    assert [r['Hotel Code'] for r in storage.find_records(table, {'Customer ID': 'C1'})] == ['H1', 'H2']
+
+
+def test_delete_first_removes_one_matching_row(backend):
+    storage, table = backend
+    storage.append_rows(table, [['WL00001', 'C1', 'H1', 1], ['WL00002', 'C2', 'H1', 2], ['WL00003', 'C1', 'H2', 3]])
+
+    assert storage.delete_first(table, {'Customer ID': 'C1', 'Hotel Code': 'H1'})
+    assert not storage.delete_first(table, {'Customer ID': 'C1', 'Hotel Code': 'H1'})
+
+    assert ids(storage, table) == ['WL00002', 'WL00003']
+    assert storage.count(table) == 2
+
+
+def test_deleted_ids_are_never_reissued(backend):
+    storage, table = backend
+    # As after `storage.py import`: explicit, non-contiguous IDs
+    storage.append_rows(table, [['WL00001', 'C1', 'H1', 1], ['WL00010', 'C1', 'H2', 2]])
+
+    assert insert(storage, table, 'C2', 'H1')
+    assert ids(storage, table)[-1] == 'WL00011'
+    assert storage.delete_first(table, {'Customer ID': 'C2', 'Hotel Code': 'H1'})
+
+    assert insert(storage, table, 'C2', 'H1')
+    assert ids(storage, table) == ['WL00001', 'WL00010', 'WL00012']
+
+
+def test_id_counter_survives_an_index_rebuild(tmp_path):
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS,
+                      id_format='WL{:05d}', key_columns=KEY)
+    storage = ExcelStorage()
+    storage.ensure_table(table)
+    insert(storage, table, 'C1', 'H1')
+    insert(storage, table, 'C1', 'H2')
+    storage.delete_first(table, {'Customer ID': 'C1', 'Hotel Code': 'H2'})
+
+    # A fresh process with no persisted index, e.g. after the files were removed
+    for suffix in ('.index.json', '.index.json.log'):
+        if os.path.exists(table.excel_path + suffix):
+            os.remove(table.excel_path + suffix)
+    storage = ExcelStorage()
+
+    assert insert(storage, table, 'C1', 'H3')
+    assert ids(storage, table) == ['WL00001', 'WL00003']
+
+
+def test_iter_records_matches_read_records(backend, monkeypatch):
+    storage, table = backend
+    monkeypatch.setattr(storage_module, 'ITER_CHUNK_ROWS', 2)
+    storage.append_rows(table, [[f'WL{n:05d}', f'C{n}', 'H1', n] for n in range(1, 6)])
+
+    assert list(storage.iter_records(table)) == storage.read_records(table)
+
+
+def test_iter_records_streams_the_snapshot_chunk_by_chunk(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_module, 'ITER_CHUNK_ROWS', 2)
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS)
+    storage = ExcelStorage()
+    storage.ensure_table(table)
+    storage.append_rows(table, [[f'WL{n:05d}', f'C{n}', 'H1', n] for n in range(1, 6)])
+    # Neither the whole frame nor the whole record list may be built
+    monkeypatch.setattr(storage, '_frame', None)
+    monkeypatch.setattr(storage, 'read_records', None)
+
+    records = storage.iter_records(table)
+    first = next(records)
+    # A commit replacing the snapshot doesn't disturb the open stream
+    storage.append_rows(table, [['WL00006', 'C6', 'H1', 6]])
+
+    assert [first['Wishlist ID'], *(record['Wishlist ID'] for record in records)] == [
+        'WL00001', 'WL00002', 'WL00003', 'WL00004', 'WL00005']
+    assert len(list(storage.iter_records(table))) == 6
+
+
+def _insert_in_child(table, customer):
+    storage = ExcelStorage()
+    os._exit(0 if insert(storage, table, customer, 'H1') else 1)
+
+
+def test_concurrent_writer_processes_share_one_group_commit(tmp_path, capfd):
+    fcntl = pytest.importorskip('fcntl')
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS,
+                      id_format='WL{:05d}', key_columns=KEY)
+    storage = ExcelStorage()
+    storage.ensure_table(table)
+    insert(storage, table, 'C0', 'H1')
+    writers = 4
+
+    # Hold the workbook's file lock, as another worker would, until every
+    # process has queued its insert: the first one to get it then commits
+    # all of them in one save
+    context = multiprocessing.get_context('fork')
+    with open(table.excel_path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        processes = [context.Process(target=_insert_in_child, args=(table, f'C{n}')) for n in range(1, writers + 1)]
+        for process in processes:
+            process.start()
+        deadline = time.monotonic() + 30
+        while len([name for name in os.listdir(table.excel_path + '.spool') if name.endswith('.op')]) < writers:
+            assert time.monotonic() < deadline, 'writers never queued their operations'
+            time.sleep(0.01)
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    for process in processes:
+        process.join(30)
+
+    assert [process.exitcode for process in processes] == [0] * writers
+    assert f'Group commit: {writers} operations' in capfd.readouterr().out
+    # Every ID issued once, and the index other processes load agrees
+    assert sorted(ids(storage, table)) == [f'WL{n:05d}' for n in range(1, writers + 2)]
+    assert len(ExcelStorage().find_records(table, {'Customer ID': 'C3'})) == 1
+    assert not insert(ExcelStorage(), table, 'C3', 'H1')
+
+
+def test_excel_writer_waits_for_the_file_lock_by_sleeping(tmp_path, monkeypatch):
+    fcntl = pytest.importorskip('fcntl')
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS)
+    storage = ExcelStorage()
+    storage.ensure_table(table)
+    lock_file = open(table.excel_path + '.lock', 'a')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    sleeps = []
+    test_thread, real_sleep = threading.current_thread(), time.sleep
+
+    def sleep(seconds):
+        # time.sleep is what gevent patches: the wait yields to other greenlets
+        if threading.current_thread() is not test_thread:
+            return real_sleep(seconds)  # e.g. the metrics flusher
+        sleeps.append(seconds)
+        lock_file.close()
+
+    monkeypatch.setattr(storage_module.time, 'sleep', sleep)
+
+    assert storage.append_rows(table, [['WL00001', 'C1', 'H1', 1]]) == 1
+    assert len(sleeps) == 1
+
+
+def test_sqlite_writer_waits_for_the_write_lock_by_sleeping(tmp_path, monkeypatch):
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS)
+    storage = SqliteStorage(str(tmp_path / 'test.db'))
+    storage.ensure_table(table)
+    other = sqlite3.connect(str(tmp_path / 'test.db'), isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+    sleeps = []
+    test_thread, real_sleep = threading.current_thread(), time.sleep
+
+    def sleep(seconds):
+        if threading.current_thread() is not test_thread:
+            return real_sleep(seconds)
+        sleeps.append(seconds)
+        other.execute('COMMIT')
+
+    monkeypatch.setattr(storage_module.time, 'sleep', sleep)
+
+    assert storage.append_rows(table, [['WL00001', 'C1', 'H1', 1]]) == 1
+    assert len(sleeps) == 1
+    other.close()
+    storage.close()
+
+
+def test_write_lock_wait_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage_module, 'WRITE_LOCK_TIMEOUT', 0.05)
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS)
+    storage = SqliteStorage(str(tmp_path / 'test.db'))
+    storage.ensure_table(table)
+    other = sqlite3.connect(str(tmp_path / 'test.db'), isolation_level=None)
+    other.execute('BEGIN IMMEDIATE')
+
+    with pytest.raises(TimeoutError, match='SQLite write lock'):
+        storage.append_rows(table, [['WL00001', 'C1', 'H1', 1]])
+    other.execute('ROLLBACK')
+    other.close()
+    storage.close()
+
+
+def test_import_refuses_to_duplicate_rows(tmp_path):
+    table = TableSpec('wishlist', str(tmp_path / 'wishlist.xlsx'), 'Wishlist', HEADERS,
+                      id_format='WL{:05d}', key_columns=KEY)
+    excel = ExcelStorage()
+    excel.ensure_table(table)
+    excel.append_rows(table, [['WL00001', 'C1', 'H1', 1], ['WL00002', 'C1', 'H2', 2]])
+    sqlite = SqliteStorage(str(tmp_path / 'test.db'))
+
+    assert import_excel(sqlite, table) == 2
+    with pytest.raises(ValueError, match='--replace'):
+        import_excel(sqlite, table)
+    excel.delete_first(table, {'Customer ID': 'C1', 'Hotel Code': 'H1'})
+    assert import_excel(sqlite, table, replace=True) == 1
+
+    assert ids(sqlite, table) == ['WL00002']
+    # IDs of the replaced rows stay retired
+    assert insert(sqlite, table, 'C2', 'H1')
+    assert ids(sqlite, table)[-1] == 'WL00003'
+    sqlite.close()
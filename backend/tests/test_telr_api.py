@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import telr_api
+from telr_circuit import CircuitBreaker
+
+
+@pytest.fixture
+def telr(monkeypatch):
+    """Local stand-in for the Telr gateway; append (status, delay) to telr.replies"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers['Content-Length']))
+            server.requests += 1
+            status, delay = server.replies.pop(0) if server.replies else (200, 0)
+            time.sleep(delay)
+            body = json.dumps({'order': {'ref': 'ORD1', 'status': {'code': 3}}}).encode()
+            try:
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass  # the client gave up waiting
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.requests = 0
+    server.replies = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(telr_api, 'TELR_API_URL', f'http://127.0.0.1:{server.server_port}/gateway/order.json')
+    monkeypatch.setattr(telr_api, 'telr_circuit', CircuitBreaker())
+    monkeypatch.setattr(telr_api, 'TELR_RETRY_BACKOFF', 0)
+    monkeypatch.setattr(telr_api, '_session', None)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_check_is_retried_on_5xx(telr):
+    telr.replies = [(503, 0), (502, 0)]
+
+    response = telr_api.post_to_telr({'method': 'check'}, idempotent=True)
+
+    assert response['order']['ref'] == 'ORD1'
+    assert telr.requests == 3
+
+
+def test_create_is_not_resent_after_a_response(telr):
+    telr.replies = [(503, 0)]
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        telr_api.post_to_telr({'method': 'create'})
+    assert telr.requests == 1
+
+
+def test_read_timeouts_are_not_retried(telr, monkeypatch):
+    monkeypatch.setattr(telr_api, 'TELR_READ_TIMEOUT', 0.2)
+    telr.replies = [(200, 1)]
+
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        telr_api.post_to_telr({'method': 'check'}, idempotent=True)
+    assert telr.requests == 1
+
+
+def test_call_ends_within_its_deadline(telr, monkeypatch):
+    monkeypatch.setattr(telr_api, 'TELR_CALL_DEADLINE', 0.3)
+    telr.replies = [(200, 2)]
+
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        telr_api.post_to_telr({'method': 'check'}, idempotent=True)
+    assert time.monotonic() - started < 1
+
+
+def test_deadline_stops_retrying(telr, monkeypatch):
+    monkeypatch.setattr(telr_api, 'TELR_CALL_DEADLINE', 0.5)
+    monkeypatch.setattr(telr_api, 'TELR_CHECK_RETRIES', 100)
+    monkeypatch.setattr(telr_api, 'TELR_RETRY_BACKOFF', 0.05)
+    telr.replies = [(503, 0)] * 100
+
+    started = time.monotonic()
+    with pytest.raises(requests.exceptions.HTTPError):
+        telr_api.post_to_telr({'method': 'check'}, idempotent=True)
+    assert time.monotonic() - started < 1
+    assert telr.requests < 10
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from telr_circuit import CircuitBreaker, CircuitOpenError, OPEN
+
+
+def hold_slots(breaker, count):
+    """Occupy count bulkhead slots until the returned event is set"""
+    release = threading.Event()
+    entered = threading.Barrier(count + 1)
+
+    def hold():
+        entered.wait()
+        release.wait()
+
+    threads = [threading.Thread(target=breaker.call, args=(hold,)) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    entered.wait()
+    return release, threads
+
+
+def test_bulkhead_queues_callers_until_a_slot_frees():
+    breaker = CircuitBreaker(max_in_flight=2, max_wait=5)
+    release, threads = hold_slots(breaker, 2)
+    threading.Timer(0.1, release.set).start()
+
+    started = time.monotonic()
+    assert breaker.call(lambda: 'ok') == 'ok'
+    assert 0.05 < time.monotonic() - started < 5
+    for thread in threads:
+        thread.join()
+
+
+def test_bulkhead_rejects_after_bounded_wait():
+    breaker = CircuitBreaker(max_in_flight=1, max_wait=5)
+    release, threads = hold_slots(breaker, 1)
+    try:
+        started = time.monotonic()
+        with pytest.raises(CircuitOpenError, match='in flight'):
+            breaker.call(lambda: 'ok', deadline=time.monotonic() + 0.1)
+        # The caller's deadline is shorter than max_wait, and wins
+        assert time.monotonic() - started < 1
+    finally:
+        release.set()
+        for thread in threads:
+            thread.join()
+
+
+def test_open_circuit_fails_fast_without_queueing():
+    breaker = CircuitBreaker(max_in_flight=1, max_wait=5, open_seconds=30)
+    breaker.state = OPEN
+    breaker.opened_at = time.monotonic()
+
+    started = time.monotonic()
+    with pytest.raises(CircuitOpenError, match='open'):
+        breaker.call(lambda: 'ok')
+    assert time.monotonic() - started < 0.5
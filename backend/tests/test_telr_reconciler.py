@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+import telr_api
+import telr_reconciler
+from payment_ledger import PaymentLedger, PENDING, PAID, FAILED
+from telr_circuit import telr_circuit
+from telr_status_cache import TelrStatusCache
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    ledger = PaymentLedger(str(tmp_path / 'payments.db'))
+    monkeypatch.setattr(telr_reconciler, 'ledger', ledger)
+    monkeypatch.setattr(telr_reconciler, 'status_cache', TelrStatusCache())
+    return ledger
+
+
+def telr_order(order_ref, code):
+    return {'order': {'ref': order_ref, 'status': {'code': code}}}
+
+
+def reconcile(concurrency=1):
+    return telr_reconciler.reconcile(min_age=0, concurrency=concurrency, rate=0)
+
+
+def test_settled_counts_only_applied_transitions(ledger, monkeypatch):
+    ledger.record_order('CART1', 'ORD1')
+    ledger.record_order('CART2', 'ORD2')
+    ledger.record_order('CART3', 'ORD3')
+
+    def check(order_ref):
+        if order_ref == 'ORD2':
+            # A webhook settles CART2 while its check is in flight
+            ledger.transition('CART2', FAILED, {'source': 'webhook'})
+        return telr_order(order_ref, 1 if order_ref == 'ORD3' else 3)
+
+    monkeypatch.setattr(telr_api, 'fetch_telr_status', check)
+
+    stats = reconcile()
+
+    assert stats == {'checked': 3, 'settled': 1, 'still_pending': 1, 'errors': 0}
+    assert ledger.get_by_cart('CART1')['status'] == PAID
+    assert ledger.get_by_cart('CART2')['status'] == FAILED
+    assert ledger.get_by_cart('CART3')['status'] == PENDING
+
+
+def test_concurrency_capped_at_bulkhead(ledger, monkeypatch):
+    for n in range(8):
+        ledger.record_order(f'CART{n}', f'ORD{n}')
+    monkeypatch.setattr(telr_circuit, 'max_in_flight', 2)
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def check(order_ref):
+        with lock:
+            in_flight.append(order_ref)
+            peak.append(len(in_flight))
+        time.sleep(0.02)
+        with lock:
+            in_flight.remove(order_ref)
+        return telr_order(order_ref, 3)
+
+    monkeypatch.setattr(telr_api, 'fetch_telr_status', check)
+
+    stats = reconcile(concurrency=8)
+
+    assert max(peak) <= 2
+    assert stats['settled'] == 8
@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+import telr_status_cache
+from telr_status_cache import TelrStatusCache
+
+
+def response(code):
+    return {'order': {'ref': 'O1', 'status': {'code': str(code)}}}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(telr_status_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_pending_responses_expire_and_terminal_ones_do_not(clock):
+    cache = TelrStatusCache(ttl=5)
+    cache.store('pending', response(1))
+    cache.store('paid', response(3))
+
+    clock[0] += 6
+
+    assert cache.get('pending') is None
+    assert cache.get('paid') == response(3)
+
+
+def test_terminal_status_is_not_replaced_by_a_pending_one(clock):
+    cache = TelrStatusCache(ttl=5)
+    cache.store('O1', response(3))
+    cache.store('O1', response(1))
+
+    assert cache.get('O1') == response(3)
+    cache.invalidate('O1')
+    assert cache.get('O1') is None
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TelrStatusCache(max_size=2)
+    cache.store('O1', response(3))
+    cache.store('O2', response(3))
+    cache.get('O1')
+    cache.store('O3', response(3))
+
+    assert cache.get('O2') is None
+    assert cache.get('O1') == response(3)
+
+
+def test_concurrent_misses_share_one_fetch():
+    cache = TelrStatusCache()
+    release = threading.Event()
+    calls = []
+
+    def fetch(order_ref):
+        calls.append(order_ref)
+        release.wait(5)
+        return response(3)
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_fetch('O1', fetch)))
+    leader.start()
+    while not calls:
+        pass
+    followers = [threading.Thread(target=lambda: results.append(cache.get_or_fetch('O1', fetch)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert calls == ['O1']
+    assert sorted(from_cache for _, from_cache in results) == [False, True, True, True]
+    assert all(result == response(3) for result, _ in results)
+
+
+def test_fetch_errors_are_not_cached():
+    cache = TelrStatusCache()
+
+    def fail(order_ref):
+        raise ConnectionError('down')
+
+    with pytest.raises(ConnectionError):
+        cache.get_or_fetch('O1', fail)
+    assert cache.get_or_fetch('O1', lambda ref: response(1)) == (response(1), False)
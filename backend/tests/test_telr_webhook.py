@@ -0,0 +1,101 @@
+import hashlib
+import hmac
+import json
+
+import pytest
+
+import telr_api
+import telr_webhook
+from payment_ledger import PaymentLedger, PENDING, PAID
+from telr_status_cache import TelrStatusCache
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    ledger = PaymentLedger(str(tmp_path / 'payments.db'))
+    monkeypatch.setattr(telr_webhook, 'ledger', ledger)
+    monkeypatch.setattr(telr_api, 'ledger', ledger)
+    return ledger
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = TelrStatusCache()
+    monkeypatch.setattr(telr_webhook, 'status_cache', cache)
+    return cache
+
+
+@pytest.fixture
+def telr(monkeypatch):
+    """Stand-in for Telr's 'check' call; set telr.code to the status Telr reports"""
+    class Telr:
+        code = 1
+        checks = []
+
+        def check(self, order_ref):
+            self.checks.append(order_ref)
+            return {'order': {'ref': order_ref, 'cartid': 'CART1', 'status': {'code': self.code}}}
+
+    telr = Telr()
+    monkeypatch.setattr(telr_api, 'fetch_telr_status', telr.check)
+    return telr
+
+
+def webhook(code, order_ref='ORD1', cart_id='CART1'):
+    return {'order': {'ref': order_ref, 'cartid': cart_id, 'status': {'code': code, 'text': 'Paid'}}}
+
+
+def test_unverified_webhook_does_not_settle_pending_payment(ledger, cache, telr):
+    ledger.record_order('CART1', 'ORD1')
+
+    telr_webhook.process_webhook_event(webhook(3))
+
+    assert telr.checks == ['ORD1']
+    assert ledger.get_by_cart('CART1')['status'] == PENDING
+    assert cache.get('ORD1')['order']['status']['code'] == 1
+
+
+def test_unverified_webhook_settles_from_telr(ledger, cache, telr):
+    ledger.record_order('CART1', 'ORD1')
+    telr.code = 3
+
+    telr_webhook.process_webhook_event(webhook(3))
+
+    assert ledger.get_by_cart('CART1')['status'] == PAID
+
+
+def test_unverified_webhook_drops_cached_status(ledger, cache, telr):
+    ledger.record_order('CART1', 'ORD1')
+    cache.store('ORD1', {'order': {'status': {'code': 1}}})
+
+    telr_webhook.process_webhook_event(webhook(1))
+
+    assert cache.get('ORD1') is None
+    assert telr.checks == []
+
+
+@pytest.mark.parametrize('code', [3, '3'])
+def test_verified_webhook_settles_payment(ledger, cache, telr, code):
+    ledger.record_order('CART1', 'ORD1')
+
+    telr_webhook.process_webhook_event(webhook(code), verified=True)
+
+    assert ledger.get_by_cart('CART1')['status'] == PAID
+    assert telr.checks == []
+
+
+def test_verified_webhook_for_unknown_cart_creates_nothing(ledger, cache, telr):
+    telr_webhook.process_webhook_event(webhook(3), verified=True)
+
+    assert ledger.get_by_cart('CART1') is None
+
+
+def test_validate_webhook_signature():
+    body = json.dumps(webhook(3))
+    signature = hmac.new(b'secret', body.encode(), hashlib.sha256).hexdigest()
+
+    assert telr_webhook.validate_webhook_signature(body, signature, 'secret')
+    assert not telr_webhook.validate_webhook_signature(body, signature, 'other')
+    assert not telr_webhook.validate_webhook_signature(body + ' ', signature, 'secret')
+    assert not telr_webhook.validate_webhook_signature(body, None, 'secret')
+    assert not telr_webhook.validate_webhook_signature(body, signature, '')
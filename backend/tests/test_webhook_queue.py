@@ -0,0 +1,113 @@
+import json
+import time
+
+import pytest
+
+import webhook_queue
+from webhook_queue import WebhookConsumer, WebhookJournal, dedupe_key
+
+
+def delivery(order_ref='ORD1', code=3):
+    return {'order': {'ref': order_ref, 'transaction': {'ref': 'TX1'}, 'status': {'code': code}}}
+
+
+@pytest.fixture
+def journal_path(tmp_path):
+    return str(tmp_path / 'webhooks.db')
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_duplicate_delivery_is_journaled_once(journal_path):
+    journal = WebhookJournal(journal_path)
+    payload = delivery()
+    key = dedupe_key(payload)
+
+    event_id, duplicate = journal.append_unique(key, json.dumps(payload), verified=True)
+    assert not duplicate
+
+    # Telr retries: answered from this worker's memory...
+    assert journal.append_unique(key, json.dumps(payload), verified=True) == (None, True)
+    # ...and from the journal by any other worker
+    assert WebhookJournal(journal_path).append_unique(key, json.dumps(payload), verified=True) == (event_id, True)
+
+    assert journal.counts() == {'pending': 1}
+    [event] = journal.claim()
+    assert event.id == event_id and event.verified and json.loads(event.payload) == payload
+
+
+def test_dedupe_key_ignores_how_the_status_code_is_sent():
+    assert dedupe_key(delivery(code=3)) == dedupe_key(delivery(code='3')) == dedupe_key(delivery(code=' 3 '))
+    assert dedupe_key(delivery(code=3)) != dedupe_key(delivery(code=2))
+
+
+def test_unverified_delivery_does_not_shadow_signed_one(journal_path):
+    journal = WebhookJournal(journal_path)
+    payload = json.dumps(delivery())
+
+    _, forged_duplicate = journal.append_unique(dedupe_key(delivery(), verified=False), payload)
+    _, signed_duplicate = journal.append_unique(dedupe_key(delivery()), payload, verified=True)
+
+    assert not forged_duplicate and not signed_duplicate
+    assert [event.verified for event in journal.claim()] == [False, True]
+
+
+def test_failing_handler_ends_in_dead_letters(journal_path, monkeypatch):
+    monkeypatch.setattr(webhook_queue, 'RETRY_BASE_DELAY', 0)
+    monkeypatch.setattr(webhook_queue, 'WEBHOOK_MAX_ATTEMPTS', 3)
+    journal = WebhookJournal(journal_path)
+    event_id = journal.append(json.dumps(delivery()))
+
+    def handler(event):
+        raise RuntimeError('ledger unavailable')
+
+    consumer = WebhookConsumer(journal, handler)
+    for _ in range(3):
+        [event] = journal.claim()
+        consumer._process(event)
+
+    assert journal.claim() == []
+    assert journal.counts() == {'dead': 1}
+    [dead] = journal.dead_letters()
+    assert dead['id'] == event_id
+    assert dead['attempts'] == 3
+    assert dead['last_error'] == 'ledger unavailable'
+
+    assert journal.requeue(event_id)
+    assert [event.id for event in journal.claim()] == [event_id]
+
+
+def test_unprocessed_events_are_recovered_after_restart(journal_path, monkeypatch):
+    journal = WebhookJournal(journal_path)
+    claimed_id = journal.append(json.dumps(delivery('ORD1')))
+    pending_id = journal.append(json.dumps(delivery('ORD2')))
+    # The worker dies after claiming the first event, before completing it
+    assert [event.id for event in journal.claim(limit=1)] == [claimed_id]
+
+    monkeypatch.setattr(webhook_queue, 'WEBHOOK_CLAIM_TIMEOUT', 0)
+    time.sleep(0.01)
+    processed = []
+    consumer = WebhookConsumer(WebhookJournal(journal_path), processed.append, poll_interval=0.05)
+    consumer.start()
+
+    wait_for(lambda: journal.counts() == {'done': 2})
+    assert sorted(event.id for event in processed) == [claimed_id, pending_id]
+
+
+def test_consumer_thread_processes_new_events(journal_path):
+    journal = WebhookJournal(journal_path)
+    processed = []
+    consumer = WebhookConsumer(journal, processed.append, poll_interval=0.05)
+    consumer.start()
+
+    event_id = journal.append(json.dumps(delivery()), verified=True)
+    consumer.wake.set()
+
+    wait_for(lambda: journal.counts() == {'done': 1})
+    [event] = processed
+    assert event.id == event_id and event.verified and event.attempts == 0
@@ -0,0 +1,367 @@
+"""
+Durable journal and background consumer for Telr webhooks
+
+The webhook endpoint appends the raw payload to an SQLite journal and
+acknowledges immediately. A consumer thread in each worker claims
+pending events, processes them and retries failures with exponential
+backoff. After WEBHOOK_MAX_ATTEMPTS failures an event is parked with
+status 'dead' (the dead-letter store) for manual review; requeue() puts
+it back in line.
+
+Telr retries deliveries, so events are deduplicated on
+(order_ref, transaction_ref, status_code). append_unique() records the key
+in the same transaction as the event, so across all workers a delivery is
+journaled - and therefore processed - once. Keys expire after
+WEBHOOK_DEDUPE_TTL; a bounded per-worker LRU answers repeat deliveries
+without touching the database.
+
+Each event records whether its signature was verified on receipt (the
+signature header isn't journaled), so the handler can tell a signed
+delivery from an unauthenticated one.
+
+Claims are made inside an IMMEDIATE transaction, so with several
+Gunicorn workers polling the same journal each event is handed to one
+consumer at a time. Claims older than WEBHOOK_CLAIM_TIMEOUT (a worker
+died mid-event) are released back to pending.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_JOURNAL_PATH = os.getenv('WEBHOOK_JOURNAL_PATH', 'telr_webhooks.db')
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', '8'))
+WEBHOOK_POLL_INTERVAL = float(os.getenv('WEBHOOK_POLL_INTERVAL', '2'))
+WEBHOOK_CLAIM_TIMEOUT = float(os.getenv('WEBHOOK_CLAIM_TIMEOUT', '300'))
+WEBHOOK_RETENTION_DAYS = float(os.getenv('WEBHOOK_RETENTION_DAYS', '30'))
+WEBHOOK_DEDUPE_TTL = float(os.getenv('WEBHOOK_DEDUPE_TTL', str(7 * 86400)))
+WEBHOOK_DEDUPE_CACHE_SIZE = int(os.getenv('WEBHOOK_DEDUPE_CACHE_SIZE', '10000'))
+WEBHOOK_BATCH_SIZE = 50
+
+# Retry delays: 2s, 4s, 8s ... capped at 10 minutes
+RETRY_BASE_DELAY = 2
+RETRY_MAX_DELAY = 600
+
+
+def dedupe_key(payload, verified=True):
+    """
+    Identity of a webhook delivery: (order ref, transaction ref, status code)
+
+    Unverified deliveries get keys of their own, so a forged delivery can't
+    cause the signed one that follows it to be dropped as a duplicate.
+    Returns None if the payload has no order ref, in which case it can't
+    be deduplicated.
+    """
+    order = payload.get('order') or {}
+    order_ref = order.get('ref')
+    if not order_ref:
+        return None
+    transaction_ref = (order.get('transaction') or {}).get('ref') or ''
+    status_code = (order.get('status') or {}).get('code')
+    # Telr may send the code as a number or a string: 3 and "3" are the
+    # same delivery. Parsed like status_from_telr_code does.
+    try:
+        status_code = str(int(status_code))
+    except (TypeError, ValueError):
+        status_code = '' if status_code is None else str(status_code).strip()
+    key = f'{order_ref}|{transaction_ref}|{status_code}'
+    return key if verified else 'unverified|' + key
+
+
+class SeenKeys:
+    """Bounded LRU of recently seen dedupe keys, with expiry"""
+
+    def __init__(self, max_size=WEBHOOK_DEDUPE_CACHE_SIZE, ttl=WEBHOOK_DEDUPE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._keys = OrderedDict()  # key -> first seen (epoch seconds)
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            first_seen = self._keys.get(key)
+            if first_seen is None:
+                return False
+            if first_seen < time.time() - self.ttl:
+                del self._keys[key]
+                return False
+            self._keys.move_to_end(key)
+            return True
+
+    def add(self, key, first_seen=None):
+        with self._lock:
+            self._keys[key] = first_seen or time.time()
+            self._keys.move_to_end(key)
+            while len(self._keys) > self.max_size:
+                self._keys.popitem(last=False)
+
+
+class WebhookEvent:
+    """One journaled webhook delivery"""
+
+    def __init__(self, event_id, payload, attempts, verified=False):
+        self.id = event_id
+        self.payload = payload
+        self.attempts = attempts
+        self.verified = bool(verified)
+
+
+class WebhookJournal:
+    """Append-only SQLite journal of webhook deliveries"""
+
+    def __init__(self, db_path=WEBHOOK_JOURNAL_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.seen = SeenKeys()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Payment events must survive a power loss once acknowledged
+            conn.execute('PRAGMA synchronous=FULL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS webhook_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    received_at REAL NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    claimed_at REAL,
+                    processed_at REAL,
+                    last_error TEXT,
+                    verified INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(webhook_events)')}
+            if 'verified' not in columns:
+                # Journals created before signatures were checked
+                conn.execute('ALTER TABLE webhook_events ADD COLUMN verified INTEGER NOT NULL DEFAULT 0')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_webhook_events_due '
+                'ON webhook_events (status, next_attempt_at)'
+            )
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS webhook_dedupe (
+                    key TEXT PRIMARY KEY,
+                    first_seen REAL NOT NULL,
+                    event_id INTEGER
+                )
+            ''')
+            conn.execute(
+                'CREATE INDEX IF NOT EXISTS idx_webhook_dedupe_seen ON webhook_dedupe (first_seen)'
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def append(self, payload, verified=False):
+        """Durably store a raw payload (str) and return its event id"""
+        now = time.time()
+        cursor = self._connect().execute(
+            'INSERT INTO webhook_events (received_at, payload, next_attempt_at, verified) VALUES (?, ?, ?, ?)',
+            (now, payload, now, int(verified))
+        )
+        return cursor.lastrowid
+
+    def append_unique(self, key, payload, verified=False):
+        """
+        Journal payload unless key was already seen within WEBHOOK_DEDUPE_TTL
+
+        Returns (event_id, duplicate). For duplicates event_id is the id of
+        the originally journaled event (None if answered from memory).
+        """
+        if key is None:
+            return self.append(payload, verified), False
+        if key in self.seen:
+            return None, True
+
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                'SELECT first_seen, event_id FROM webhook_dedupe WHERE key = ?', (key,)
+            ).fetchone()
+            if row is not None and row[0] >= now - WEBHOOK_DEDUPE_TTL:
+                self.seen.add(key, row[0])
+                return row[1], True
+
+            event_id = conn.execute(
+                'INSERT INTO webhook_events (received_at, payload, next_attempt_at, verified) '
+                'VALUES (?, ?, ?, ?)',
+                (now, payload, now, int(verified))
+            ).lastrowid
+            conn.execute(
+                'INSERT OR REPLACE INTO webhook_dedupe (key, first_seen, event_id) VALUES (?, ?, ?)',
+                (key, now, event_id)
+            )
+        self.seen.add(key, now)
+        return event_id, False
+
+    def claim(self, limit=WEBHOOK_BATCH_SIZE):
+        """Claim up to limit due events for this process"""
+        now = time.time()
+        owner = f'{os.getpid()}:{threading.get_ident()}'
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            # Release claims whose worker never finished them
+            conn.execute(
+                "UPDATE webhook_events SET status = 'pending', claimed_by = NULL "
+                "WHERE status = 'processing' AND claimed_at < ?",
+                (now - WEBHOOK_CLAIM_TIMEOUT,)
+            )
+            rows = conn.execute(
+                "SELECT id, payload, attempts, verified FROM webhook_events "
+                "WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY id LIMIT ?",
+                (now, limit)
+            ).fetchall()
+            if rows:
+                conn.executemany(
+                    "UPDATE webhook_events SET status = 'processing', claimed_by = ?, claimed_at = ? "
+                    "WHERE id = ?",
+                    [(owner, now, row[0]) for row in rows]
+                )
+        return [WebhookEvent(*row) for row in rows]
+
+    def complete(self, event_id):
+        self._connect().execute(
+            "UPDATE webhook_events SET status = 'done', processed_at = ?, attempts = attempts + 1, "
+            "last_error = NULL WHERE id = ?",
+            (time.time(), event_id)
+        )
+
+    def fail(self, event_id, error):
+        """Schedule a retry with backoff, or dead-letter the event"""
+        conn = self._connect()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute('SELECT attempts FROM webhook_events WHERE id = ?', (event_id,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            if attempts >= WEBHOOK_MAX_ATTEMPTS:
+                conn.execute(
+                    "UPDATE webhook_events SET status = 'dead', attempts = ?, last_error = ?, "
+                    "claimed_by = NULL WHERE id = ?",
+                    (attempts, error, event_id)
+                )
+                return 'dead'
+            delay = min(RETRY_BASE_DELAY * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+            conn.execute(
+                "UPDATE webhook_events SET status = 'pending', attempts = ?, last_error = ?, "
+                "next_attempt_at = ?, claimed_by = NULL WHERE id = ?",
+                (attempts, error, time.time() + delay, event_id)
+            )
+            return 'retry'
+
+    def dead_letters(self, limit=100):
+        """Most recent dead-lettered events, for manual review"""
+        rows = self._connect().execute(
+            "SELECT id, received_at, attempts, last_error, payload FROM webhook_events "
+            "WHERE status = 'dead' ORDER BY id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+        columns = ('id', 'received_at', 'attempts', 'last_error', 'payload')
+        return [dict(zip(columns, row)) for row in rows]
+
+    def requeue(self, event_id):
+        """Move a dead-lettered event back to pending; return True if it was dead"""
+        cursor = self._connect().execute(
+            "UPDATE webhook_events SET status = 'pending', attempts = 0, next_attempt_at = ? "
+            "WHERE id = ? AND status = 'dead'",
+            (time.time(), event_id)
+        )
+        return cursor.rowcount > 0
+
+    def purge(self, older_than_days=WEBHOOK_RETENTION_DAYS):
+        """Delete processed events and expired dedupe keys"""
+        conn = self._connect()
+        conn.execute(
+            'DELETE FROM webhook_dedupe WHERE first_seen < ?',
+            (time.time() - WEBHOOK_DEDUPE_TTL,)
+        )
+        cursor = conn.execute(
+            "DELETE FROM webhook_events WHERE status = 'done' AND processed_at < ?",
+            (time.time() - older_than_days * 86400,)
+        )
+        return cursor.rowcount
+
+    def counts(self):
+        """Number of events per status"""
+        rows = self._connect().execute(
+            'SELECT status, COUNT(*) FROM webhook_events GROUP BY status'
+        ).fetchall()
+        return dict(rows)
+
+
+class WebhookConsumer(threading.Thread):
+    """Background thread that processes journaled events with handler(event)"""
+
+    def __init__(self, journal, handler, poll_interval=WEBHOOK_POLL_INTERVAL):
+        super().__init__(name='telr-webhook-consumer', daemon=True)
+        self.journal = journal
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.wake = threading.Event()
+        self._last_purge = 0
+
+    def run(self):
+        while True:
+            try:
+                events = self.journal.claim()
+                for event in events:
+                    self._process(event)
+                self._maybe_purge()
+            except Exception as e:
+                logger.error("💥 Webhook consumer error: %s", e)
+                events = []
+
+            if not events:
+                self.wake.wait(self.poll_interval)
+                self.wake.clear()
+
+    def _process(self, event):
+        try:
+            self.handler(event)
+            self.journal.complete(event.id)
+        except Exception as e:
+            outcome = self.journal.fail(event.id, str(e))
+            if outcome == 'dead':
+                logger.error("☠️ Webhook event %s dead-lettered after %d attempts: %s", event.id, event.attempts + 1, e)
+            else:
+                logger.warning("🔁 Webhook event %s failed, will retry: %s", event.id, e)
+
+    def _maybe_purge(self):
+        if time.time() - self._last_purge > 3600:
+            self._last_purge = time.time()
+            purged = self.journal.purge()
+            if purged:
+                logger.info("🧹 Purged %d processed webhook events", purged)
+
+
+journal = WebhookJournal()
+
+_consumer = None
+_consumer_pid = None
+_consumer_lock = threading.Lock()
+
+
+def ensure_consumer(handler):
+    """Start this process's consumer thread if it isn't running; return it"""
+    global _consumer, _consumer_pid
+    if _consumer is not None and _consumer_pid == os.getpid():
+        return _consumer
+    with _consumer_lock:
+        if _consumer is None or _consumer_pid != os.getpid():
+            _consumer = WebhookConsumer(journal, handler)
+            _consumer_pid = os.getpid()
+            _consumer.start()
+        return _consumer